@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Driver hot path benchmark
+
+Times register encode/decode and property access in the device drivers
+against an in-memory loopback master, so only interpreter overhead is
+measured.  Run it under each interpreter of interest and compare:
+
+    $ python2.7 benchmarks/hotpaths.py --json py27.json
+    $ python3.13 benchmarks/hotpaths.py --json py313.json
+    $ python3 benchmarks/hotpaths.py --compare py27.json py313.json
+
+Run it from the checkout; the bustools package is imported from there.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from array import array
+
+# import the bustools package of this checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bustools.devices.ina219 as ina219
+import bustools.devices.lm75 as lm75
+import bustools.devices.pca95xx as pca95xx
+
+class LoopbackMaster(object):
+    """I2C master that accepts all writes and answers all reads with fixed data."""
+
+    def __init__(self, data=(0x12, 0x34)):
+        self._data = array('B', data)
+
+    def i2c_write(self, address, data):
+        pass
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        return self._data[:num_bytes]
+
+def _benchmarks():
+    """Return a list of (name, callable) pairs to time."""
+    master = LoopbackMaster()
+    ina = ina219.INA219(master, 0x40, configuration=0x399F, shunt_resistance=0.1, max_expected_current=2.0)
+    sensor = lm75.LM75(master, 0x48)
+    expander = pca95xx.PCA9554(master, 0x38)
+    pin = expander.ports[0].pins[0]
+    return [
+        ("ina219 current()", ina.current),
+        ("ina219 reader('current')", ina.reader('current')),
+        ("ina219 bus_voltage()", ina.bus_voltage),
+        ("ina219 _read_register (decode)", lambda: ina._read_register(ina219._CURRENT_REGISTER)),
+        ("ina219 _write_register (encode)", lambda: ina._write_register(ina219._CALIBRATION_REGISTER, 0x1000)),
+        ("ina219 _current_register_lsb", lambda: ina._current_register_lsb),
+        ("lm75 temperature()", sensor.temperature),
+        ("lm75 reader('temperature')", sensor.reader()),
+        ("lm75 _write_register (encode)", lambda: sensor._write_register(lm75._HYSTERESIS_REGISTER, 0x4B00)),
+        ("pca95xx GPIO.input", lambda: pin.input),
+        ("pca95xx GPIO.reader()", pin.reader()),
+        ("pca95xx GPIO.output = HIGH", lambda: setattr(pin, 'output', pca95xx.HIGH)),
+    ]
+
+def run(number, repeat):
+    """Return a results dictionary with the best time per call (ns) of each benchmark."""
+    results = {
+        "interpreter": "%s %s" % (platform.python_implementation(), platform.python_version()),
+        "timings": []
+    }
+    for name, function in _benchmarks():
+        best = min(timeit.repeat(function, number=number, repeat=repeat))
+        results["timings"].append([name, 1e9 * best / number])
+    return results
+
+def print_comparison(results):
+    """Print a table of results, with speedup relative to the first set of results."""
+    names = [name for name, _ in results[0]["timings"]]
+    columns = [dict(r["timings"]) for r in results]
+    header = "%-34s" % "ns/call" + "".join("%22s" % r["interpreter"] for r in results)
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        baseline = columns[0][name]
+        cells = []
+        for column in columns:
+            if name in column:
+                cells.append("%12.0f (%5.2fx)" % (column[name], baseline / column[name]))
+            else:
+                cells.append("%22s" % "-")
+        print("%-34s" % name + "".join("%22s" % cell for cell in cells))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark bustools driver hot paths")
+    parser.add_argument("--number", type=int, default=100000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark (best is kept)")
+    parser.add_argument("--json", metavar="FILE", help="also save results to FILE")
+    parser.add_argument("--compare", metavar="FILE", nargs="+", help="compare saved results instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        results = []
+        for path in args.compare:
+            with open(path) as f:
+                results.append(json.load(f))
+    else:
+        results = [run(args.number, args.repeat)]
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results[0], f, indent=2)
+    print_comparison(results)
+
+if __name__ == "__main__":
+    sys.exit(main())
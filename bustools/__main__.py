@@ -2,3 +2,9 @@
 
 # when the package is executed as a script using -m or invoked by
 # runpy.run_module(modulename), this file is run
+
+import sys
+
+from bustools.daemon import main
+
+sys.exit(main())
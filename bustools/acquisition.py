@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+"""Synchronized multi-adapter acquisition
+
+Reads channels on several masters (e.g. one Aardvark per board) in
+parallel, one worker thread per bus, and aligns the readings in frames.
+For each frame all workers are released at the same instant, and each read
+is bracketed by timestamps from one monotonic high resolution clock
+(time.perf_counter() where available), so every sample carries the
+interval in which its device was actually read.  A sample's timestamp is
+the middle of that interval and its uncertainty is half its length.
+
+    acquisition = Acquisition([
+        Channel("board1/current", aardvark1, ina1.reader('current')),
+        Channel("board2/current", aardvark2, ina2.reader('current'))
+    ])
+    with acquisition:
+        for frame in acquisition.frames(period=0.01, count=1000):
+            print(frame.time, frame.skew, frame.values())
+
+Channels on the same bus are read one after the other, in channel order;
+channels on different buses are read concurrently.  Masters wrapping
+another master (e.g. a RetryMaster, or the channels of a PCA954x
+multiplexer) are on the bus of the master they wrap (see
+bustools.adapters.root_master()).
+
+Python 2 has no monotonic clock in its standard library: on Linux
+clock_gettime(CLOCK_MONOTONIC) is called through ctypes instead, and
+elsewhere time.time() is used, which steps when the system time is set
+(see MONOTONIC).
+"""
+
+import ctypes
+import ctypes.util
+import sys
+import threading
+import time
+
+import bustools.adapters as adapters
+
+def _clock_gettime_monotonic():
+    """Return a function reading CLOCK_MONOTONIC in seconds through ctypes, or None if unavailable."""
+    if not sys.platform.startswith('linux'):
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    # clock_gettime() is in librt before glibc 2.17
+    for library in ('c', 'rt'):
+        path = ctypes.util.find_library(library)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        clock_gettime.restype = ctypes.c_int
+        CLOCK_MONOTONIC = 1
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, "clock_gettime failed")
+            return t.tv_sec + t.tv_nsec * 1e-9
+        return monotonic
+    return None
+
+# time.perf_counter() is only available in Python 3
+_clock = getattr(time, 'perf_counter', None) or _clock_gettime_monotonic()
+
+# True if sample timestamps come from a monotonic clock
+MONOTONIC = _clock is not None
+if _clock is None:
+    _clock = time.time
+
+class AcquisitionError(Exception):
+    pass
+
+class Channel(object):
+    """A quantity read by calling read() (a function of no arguments, e.g. INA219.reader('current')), which uses master."""
+
+    def __init__(self, name, master, read):
+        self.name = name
+        self.master = master
+        self.read = read
+
+class Sample(object):
+    """Reading of a channel: its value and the clock times the read started and ended."""
+
+    def __init__(self, name, value, start, end):
+        self.name = name
+        self.value = value
+        self.start = start
+        self.end = end
+
+    @property
+    def timestamp(self):
+        """Clock time of the reading: the middle of the read."""
+        return (self.start + self.end) / 2.0
+
+    @property
+    def uncertainty(self):
+        """Largest difference in seconds between timestamp and the actual sampling instant: half the duration of the read."""
+        return (self.end - self.start) / 2.0
+
+class Frame(object):
+    """Samples of all channels read for one release, in channel order.
+
+    Timestamps are clock times (see time.perf_counter(), and MONOTONIC for Python 2); epoch is the offset converting them to wall clock time (see time.time()).
+    """
+
+    def __init__(self, index, release, samples, epoch):
+        self.index = index
+        # clock time the reads were released at
+        self.release = release
+        self.samples = samples
+        self.epoch = epoch
+
+    @property
+    def time(self):
+        """Wall clock time of the release."""
+        return self.release + self.epoch
+
+    @property
+    def skew(self):
+        """Spread in seconds of the sample timestamps."""
+        timestamps = [sample.timestamp for sample in self.samples]
+        return max(timestamps) - min(timestamps)
+
+    def values(self):
+        return [sample.value for sample in self.samples]
+
+    def wall_time(self, timestamp):
+        """Return the wall clock time of a clock timestamp."""
+        return timestamp + self.epoch
+
+def _wait(until, spin):
+    """Sleep until spin seconds before the clock time until, then busy-wait."""
+    while True:
+        remaining = until - _clock()
+        if remaining <= 0:
+            return
+        if remaining > spin:
+            time.sleep(remaining - spin)
+
+class Acquisition(object):
+    """Read channels on several buses concurrently and return them as aligned frames.
+
+    Waits shorter than spin seconds are busy-waited, so workers start within microseconds of the release time rather than at the operating system's sleep resolution.  Acquisition implements the context management protocol: worker threads run between open() and close().
+    """
+
+    def __init__(self, channels, spin=0.0002):
+        self.channels = list(channels)
+        if not self.channels:
+            raise AcquisitionError("no channels")
+        names = [channel.name for channel in self.channels]
+        for name in names:
+            if names.count(name) > 1:
+                raise AcquisitionError("duplicate channel name: %s" % name)
+        self.spin = spin
+        # (root master, [(channel index, channel)]) of each bus, in channel
+        # order
+        self._groups = []
+        for index, channel in enumerate(self.channels):
+            bus = adapters.root_master(channel.master)
+            for master, members in self._groups:
+                if master is bus:
+                    members.append((index, channel))
+                    break
+            else:
+                self._groups.append((bus, [(index, channel)]))
+        # frames read
+        self.count = 0
+        # releases skipped by frames() because a frame took longer than the period
+        self.skipped = 0
+        # time.time() - clock time, set by open()
+        self.epoch = None
+        self._condition = threading.Condition()
+        self._running = False
+        self._threads = []
+        # current release: incremented to release the workers
+        self._generation = 0
+        self._release = None
+        # workers still reading the current release
+        self._pending = 0
+        self._samples = None
+        self._error = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def open(self):
+        """Start a worker thread per bus."""
+        if self._running:
+            return
+        self.epoch = time.time() - _clock()
+        self._running = True
+        self._threads = [threading.Thread(target=self._work, args=(members, self._generation)) for master, members in self._groups]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        """Stop the worker threads."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self, members, generation):
+        while True:
+            with self._condition:
+                while self._running and self._generation == generation:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation = self._generation
+                release = self._release
+            _wait(release, self.spin)
+            samples = []
+            error = None
+            for index, channel in members:
+                start = _clock()
+                try:
+                    value = channel.read()
+                except Exception as e:
+                    error = e
+                    break
+                samples.append((index, Sample(channel.name, value, start, _clock())))
+            with self._condition:
+                for index, sample in samples:
+                    self._samples[index] = sample
+                if error is not None and self._error is None:
+                    self._error = error
+                self._pending -= 1
+                if not self._pending:
+                    self._condition.notify_all()
+
+    def read(self, release=None):
+        """Read every channel once, concurrently on all buses, and return a Frame.
+
+        release is the clock time to start the reads at, by default now.  An exception raised by a channel's read is raised again once all buses are done.
+        """
+        if not self._running:
+            raise AcquisitionError("acquisition is not open")
+        with self._condition:
+            self._samples = [None] * len(self.channels)
+            self._error = None
+            self._pending = len(self._groups)
+            self._release = _clock() if release is None else release
+            self._generation += 1
+            self._condition.notify_all()
+            while self._pending:
+                # wait with a timeout so KeyboardInterrupt is delivered
+                self._condition.wait(0.1)
+            release, samples, error = self._release, self._samples, self._error
+        if error is not None:
+            raise error
+        frame = Frame(self.count, release, samples, self.epoch)
+        self.count += 1
+        return frame
+
+    def frames(self, period=None, count=None):
+        """Yield frames read every period seconds, or back to back if period is None, count times or until the caller stops.
+
+        Releases are at fixed rate, so sampling does not drift; if reading falls more than a period behind, the missed releases are skipped (see skipped) rather than read back to back.
+        """
+        release = None if period is None else _clock()
+        read = 0
+        while count is None or read < count:
+            yield self.read(release)
+            read += 1
+            if period is not None:
+                release += period
+                now = _clock()
+                if release + period < now:
+                    skipped = int((now - release) / period)
+                    self.skipped += skipped
+                    release += skipped * period
@@ -1 +1,48 @@
 # -*- coding: utf-8 -*-
+
+"""I2C master adapters
+
+Every master provides:
+
+    i2c_write(address, data)
+    i2c_write_read(address, data_out, num_bytes) -> array of bytes
+
+Masters that can issue several transactions with a single host request
+(e.g. Linux i2c-dev I2C_RDWR) also provide i2c_transfer(transactions).
+A transaction is a tuple (address, data_out, num_bytes): data_out is
+written and, if num_bytes is not 0, num_bytes are then read after a
+repeated start.  The result is a list with the array of bytes read by
+each transaction (empty for writes).
+
+Masters that wrap another master on the same physical bus (e.g.
+bustools.adapters.retry.RetryMaster, or a bustools.devices.pca954x.Channel
+behind a multiplexer) provide it as i2c_upstream; root_master() follows
+them to the master that owns the bus.
+"""
+
+from array import array
+
+def root_master(master):
+    """Return the master that owns the physical bus of master, following i2c_upstream through wrapping masters (see module docstring)."""
+    while True:
+        upstream = getattr(master, 'i2c_upstream', None)
+        if upstream is None:
+            return master
+        master = upstream
+
+def i2c_transfer(master, transactions):
+    """Issue a sequence of transactions on master, batched if master supports it.
+
+    Return the list of arrays of bytes read by each transaction (see module docstring).
+    """
+    transfer = getattr(master, 'i2c_transfer', None)
+    if transfer is not None:
+        return transfer(transactions)
+    results = []
+    for address, data_out, num_bytes in transactions:
+        if num_bytes:
+            results.append(master.i2c_write_read(address, data_out, num_bytes))
+        else:
+            master.i2c_write(address, data_out)
+            results.append(array('B'))
+    return results
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 # TODO make serial number print in xxxx-xxxxxx format
 
 import re
+import time
 import aardvark_py
 from array import array
 
@@ -18,10 +21,55 @@ AA_I2C_STATUS_CODES = {
     aardvark_py.AA_I2C_STATUS_LAST_DATA_ACK: "master ACKed last byte sent from Aardvark slave"
 }
 
+# GPIO pin bitmasks (pins are only available as GPIO when the corresponding
+# I2C or SPI mode is disabled)
+GPIO_SCL = aardvark_py.AA_GPIO_SCL
+GPIO_SDA = aardvark_py.AA_GPIO_SDA
+GPIO_MISO = aardvark_py.AA_GPIO_MISO
+GPIO_SCK = aardvark_py.AA_GPIO_SCK
+GPIO_MOSI = aardvark_py.AA_GPIO_MOSI
+GPIO_SS = aardvark_py.AA_GPIO_SS
+
+# aa_async_poll() event bitmasks
+ASYNC_NO_DATA = aardvark_py.AA_ASYNC_NO_DATA
+ASYNC_I2C_READ = aardvark_py.AA_ASYNC_I2C_READ
+ASYNC_I2C_WRITE = aardvark_py.AA_ASYNC_I2C_WRITE
+ASYNC_SPI = aardvark_py.AA_ASYNC_SPI
+
+# Maximum size of the I2C slave response buffer
+I2C_SLAVE_MAX_RESPONSE_BYTES = 64
+
 class AardvarkError(Exception):
     """Raised when an Aardvark error occurs."""
     pass
 
+class AardvarkI2CError(AardvarkError):
+    """Raised when an I2C transaction fails.  status is the AA_I2C_STATUS_* code.
+
+    The nack, bus_locked, arbitration_lost and bus_error attributes classify the failure for recovery policies (see bustools.adapters.retry).
+    """
+
+    def __init__(self, message, status):
+        AardvarkError.__init__(self, message)
+        self.status = status
+
+    @property
+    def nack(self):
+        """True if the slave did not acknowledge its address."""
+        return self.status == aardvark_py.AA_I2C_STATUS_SLA_NACK
+
+    @property
+    def bus_locked(self):
+        return self.status == aardvark_py.AA_I2C_STATUS_BUS_LOCKED
+
+    @property
+    def arbitration_lost(self):
+        return self.status == aardvark_py.AA_I2C_STATUS_ARB_LOST
+
+    @property
+    def bus_error(self):
+        return self.status == aardvark_py.AA_I2C_STATUS_BUS_ERROR
+
 def find_devices():
     """Return a dictionary of all devices attached to this system.
 
@@ -40,7 +88,7 @@ def print_devices():
     """Print all Aardvark devices attached to this system."""
     devices = sorted(((v,k) for k,v in find_devices().items()))
     if len(devices) > 0:
-        print "%d device(s) found:" % len(devices)
+        print("%d device(s) found:" % len(devices))
 
         # Print the information on each device
         for port, unique_id in devices:
@@ -52,11 +100,11 @@ def print_devices():
                 port  = port & ~aardvark_py.AA_PORT_NOT_FREE
 
             # Display device port number, in-use status, and serial number
-            print "    port = %d   %s  (%04d-%06d)" % \
-                (port, inuse, unique_id / 1000000, unique_id % 1000000)
+            print("    port = %d   %s  (%04d-%06d)" % \
+                (port, inuse, unique_id // 1000000, unique_id % 1000000))
 
     else:
-        print "No devices found."
+        print("No devices found.")
 
 def _validate_status(status):
     """Raise an error if the status is not OK."""
@@ -86,7 +134,7 @@ def _validate_I2C_status(status):
     if (status > 0):
         status_string = _aa_i2c_status_string(status)
         if status_string:
-            raise AardvarkError(status_string)
+            raise AardvarkI2CError(status_string, status)
         elif isinstance(status, int):
             raise ValueError("invalid I2C status code: %d" % status)
         else:
@@ -107,12 +155,12 @@ def version_string(version):
 
 def print_version_info(aardvark_version):
     """Print the version info from an AardvarkVersion object"""
-    print "Software version: v%s" % version_string(aardvark_version.software)
-    print "Firmware version: v%s" % version_string(aardvark_version.firmware)
-    print "Hardware version: v%s" % version_string(aardvark_version.hardware)
-    print "Software version required by firmware: v%s" % version_string(aardvark_version.sw_req_by_fw)
-    print "Firmware version required by software: v%s" % version_string(aardvark_version.fw_req_by_sw)
-    print "API version required by software: v%s" % version_string(aardvark_version.api_req_by_sw)
+    print("Software version: v%s" % version_string(aardvark_version.software))
+    print("Firmware version: v%s" % version_string(aardvark_version.firmware))
+    print("Hardware version: v%s" % version_string(aardvark_version.hardware))
+    print("Software version required by firmware: v%s" % version_string(aardvark_version.sw_req_by_fw))
+    print("Firmware version required by software: v%s" % version_string(aardvark_version.fw_req_by_sw))
+    print("API version required by software: v%s" % version_string(aardvark_version.api_req_by_sw))
 
 class Aardvark(object):
     """Aardvark is a wrapper class for the Total Phase Aardvark python API.
@@ -134,6 +182,10 @@ class Aardvark(object):
         Raise AardvarkError if unable to open an Aardvark adapter.
         """
         self._aardvark_handle = None
+        # GPIO direction and pull-up settings can't be queried from the
+        # adapter, so the last values written are kept here (0 at power on)
+        self._gpio_direction = 0
+        self._gpio_pullup = 0
         self._open(identifier)
 
     def __enter__(self):
@@ -153,7 +205,7 @@ class Aardvark(object):
         unique_ids = devices.keys()
         ports = devices.values()
         # check if identifier is a serial number string of the form "xxxx-xxxxxx"
-        if isinstance(identifier, str) and re.match("(\d{4,4}-\d{6,6})", identifier):
+        if isinstance(identifier, str) and re.match(r"(\d{4,4}-\d{6,6})", identifier):
             # convert the serial number to a unique ID
             int_identifier = unique_id(identifier)
         # otherwise, assume it's either a port or a unique ID
@@ -371,6 +423,83 @@ class Aardvark(object):
         if not (i2c_bus_timeout == value):
             raise AardvarkError("unable to configure Aardvark I2C bus timeout")
 
+    @property
+    def spi_bitrate(self):
+        """Set the SPI bit rate in kHz.
+
+        Supported bit rates are 125kHz to 8MHz; the adapter rounds down to the nearest rate it supports.
+        """
+        spi_bitrate = aardvark_py.aa_spi_bitrate(self._aardvark_handle, 0)
+        _validate_status(spi_bitrate)
+        return spi_bitrate
+
+    @spi_bitrate.setter
+    def spi_bitrate(self, value):
+        if not isinstance(value, int):
+            raise TypeError("invalid SPI bitrate value: %s" % value)
+        if value < 125 or value > 8000:
+            raise AardvarkError("unsupported SPI bitrate: %d" % value)
+        spi_bitrate = aardvark_py.aa_spi_bitrate(self._aardvark_handle, value)
+        _validate_status(spi_bitrate)
+
+    def spi_configure(self, mode=0, lsb_first=False):
+        """Configure the SPI master clock mode (0-3, i.e. CPOL << 1 | CPHA) and bit order."""
+        if mode not in (0, 1, 2, 3):
+            raise AardvarkError("unsupported SPI mode: %s" % mode)
+        polarity = aardvark_py.AA_SPI_POL_FALLING_RISING if mode & 0x2 else aardvark_py.AA_SPI_POL_RISING_FALLING
+        phase = aardvark_py.AA_SPI_PHASE_SETUP_SAMPLE if mode & 0x1 else aardvark_py.AA_SPI_PHASE_SAMPLE_SETUP
+        bitorder = aardvark_py.AA_SPI_BITORDER_LSB if lsb_first else aardvark_py.AA_SPI_BITORDER_MSB
+        _validate_status(aardvark_py.aa_spi_configure(self._aardvark_handle, polarity, phase, bitorder))
+
+    @property
+    def gpio_direction(self):
+        """Set the GPIO direction bitmask, 1 - output, 0 - input (see GPIO_* pin bitmasks).
+
+        The adapter does not support querying the direction, so the last value set is returned.
+        """
+        return self._gpio_direction
+
+    @gpio_direction.setter
+    def gpio_direction(self, value):
+        if not isinstance(value, int):
+            raise TypeError("invalid GPIO direction mask: %s" % value)
+        _validate_status(aardvark_py.aa_gpio_direction(self._aardvark_handle, value))
+        self._gpio_direction = value
+
+    @property
+    def gpio_pullup(self):
+        """Set the GPIO pull-up bitmask, 1 - pull-up enabled (see GPIO_* pin bitmasks).
+
+        The adapter does not support querying the pull-ups, so the last value set is returned.
+        """
+        return self._gpio_pullup
+
+    @gpio_pullup.setter
+    def gpio_pullup(self, value):
+        if not isinstance(value, int):
+            raise TypeError("invalid GPIO pull-up mask: %s" % value)
+        _validate_status(aardvark_py.aa_gpio_pullup(self._aardvark_handle, value))
+        self._gpio_pullup = value
+
+    def gpio_get(self):
+        """Return the current GPIO input values as a bitmask."""
+        value = aardvark_py.aa_gpio_get(self._aardvark_handle)
+        _validate_status(value)
+        return value
+
+    def gpio_set(self, value):
+        """Set the GPIO output values from a bitmask."""
+        _validate_status(aardvark_py.aa_gpio_set(self._aardvark_handle, value))
+
+    def gpio_change(self, timeout):
+        """Block until a GPIO input changes or timeout (ms) expires and return the GPIO input values as a bitmask.
+
+        Changes are detected relative to the values returned by the last call to gpio_get() or gpio_change().
+        """
+        value = aardvark_py.aa_gpio_change(self._aardvark_handle, timeout)
+        _validate_status(value)
+        return value
+
     def i2c_write(self, address, data):
         """Write an array of bytes to an I2C slave device."""
         # TODO add keywork arguments to enable features provided by I2C flags
@@ -394,3 +523,117 @@ class Aardvark(object):
         if num_read != num_bytes:
             raise AardvarkError("bytes read (%d) does not match expected (%d)" % (num_read, num_bytes))
         return data_in
+
+    def i2c_probe(self, address):
+        """Return True if an I2C slave acknowledges its address, otherwise False.
+
+        A zero-length write is issued so no data is transferred.  Only AA_I2C_STATUS_SLA_NACK is treated as "not present"; any other I2C error is raised.  This is the primitive used for ACK polling devices such as EEPROMs, which NACK their address while an internal write cycle is in progress.
+        """
+        i2c_flags=aardvark_py.AA_I2C_NO_FLAGS
+        status, num_written = aardvark_py.aa_i2c_write_ext(self._aardvark_handle, address, i2c_flags, array('B'))
+        if status == aardvark_py.AA_I2C_STATUS_SLA_NACK:
+            return False
+        _validate_I2C_status(status)
+        return True
+
+    def spi_write(self, data_out):
+        """Full duplex write+read an array of bytes to an SPI slave device.
+
+        Slave select is asserted for the duration of the transfer.  Return the array of bytes clocked in, which is the same length as data_out.
+        """
+        num_read, data_in = aardvark_py.aa_spi_write(self._aardvark_handle, data_out, len(data_out))
+        _validate_status(num_read)
+        if num_read != len(data_out):
+            raise AardvarkError("bytes read (%d) does not match expected (%d)" % (num_read, len(data_out)))
+        return data_in
+
+    def i2c_slave_enable(self, address, max_tx_bytes=0, max_rx_bytes=0):
+        """Enable the Aardvark adapter as an I2C slave device at address.
+
+        max_tx_bytes limits the bytes sent to the master per read (0 - no limit, the response buffer is repeated as needed).  max_rx_bytes limits the bytes accepted from the master per write (0 - no limit).
+        """
+        _validate_status(aardvark_py.aa_i2c_slave_enable(self._aardvark_handle, address, max_tx_bytes, max_rx_bytes))
+
+    def i2c_slave_disable(self):
+        """Disable the Aardvark adapter as an I2C slave device."""
+        _validate_status(aardvark_py.aa_i2c_slave_disable(self._aardvark_handle))
+
+    def i2c_slave_set_response(self, data):
+        """Set the array of bytes sent to the master when it reads from the slave.
+
+        The response buffer holds up to I2C_SLAVE_MAX_RESPONSE_BYTES and is used for every master read until it is set again.
+        """
+        if len(data) > I2C_SLAVE_MAX_RESPONSE_BYTES:
+            raise AardvarkError("response (%d bytes) exceeds slave response buffer (%d bytes)" % (len(data), I2C_SLAVE_MAX_RESPONSE_BYTES))
+        num_set = aardvark_py.aa_i2c_slave_set_response(self._aardvark_handle, data)
+        _validate_status(num_set)
+        if num_set != len(data):
+            raise AardvarkError("response bytes set (%d) does not match expected (%d)" % (num_set, len(data)))
+
+    def async_poll(self, timeout=0):
+        """Wait up to timeout (ms) for asynchronous data and return a bitmask of ASYNC_* events.
+
+        ASYNC_I2C_READ - the master wrote data to the slave, retrieve it with i2c_slave_read()
+        ASYNC_I2C_WRITE - the master read the response, retrieve the count with i2c_slave_write_stats()
+
+        A timeout of -1 blocks indefinitely.
+        """
+        event = aardvark_py.aa_async_poll(self._aardvark_handle, timeout)
+        _validate_status(event)
+        return event
+
+    def i2c_slave_read(self, max_bytes=65535):
+        """Return (address, data) for the data written to the slave by the master."""
+        num_read, address, data_in = aardvark_py.aa_i2c_slave_read(self._aardvark_handle, max_bytes)
+        _validate_status(num_read)
+        return address, data_in[:num_read]
+
+    def i2c_slave_write_stats(self):
+        """Return the number of bytes the master read from the slave in the last transaction."""
+        num_written = aardvark_py.aa_i2c_slave_write_stats(self._aardvark_handle)
+        _validate_status(num_written)
+        return num_written
+
+class GPIOInterrupt(object):
+    """Active low interrupt input wired to an Aardvark GPIO pin, e.g. the INT output of a PCA95xx.
+
+    The pin must be available as GPIO, so the mode it belongs to must be disabled.  Wiring INT to an SPI pin (GPIO_MISO, GPIO_SCK, GPIO_MOSI or GPIO_SS) with spi_mode = False leaves I2C mode available for the device that drives it.
+
+    Waiting uses gpio_change(), which blocks in the adapter until an input changes, so no USB or I2C traffic is generated while the line is idle.
+    """
+
+    # longest gpio_change() timeout in milliseconds used per call (its
+    # timeout is 16 bits); longer waits loop, re-checking the deadline
+    _WAIT_INTERVAL = 1000
+
+    def __init__(self, aardvark, pin, pullup=True):
+        self._aardvark = aardvark
+        self._pin = pin
+        aardvark.gpio_direction = aardvark.gpio_direction & ~pin
+        if pullup:
+            aardvark.gpio_pullup = aardvark.gpio_pullup | pin
+        else:
+            aardvark.gpio_pullup = aardvark.gpio_pullup & ~pin
+
+    @property
+    def asserted(self):
+        """True if the interrupt line is asserted (low)."""
+        return not (self._aardvark.gpio_get() & self._pin)
+
+    def wait(self, timeout=None):
+        """Block until the interrupt line is asserted or timeout (seconds) expires.
+
+        Return True if the line is asserted, False on timeout.  If timeout is None, block indefinitely.
+        """
+        if self.asserted:
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if deadline is None:
+                interval = self._WAIT_INTERVAL
+            else:
+                interval = min(int((deadline - time.time()) * 1000), self._WAIT_INTERVAL)
+                if interval <= 0:
+                    return False
+            if not (self._aardvark.gpio_change(interval) & self._pin):
+                return True
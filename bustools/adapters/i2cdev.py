@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+import errno
+import fcntl
+import os
+from array import array
+
+# <linux/i2c-dev.h>
+I2C_RDWR = 0x0707
+
+# <linux/i2c.h>
+I2C_M_RD = 0x0001
+
+# maximum number of messages in a single I2C_RDWR ioctl
+I2C_RDWR_IOCTL_MAX_MSGS = 42
+
+# maximum number of bytes in a single I2C_RDWR message
+I2C_RDWR_MAX_MSG_BYTES = 8192
+
+class _I2CMsg(ctypes.Structure):
+    """struct i2c_msg"""
+    _fields_ = [
+        ('addr', ctypes.c_uint16),
+        ('flags', ctypes.c_uint16),
+        ('len', ctypes.c_uint16),
+        ('buf', ctypes.POINTER(ctypes.c_uint8))
+    ]
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    """struct i2c_rdwr_ioctl_data"""
+    _fields_ = [
+        ('msgs', ctypes.POINTER(_I2CMsg)),
+        ('nmsgs', ctypes.c_uint32)
+    ]
+
+class I2CDevError(Exception):
+    """Raised when an i2c-dev transfer fails.  errno is the error number reported by the kernel.
+
+    The nack, bus_locked, arbitration_lost and bus_error attributes classify the failure for recovery policies (see bustools.adapters.retry) following Documentation/i2c/fault-codes in the kernel tree.
+    """
+
+    def __init__(self, message, error_number):
+        Exception.__init__(self, message)
+        self.errno = error_number
+
+    @property
+    def nack(self):
+        """True if the slave did not acknowledge its address."""
+        return self.errno in (errno.ENXIO, errno.EREMOTEIO)
+
+    @property
+    def bus_locked(self):
+        return self.errno == errno.ETIMEDOUT
+
+    @property
+    def arbitration_lost(self):
+        return self.errno == errno.EAGAIN
+
+    @property
+    def bus_error(self):
+        return self.errno == errno.EIO
+
+class FileIO(object):
+    """File descriptor layer used by I2CDev; replace it to run without a kernel device."""
+
+    def open(self, path):
+        return os.open(path, os.O_RDWR)
+
+    def ioctl(self, fd, request, arg):
+        return fcntl.ioctl(fd, request, arg)
+
+    def close(self, fd):
+        os.close(fd)
+
+class SimulatedIO(object):
+    """FileIO stand-in that carries out I2C_RDWR ioctls on device models (see bustools.adapters.simulated), for running I2CDev without a kernel device.
+
+    Every ioctl is recorded in ioctls as the list of its messages, each a (address, flags, bytes) tuple holding the bytes written, or read for I2C_M_RD messages.  Messages to an address without a device model fail with ENXIO, as a NACK does.
+    """
+
+    def __init__(self, devices=None):
+        # address -> device model
+        self.devices = dict(devices or {})
+        self.ioctls = []
+
+    def open(self, path):
+        return 3
+
+    def close(self, fd):
+        pass
+
+    def ioctl(self, fd, request, arg):
+        if request != I2C_RDWR:
+            raise IOError(errno.ENOTTY, os.strerror(errno.ENOTTY))
+        messages = []
+        self.ioctls.append(messages)
+        for i in range(arg.nmsgs):
+            message = arg.msgs[i]
+            model = self.devices.get(message.addr)
+            if model is None:
+                raise IOError(errno.ENXIO, os.strerror(errno.ENXIO))
+            if message.flags & I2C_M_RD:
+                response = model.response()
+                for j in range(message.len):
+                    message.buf[j] = response[j] if j < len(response) else 0xFF
+            else:
+                model.write(array('B', [message.buf[j] for j in range(message.len)]))
+            messages.append((message.addr, message.flags, bytes(bytearray(message.buf[j] for j in range(message.len)))))
+        return 0
+
+class I2CDev(object):
+    """I2C master for a Linux i2c-dev bus (/dev/i2c-N).
+
+    All transfers use the I2C_RDWR ioctl, so a write+read is a single combined transaction with a repeated start, and i2c_transfer() packs a sequence of transactions (e.g. several register reads) into as few ioctls as the kernel allows.
+
+    io provides open(path), ioctl(fd, request, arg) and close(fd) and defaults to FileIO.  A stand-in (e.g. SimulatedIO) receives the _I2CRdwrIoctlData structure for each I2C_RDWR and fills in the read buffers.
+
+    I2CDev implements the context management protocol, e.g.
+
+        with I2CDev(1) as bus:
+            bus.i2c_write_read(address, data_out, num_bytes)
+    """
+
+    # largest read or write the kernel accepts in a single message
+    i2c_max_transfer = I2C_RDWR_MAX_MSG_BYTES
+
+    def __init__(self, bus, io=None):
+        """Open the i2c-dev bus, given either its number or the path of the device node."""
+        self._io = io if io is not None else FileIO()
+        self.path = "/dev/i2c-%d" % bus if isinstance(bus, int) else bus
+        self._fd = None
+        try:
+            self._fd = self._io.open(self.path)
+        except (IOError, OSError) as e:
+            raise I2CDevError("unable to open %s: %s" % (self.path, e.strerror), e.errno)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the i2c-dev bus."""
+        if self._fd is not None:
+            self._io.close(self._fd)
+            self._fd = None
+
+    @property
+    def closed(self):
+        """bool indicating whether the bus has been closed.  This is a read-only attribute; the close() method changes the value."""
+        return self._fd is None
+
+    def i2c_free_bus(self):
+        """Bus recovery is performed by the kernel adapter driver, so there is nothing to do here."""
+        pass
+
+    def _rdwr(self, messages):
+        """Issue one I2C_RDWR ioctl for a list of (address, flags, buffer) messages."""
+        msgs = (_I2CMsg * len(messages))()
+        for i, (address, flags, buf) in enumerate(messages):
+            msgs[i].addr = address
+            msgs[i].flags = flags
+            msgs[i].len = len(buf)
+            msgs[i].buf = ctypes.cast(buf, ctypes.POINTER(ctypes.c_uint8))
+        data = _I2CRdwrIoctlData(msgs=ctypes.cast(msgs, ctypes.POINTER(_I2CMsg)), nmsgs=len(messages))
+        try:
+            self._io.ioctl(self._fd, I2C_RDWR, data)
+        except (IOError, OSError) as e:
+            raise I2CDevError("I2C_RDWR failed on %s: %s" % (self.path, e.strerror), e.errno)
+
+    def i2c_transfer(self, transactions):
+        """Issue a sequence of (address, data_out, num_bytes) transactions and return the list of arrays of bytes read.
+
+        Transactions are packed into I2C_RDWR ioctls of up to I2C_RDWR_IOCTL_MAX_MSGS messages; a write+read is never split across ioctls.
+        """
+        results = []
+        messages = []
+        reads = []
+
+        def flush():
+            if messages:
+                self._rdwr(messages)
+                for buf in reads:
+                    results.append(array('B', bytearray(buf)) if buf is not None else array('B'))
+                del messages[:]
+                del reads[:]
+
+        for address, data_out, num_bytes in transactions:
+            if len(data_out) > I2C_RDWR_MAX_MSG_BYTES or num_bytes > I2C_RDWR_MAX_MSG_BYTES:
+                raise I2CDevError("transaction exceeds %d bytes" % I2C_RDWR_MAX_MSG_BYTES, errno.EINVAL)
+            transaction_messages = []
+            if len(data_out) or not num_bytes:
+                transaction_messages.append((address, 0, (ctypes.c_uint8 * len(data_out))(*data_out)))
+            read_buffer = None
+            if num_bytes:
+                read_buffer = (ctypes.c_uint8 * num_bytes)()
+                transaction_messages.append((address, I2C_M_RD, read_buffer))
+            if len(messages) + len(transaction_messages) > I2C_RDWR_IOCTL_MAX_MSGS:
+                flush()
+            messages.extend(transaction_messages)
+            reads.append(read_buffer)
+        flush()
+        return results
+
+    def i2c_write(self, address, data):
+        """Write an array of bytes to an I2C slave device."""
+        self.i2c_transfer([(address, data, 0)])
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        """Atomic write+read an array of bytes to an I2C slave device."""
+        return self.i2c_transfer([(address, data_out, num_bytes)])[0]
+
+    def i2c_probe(self, address):
+        """Return True if an I2C slave acknowledges its address, otherwise False.
+
+        A zero-length write is issued, which requires adapter support for SMBus quick commands.
+        """
+        try:
+            self.i2c_write(address, array('B'))
+        except I2CDevError as e:
+            if e.nack:
+                return False
+            raise
+        return True
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+"""Share one I2C master between processes over a Unix domain socket
+
+BusServer owns a master (e.g. an Aardvark, which only one process can open)
+and serves it on a Unix domain socket.  RemoteMaster is the client side: it
+provides the master interface (see bustools.adapters), so it can be passed
+to any device driver.  Start a server from the command line with:
+
+    python -m bustools.adapters.remote ADAPTER [PATH]
+
+Protocol: every request and response is a fixed size little endian header
+followed by a payload of the given length.
+
+    request   id (uint32), op (uint8), address (uint8), count (uint16),
+              payload length (uint32), payload
+    response  id (uint32), status (uint8), error flags (uint8), padding,
+              payload length (uint32), payload
+
+    op           count       request payload       response payload
+    INFO         -           -                     i2c_max_transfer (uint32)
+    WRITE        -           data                  -
+    WRITE_READ   num_bytes   data_out              data_in
+    PROBE        -           -                     acknowledged (uint8)
+    TRANSFER     n           n x (address (uint8), data_out length (uint16),
+                             num_bytes (uint16), data_out)
+                                                   data_in of all transactions
+    FREE_BUS     -           -                     -
+
+A failed request has status ERROR, the error message as payload, and the
+nack, bus_locked, arbitration_lost and bus_error classification of the
+master's exception as flags, so bustools.adapters.retry works on the client
+side too.
+
+Requests on a connection are executed in order and each response carries
+the id of its request, so a client may send many requests before reading
+any response (see RemoteMaster.pipeline()).  Each request, including a
+whole TRANSFER, runs on the bus without interleaving with other clients.
+"""
+
+from __future__ import print_function
+
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+from array import array
+
+import bustools.adapters as adapters
+
+DEFAULT_PATH = '/tmp/bustools.sock'
+
+# pending response bytes above which the server stops reading a client's
+# requests until the client reads the responses
+_OUTPUT_LIMIT = 1 << 20
+
+# socket errors meaning a non-blocking operation would block
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+OP_INFO = 0
+OP_WRITE = 1
+OP_WRITE_READ = 2
+OP_PROBE = 3
+OP_TRANSFER = 4
+OP_FREE_BUS = 5
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# error flag bits and the exception attributes they carry
+_ERROR_FLAGS = (
+    (0x01, 'nack'),
+    (0x02, 'bus_locked'),
+    (0x04, 'arbitration_lost'),
+    (0x08, 'bus_error')
+)
+
+_REQUEST = struct.Struct('<IBBHI')
+_RESPONSE = struct.Struct('<IBB2xI')
+_TRANSACTION = struct.Struct('<BHH')
+_UINT32 = struct.Struct('<I')
+
+# array.tobytes()/frombytes() were tostring()/fromstring() in Python 2
+_tobytes = getattr(array, 'tobytes', None) or array.tostring
+_frombytes = getattr(array, 'frombytes', None) or array.fromstring
+
+class RemoteError(Exception):
+    """Raised by RemoteMaster when the server's master failed a request.
+
+    nack, bus_locked, arbitration_lost and bus_error are copied from the exception raised on the server.
+    """
+
+    def __init__(self, message, flags=0):
+        Exception.__init__(self, message)
+        self.flags = flags
+        for bit, name in _ERROR_FLAGS:
+            setattr(self, name, bool(flags & bit))
+
+class ProtocolError(Exception):
+    pass
+
+def _bytes(data):
+    """Return data (array of bytes, bytes, bytearray, or list of ints) as bytes."""
+    if isinstance(data, array):
+        return _tobytes(data)
+    return bytes(bytearray(data))
+
+def _array(data):
+    result = array('B')
+    _frombytes(result, bytes(data))
+    return result
+
+def _receive_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ProtocolError("connection closed")
+        received += count
+    return buffer
+
+# --- server ---
+
+class _Connection(object):
+
+    def __init__(self, sock):
+        self.socket = sock
+        # received bytes not yet parsed into requests
+        self.buffer = bytearray()
+        # response bytes not yet sent
+        self.output = bytearray()
+
+class BusServer(object):
+    """Serve master on a Unix domain socket at path.
+
+    Connections are multiplexed with select() in a single thread, so requests from all clients are serialized on the master.  Client sockets are non-blocking and responses are queued per connection and sent as the client reads them, so a client that stops reading doesn't stall the others; its requests are no longer read once it has more than 1 MiB of responses pending.
+    """
+
+    def __init__(self, master, path=DEFAULT_PATH):
+        self.master = master
+        self.path = path
+        self._running = False
+        self._connections = {}
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(path)
+        self._socket.listen(8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def serve_forever(self, poll_interval=0.5):
+        """Serve requests until shutdown() is called (checked every poll_interval seconds)."""
+        self._running = True
+        while self._running:
+            connections = list(self._connections.values())
+            sockets = [self._socket] + [c.socket for c in connections if len(c.output) < _OUTPUT_LIMIT]
+            writing = [c.socket for c in connections if c.output]
+            readable, writable = select.select(sockets, writing, [], poll_interval)[:2]
+            for sock in writable:
+                self._send(self._connections[sock])
+            for sock in readable:
+                if sock is self._socket:
+                    client = self._socket.accept()[0]
+                    client.setblocking(False)
+                    self._connections[client] = _Connection(client)
+                elif sock in self._connections:
+                    self._service(self._connections[sock])
+
+    def shutdown(self):
+        self._running = False
+
+    def close(self):
+        for sock in list(self._connections):
+            self._drop(sock)
+        self._socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _drop(self, sock):
+        del self._connections[sock]
+        sock.close()
+
+    def _send(self, connection):
+        """Send as much of the pending responses as the client's socket accepts."""
+        try:
+            sent = connection.socket.send(connection.output)
+        except socket.error as e:
+            if e.errno in _WOULD_BLOCK:
+                return
+            self._drop(connection.socket)
+            return
+        del connection.output[:sent]
+
+    def _service(self, connection):
+        """Read what the client sent and answer every complete request in it."""
+        try:
+            data = connection.socket.recv(65536)
+        except socket.error as e:
+            if e.errno in _WOULD_BLOCK:
+                return
+            data = b''
+        if not data:
+            self._drop(connection.socket)
+            return
+        connection.buffer.extend(data)
+        buffer = connection.buffer
+        responses = []
+        offset = 0
+        while len(buffer) - offset >= _REQUEST.size:
+            request_id, op, address, count, length = _REQUEST.unpack_from(buffer, offset)
+            end = offset + _REQUEST.size + length
+            if len(buffer) < end:
+                break
+            payload = bytes(buffer[offset + _REQUEST.size:end])
+            offset = end
+            try:
+                response = self._execute(op, address, count, payload)
+                status, flags = STATUS_OK, 0
+            except ProtocolError:
+                self._drop(connection.socket)
+                return
+            except Exception as error:
+                response = str(error).encode('utf-8')
+                status = STATUS_ERROR
+                flags = 0
+                for bit, name in _ERROR_FLAGS:
+                    if getattr(error, name, False):
+                        flags |= bit
+            responses.append(_RESPONSE.pack(request_id, status, flags, len(response)))
+            responses.append(response)
+        del buffer[:offset]
+        if responses:
+            connection.output.extend(b''.join(responses))
+            self._send(connection)
+
+    def _execute(self, op, address, count, payload):
+        """Run a request on the master and return the response payload."""
+        if op == OP_WRITE:
+            self.master.i2c_write(address, _array(payload))
+            return b''
+        if op == OP_WRITE_READ:
+            return _bytes(self.master.i2c_write_read(address, _array(payload), count)[:count])
+        if op == OP_PROBE:
+            return b'\x01' if self.master.i2c_probe(address) else b'\x00'
+        if op == OP_TRANSFER:
+            transactions = []
+            offset = 0
+            for i in range(count):
+                if len(payload) < offset + _TRANSACTION.size:
+                    raise ProtocolError("truncated transfer")
+                address, out_length, num_bytes = _TRANSACTION.unpack_from(payload, offset)
+                offset += _TRANSACTION.size
+                transactions.append((address, _array(payload[offset:offset + out_length]), num_bytes))
+                offset += out_length
+            results = adapters.i2c_transfer(self.master, transactions)
+            return b''.join(_bytes(result[:num_bytes]) for result, (address, data_out, num_bytes) in zip(results, transactions))
+        if op == OP_FREE_BUS:
+            # masters without bus recovery (see bustools.adapters.retry) have nothing to free
+            free_bus = getattr(self.master, 'i2c_free_bus', None)
+            if free_bus is not None:
+                free_bus()
+            return b''
+        if op == OP_INFO:
+            return _UINT32.pack(getattr(self.master, 'i2c_max_transfer', 65535))
+        raise ProtocolError("unknown op: %d" % op)
+
+# --- client ---
+
+class Pipeline(object):
+    """Requests queued on a RemoteMaster and sent together (see RemoteMaster.pipeline())."""
+
+    def __init__(self, master):
+        self._master = master
+        # (request frame, response payload decoder)
+        self._requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.execute()
+
+    def i2c_write(self, address, data):
+        self._requests.append(self._master._request(OP_WRITE, address, 0, _bytes(data), lambda payload: None))
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        self._requests.append(self._master._request(OP_WRITE_READ, address, num_bytes, _bytes(data_out), _array))
+
+    def i2c_probe(self, address):
+        self._requests.append(self._master._request(OP_PROBE, address, 0, b'', lambda payload: payload == b'\x01'))
+
+    def i2c_free_bus(self):
+        self._requests.append(self._master._request(OP_FREE_BUS, 0, 0, b'', lambda payload: None))
+
+    def i2c_transfer(self, transactions):
+        self._requests.append(self._master._transfer_request(transactions))
+
+    def execute(self):
+        """Send the queued requests, then return the list of their results in order.
+
+        All responses are read before the first error, if any, is raised as RemoteError.
+        """
+        requests, self._requests = self._requests, []
+        return self._master._execute(requests)
+
+class RemoteMaster(object):
+    """I2C master that forwards transactions to a BusServer.
+
+    A RemoteMaster is a single connection and must not be shared between threads; open one per thread instead.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, timeout=None):
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._next_id = 0
+        self._max_transfer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    @property
+    def closed(self):
+        return self._socket is None
+
+    # --- framing ---
+
+    def _request(self, op, address, count, payload, decode):
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        return request_id, _REQUEST.pack(request_id, op, address, count, len(payload)) + payload, decode
+
+    def _transfer_request(self, transactions):
+        parts = []
+        sizes = []
+        for address, data_out, num_bytes in transactions:
+            data_out = _bytes(data_out)
+            parts.append(_TRANSACTION.pack(address, len(data_out), num_bytes))
+            parts.append(data_out)
+            sizes.append(num_bytes)
+
+        def decode(payload):
+            results = []
+            offset = 0
+            for size in sizes:
+                results.append(_array(payload[offset:offset + size]))
+                offset += size
+            return results
+        return self._request(OP_TRANSFER, 0, len(sizes), b''.join(parts), decode)
+
+    def _execute(self, requests):
+        if not requests:
+            return []
+        self._socket.sendall(b''.join(frame for request_id, frame, decode in requests))
+        results = []
+        error = None
+        for request_id, frame, decode in requests:
+            response_id, status, flags, length = _RESPONSE.unpack(bytes(_receive_exactly(self._socket, _RESPONSE.size)))
+            payload = bytes(_receive_exactly(self._socket, length)) if length else b''
+            if response_id != request_id:
+                self.close()
+                raise ProtocolError("response %d does not match request %d" % (response_id, request_id))
+            if status == STATUS_OK:
+                results.append(decode(payload))
+            else:
+                results.append(None)
+                if error is None:
+                    error = RemoteError(payload.decode('utf-8', 'replace'), flags)
+        if error is not None:
+            raise error
+        return results
+
+    # --- master interface ---
+
+    @property
+    def i2c_max_transfer(self):
+        """Maximum number of bytes in a single transaction on the server's master."""
+        if self._max_transfer is None:
+            self._max_transfer = self._execute([self._request(OP_INFO, 0, 0, b'', lambda payload: _UINT32.unpack(payload)[0])])[0]
+        return self._max_transfer
+
+    def pipeline(self):
+        """Return a Pipeline: the same methods as the master, queued and then sent with a single socket write by execute() (or at the end of a with block), with the responses read back together.  This saves a round trip per request."""
+        return Pipeline(self)
+
+    def i2c_write(self, address, data):
+        """Write an array of bytes to an I2C slave device."""
+        self._execute([self._request(OP_WRITE, address, 0, _bytes(data), lambda payload: None)])
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        """Atomic write+read an array of bytes to an I2C slave device."""
+        return self._execute([self._request(OP_WRITE_READ, address, num_bytes, _bytes(data_out), _array)])[0]
+
+    def i2c_probe(self, address):
+        """Return True if a slave acknowledges its address, otherwise False."""
+        return self._execute([self._request(OP_PROBE, address, 0, b'', lambda payload: payload == b'\x01')])[0]
+
+    def i2c_free_bus(self):
+        """Free the I2C bus of the server's master (see bustools.adapters.retry)."""
+        self._execute([self._request(OP_FREE_BUS, 0, 0, b'', lambda payload: None)])
+
+    def i2c_transfer(self, transactions):
+        """Issue a sequence of (address, data_out, num_bytes) transactions (see bustools.adapters) as a single request."""
+        return self._execute([self._transfer_request(transactions)])[0]
+
+def main(argv=None):
+    import argparse
+    import bustools.daemon as daemon
+    import bustools.registry as registry
+    parser = argparse.ArgumentParser(prog="python -m bustools.adapters.remote", description="Share an I2C adapter with other processes over a Unix domain socket.")
+    parser.add_argument("adapter", help="Aardvark serial number, port or unique ID, or /dev/i2c-N")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="socket path (default: %s)" % DEFAULT_PATH)
+    args = parser.parse_args(argv)
+    try:
+        master = daemon.open_master(args.adapter)
+    except (daemon.DaemonError, registry.RegistryError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    try:
+        with BusServer(master, args.path) as server:
+            print("serving %s on %s" % (args.adapter, args.path))
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except socket.error as e:
+        print("error: unable to serve on %s: %s" % (args.path, e), file=sys.stderr)
+        return 1
+    finally:
+        master.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
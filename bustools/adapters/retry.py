@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import bustools.adapters as adapters
+
+class CircuitOpenError(Exception):
+    """Raised instead of accessing an address whose circuit breaker is open."""
+    pass
+
+class _Circuit(object):
+
+    def __init__(self):
+        # consecutive address NACKs
+        self.failures = 0
+        # time until which the address is not accessed, None if closed
+        self.open_until = None
+
+class RetryMaster(object):
+    """I2C master wrapper that recovers from transient bus errors and stops accessing devices that don't respond.
+
+    Errors are classified using the nack, bus_locked, arbitration_lost and bus_error attributes of the exception raised by the wrapped master (see bustools.adapters.aardvark.AardvarkI2CError):
+
+    - bus_locked: the bus is freed with master.i2c_free_bus(), then the transaction is retried
+    - arbitration_lost, bus_error: the transaction is retried
+    - nack: the transaction is not retried.  After failure_threshold consecutive NACKs the circuit breaker for the address opens and transactions to it raise CircuitOpenError without touching the bus for reset_timeout seconds.  The next transaction after that is a trial: success closes the breaker, another NACK opens it again.
+    - anything else is raised immediately
+
+    Retries wait backoff seconds, doubling per attempt up to max_backoff, for at most retries attempts.
+
+    Attributes that are not part of the I2C transaction interface (e.g. i2c_max_transfer) are read from the wrapped master; i2c_bitrate is read from and set on the wrapped master.
+    """
+
+    def __init__(self, master, retries=3, backoff=0.001, max_backoff=0.05, failure_threshold=3, reset_timeout=5.0):
+        self.master = master
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        # slave address -> _Circuit
+        self._circuits = {}
+
+    def __getattr__(self, name):
+        return getattr(self.master, name)
+
+    @property
+    def i2c_upstream(self):
+        """The wrapped master, which drives the same bus (see bustools.adapters.root_master())."""
+        return self.master
+
+    @property
+    def i2c_bitrate(self):
+        """I2C bit rate in kHz of the wrapped master."""
+        return self.master.i2c_bitrate
+
+    @i2c_bitrate.setter
+    def i2c_bitrate(self, value):
+        self.master.i2c_bitrate = value
+
+    # --- circuit breakers ---
+
+    @property
+    def open_circuits(self):
+        """List of slave addresses whose circuit breaker is open."""
+        return sorted(address for address, circuit in self._circuits.items() if circuit.open_until is not None)
+
+    def reset(self, address=None):
+        """Close the circuit breaker for address, or for all addresses if address is None."""
+        if address is None:
+            self._circuits.clear()
+        else:
+            self._circuits.pop(address, None)
+
+    def _check_circuit(self, address):
+        circuit = self._circuits.get(address)
+        if circuit is not None and circuit.open_until is not None and time.time() < circuit.open_until:
+            raise CircuitOpenError("circuit open for address 0x%02X after %d NACKs" % (address, circuit.failures))
+
+    def _record_nack(self, address):
+        circuit = self._circuits.setdefault(address, _Circuit())
+        circuit.failures += 1
+        if circuit.failures >= self.failure_threshold:
+            circuit.open_until = time.time() + self.reset_timeout
+
+    def _record_success(self, address):
+        if address in self._circuits:
+            del self._circuits[address]
+
+    # --- transactions ---
+
+    def _transaction(self, addresses, function, *args):
+        for address in addresses:
+            self._check_circuit(address)
+        attempt = 0
+        while True:
+            try:
+                result = function(*args)
+            except Exception as error:
+                if getattr(error, 'nack', False):
+                    # a NACK can only be attributed to a device if the
+                    # transactions were all to the same address
+                    if len(addresses) == 1:
+                        self._record_nack(addresses[0])
+                    raise
+                if getattr(error, 'bus_locked', False):
+                    self.master.i2c_free_bus()
+                elif not (getattr(error, 'arbitration_lost', False) or getattr(error, 'bus_error', False)):
+                    raise
+                if attempt >= self.retries:
+                    raise
+                time.sleep(min(self.max_backoff, self.backoff * (2 ** attempt)))
+                attempt += 1
+            else:
+                for address in addresses:
+                    self._record_success(address)
+                return result
+
+    def i2c_write(self, address, data):
+        """Write an array of bytes to an I2C slave device."""
+        return self._transaction((address,), self.master.i2c_write, address, data)
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        """Atomic write+read an array of bytes to an I2C slave device."""
+        return self._transaction((address,), self.master.i2c_write_read, address, data_out, num_bytes)
+
+    def i2c_transfer(self, transactions):
+        """Issue a sequence of (address, data_out, num_bytes) transactions (see bustools.adapters), retried as a whole."""
+        addresses = tuple(sorted(set(address for address, data_out, num_bytes in transactions)))
+        return self._transaction(addresses, adapters.i2c_transfer, self.master, transactions)
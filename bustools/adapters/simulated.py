@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Simulated I2C master
+
+A master whose bus is populated with device models, e.g. the register
+device emulators in bustools.emulators, for running drivers, tools and
+tests without hardware or adapter libraries:
+
+    bus = SimulatedMaster({0x40: INA219Emulator(0.01, 5.0)})
+    ina = INA219(bus, 0x40, 0x399F, 0.1, 3.2)
+
+A device model provides write(data), called with the bytes written to its
+address, and response(), returning the bytes it sends on a read.
+"""
+
+from array import array
+
+import bustools.emulators.device as device
+
+class SimulatedI2CError(Exception):
+    """Raised when a transaction fails: nack if no device model is attached at the address, otherwise a bus error (the model rejected the transaction, e.g. an invalid register).
+
+    The nack, bus_locked, arbitration_lost and bus_error attributes classify the failure for recovery policies (see bustools.adapters.retry).
+    """
+
+    def __init__(self, message, nack=False):
+        Exception.__init__(self, message)
+        self.nack = nack
+        self.bus_locked = False
+        self.arbitration_lost = False
+        self.bus_error = not nack
+
+class SimulatedMaster(object):
+    """I2C master for a bus of device models, given as a dictionary of address -> model.
+
+    Transactions complete instantly; i2c_bitrate is only recorded.  Reads longer than the model's response are padded with 0xFF, as an idle bus reads.
+    """
+
+    def __init__(self, devices=None, bitrate=100):
+        # address -> device model
+        self.devices = dict(devices or {})
+        # I2C bit rate in kHz
+        self.i2c_bitrate = bitrate
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        self._closed = True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def add(self, address, model):
+        """Attach a device model at address."""
+        self.devices[address] = model
+
+    def remove(self, address):
+        del self.devices[address]
+
+    def _device(self, address):
+        model = self.devices.get(address)
+        if model is None:
+            raise SimulatedI2CError("no device at address 0x%02X" % address, nack=True)
+        return model
+
+    def i2c_free_bus(self):
+        pass
+
+    def i2c_write(self, address, data):
+        model = self._device(address)
+        try:
+            model.write(array('B', data))
+        except device.EmulatorError as e:
+            raise SimulatedI2CError("device at address 0x%02X: %s" % (address, e))
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        self.i2c_write(address, data_out)
+        data_in = array('B', self._device(address).response()[:num_bytes])
+        data_in.extend([0xFF] * (num_bytes - len(data_in)))
+        return data_in
+
+    def i2c_probe(self, address):
+        """Return True if a device model is attached at address."""
+        return address in self.devices
+
+    def i2c_transfer(self, transactions):
+        """Issue a sequence of (address, data_out, num_bytes) transactions; see bustools.adapters."""
+        results = []
+        for address, data_out, num_bytes in transactions:
+            if num_bytes:
+                results.append(self.i2c_write_read(address, data_out, num_bytes))
+            else:
+                self.i2c_write(address, data_out)
+                results.append(array('B'))
+        return results
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""Telemetry acquisition daemon
+
+Polls a list of devices, each at its own rate, and streams the readings as
+CSV or InfluxDB line protocol.  Run it with python -m bustools; see
+python -m bustools --help for the options.
+
+Devices are given with --device ADAPTER,DRIVER,ADDRESS,RATE[,NAME] or in a
+JSON configuration file (--config) holding a list of objects with the same
+keys in lower case, plus an optional "options" object of driver keyword
+arguments (e.g. the INA219 shunt_resistance), an optional "bitrate" in
+kHz to read the device at (e.g. found with bustools.tuning) and optional
+"deadband" and "relative_deadband" values overriding --deadband and
+--relative-deadband for the device.
+
+ADAPTER is an Aardvark serial number (xxxx-xxxxxx), port or unique ID, the
+path of a Linux i2c-dev bus (/dev/i2c-N), MASTER:ARGUMENT for any master in
+bustools.registry.MASTERS (e.g. remote:/tmp/bustools.sock) or "simulated"
+for a simulated bus with an emulator (see bustools.emulators) at the
+address of each device.  RATE is in Hz.
+"""
+
+from __future__ import print_function
+
+import argparse
+import functools
+import json
+import sys
+import threading
+import time
+from array import array
+
+import bustools.adapters.retry as retry
+import bustools.filters as filters
+import bustools.planner as planner
+import bustools.registry as registry
+import bustools.samplelog as samplelog
+import bustools.scheduler as scheduler
+import bustools.shm as shm
+
+# --- drivers ---
+
+def _open_lm75(master, address, options):
+    return registry.DRIVERS.load("lm75")(master, address, **options)
+
+def _read_lm75(device):
+    return [("temperature", device.temperature())]
+
+def _lm75_quantities(device):
+    return ["temperature"]
+
+def _open_ina219(master, address, options):
+    options = dict(options)
+    options.setdefault("configuration", 0x399F)
+    options.setdefault("shunt_resistance", 0.1)
+    options.setdefault("max_expected_current", 3.2)
+    return registry.DRIVERS.load("ina219")(master, address, **options)
+
+def _read_ina219(device):
+    shunt_voltage, bus_voltage, current, power = device.measurements()
+    return [("shunt_voltage", shunt_voltage), ("bus_voltage", bus_voltage), ("current", current), ("power", power)]
+
+def _ina219_quantities(device):
+    return ["shunt_voltage", "bus_voltage", "current", "power"]
+
+def _pca95xx_opener(driver_name):
+    def open_pca95xx(master, address, options):
+        return registry.DRIVERS.load(driver_name)(master, address, **options)
+    return open_pca95xx
+
+def _read_pca95xx(device):
+    return [("port%d" % port.number, value) for port, value in zip(device.ports, device.inputs())]
+
+def _pca95xx_quantities(device):
+    return ["port%d" % port.number for port in device.ports]
+
+class Driver(object):
+    """How the daemon opens, reads and schedules one kind of device.
+
+    open(master, address, options) returns the device, read(device) returns a list of (quantity, value) readings and quantities(device) the list of their names.  operation is the name of the bustools.planner operation a read performs, for bus cost estimates.  digital is True if the readings are logic levels, which are filtered to edges rather than by deadband.
+    """
+
+    def __init__(self, open, read, quantities, operation, digital=False):
+        self.open = open
+        self.read = read
+        self.quantities = quantities
+        self.operation = planner.OPERATIONS[operation]
+        self.digital = digital
+
+DRIVERS = {
+    "lm75": Driver(_open_lm75, _read_lm75, _lm75_quantities, "lm75.temperature"),
+    "ina219": Driver(_open_ina219, _read_ina219, _ina219_quantities, "ina219.measurements"),
+    "pca9536": Driver(_pca95xx_opener("pca9536"), _read_pca95xx, _pca95xx_quantities, "pca9536.inputs", digital=True),
+    "pca9554": Driver(_pca95xx_opener("pca9554"), _read_pca95xx, _pca95xx_quantities, "pca9554.inputs", digital=True),
+    "pca9557": Driver(_pca95xx_opener("pca9557"), _read_pca95xx, _pca95xx_quantities, "pca9557.inputs", digital=True),
+    "pca9535": Driver(_pca95xx_opener("pca9535"), _read_pca95xx, _pca95xx_quantities, "pca9535.inputs", digital=True),
+    "pca9555": Driver(_pca95xx_opener("pca9555"), _read_pca95xx, _pca95xx_quantities, "pca9555.inputs", digital=True),
+    "pca9505": Driver(_pca95xx_opener("pca9505"), _read_pca95xx, _pca95xx_quantities, "pca9505.inputs", digital=True),
+}
+
+# --- output formats ---
+
+def format_csv(timestamp, name, quantity, value):
+    return "%.6f,%s,%s,%r\n" % (timestamp, name, quantity, value)
+
+def format_line_protocol(timestamp, name, quantity, value):
+    return "%s,device=%s value=%r %d\n" % (quantity, name.replace(" ", "\\ ").replace(",", "\\,"), value, int(timestamp * 1e9))
+
+FORMATS = {
+    "csv": format_csv,
+    "line": format_line_protocol,
+}
+
+class DaemonError(Exception):
+    pass
+
+class BufferedWriter(object):
+    """Collect formatted lines and write them to a stream in bulk.
+
+    Lines are written when max_lines are pending or when flush_interval seconds have passed since the last write.
+    """
+
+    def __init__(self, stream, max_lines=1000, flush_interval=1.0):
+        self.stream = stream
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._last_flush = time.time()
+
+    def write(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.max_lines or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.stream.write("".join(self._lines))
+            del self._lines[:]
+        self.stream.flush()
+        self._last_flush = time.time()
+
+# --- configuration ---
+
+class DeviceSpec(object):
+
+    def __init__(self, adapter, driver, address, rate, name=None, options=None, bitrate=None, deadband=None, relative_deadband=None):
+        if driver not in DRIVERS:
+            raise DaemonError("unknown driver: %s (choose from %s)" % (driver, ", ".join(sorted(DRIVERS))))
+        if rate <= 0:
+            raise DaemonError("invalid rate: %s" % rate)
+        self.adapter = str(adapter)
+        self.driver = driver
+        self.address = address
+        self.rate = rate
+        self.name = name or "%s@0x%02X" % (driver, address)
+        self.options = options or {}
+        self.bitrate = bitrate
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+
+def _address(value):
+    return value if isinstance(value, int) else int(value, 0)
+
+def parse_device(text):
+    """Parse ADAPTER,DRIVER,ADDRESS,RATE[,NAME] into a DeviceSpec."""
+    fields = text.split(",")
+    if len(fields) not in (4, 5):
+        raise DaemonError("invalid device: %s (expected ADAPTER,DRIVER,ADDRESS,RATE[,NAME])" % text)
+    try:
+        return DeviceSpec(fields[0], fields[1].lower(), _address(fields[2]), float(fields[3]), *fields[4:])
+    except ValueError as e:
+        raise DaemonError("invalid device: %s (%s)" % (text, e))
+
+def load_config(path):
+    """Load a list of DeviceSpec from a JSON configuration file."""
+    with open(path) as f:
+        entries = json.load(f)
+    specs = []
+    for entry in entries:
+        try:
+            specs.append(DeviceSpec(entry["adapter"], entry["driver"].lower(), _address(entry["address"]), float(entry["rate"]), entry.get("name"), entry.get("options"), entry.get("bitrate"), entry.get("deadband"), entry.get("relative_deadband")))
+        except KeyError as e:
+            raise DaemonError("device entry %s is missing %s" % (entry, e))
+    return specs
+
+# masters that batch transactions (i2c_transfer)
+_BATCHING_MASTERS = ("i2cdev", "remote", "simulated")
+
+def _master_name(adapter):
+    """Return the bustools.registry.MASTERS name and the argument of an adapter identifier."""
+    if adapter.startswith("/dev/"):
+        return "i2cdev", adapter
+    if adapter == "simulated":
+        return "simulated", None
+    name, separator, argument = adapter.partition(":")
+    if separator and name in registry.MASTERS:
+        return name, argument
+    return "aardvark", adapter
+
+def open_master(adapter):
+    """Open the I2C master for an adapter identifier.
+
+    Raise DaemonError if the master can't be opened (e.g. the adapter isn't connected); the error of the master (AardvarkError, I2CDevError, socket.error, ...) is in its message.
+    """
+    name, argument = _master_name(adapter)
+    master = registry.MASTERS.load(name)
+    try:
+        return master() if argument is None else master(argument)
+    except Exception as e:
+        raise DaemonError("unable to open adapter %s: %s" % (adapter, e))
+
+def open_device(master, spec):
+    """Open the driver of a device spec on master.
+
+    Raise DaemonError if the driver fails, e.g. on a NACK while configuring the device.
+    """
+    try:
+        return DRIVERS[spec.driver].open(master, spec.address, spec.options)
+    except Exception as e:
+        raise DaemonError("unable to open %s (%s at 0x%02X on %s): %s" % (spec.name, spec.driver, spec.address, spec.adapter, e))
+
+def plan(specs, bitrate=scheduler.DEFAULT_BITRATE, overhead=None):
+    """Return a bustools.planner.Planner for the device specs, without opening any adapter.
+
+    Adapters are assumed to run at bitrate kHz.  overhead is the bustools.planner.OverheadProfile of all adapters, or a dictionary of adapter -> OverheadProfile (e.g. from measure_overheads()); other adapters are assumed to have the typical overhead of their kind of master (see bustools.planner.TYPICAL_OVERHEAD).  i2c-dev, remote and simulated adapters are assumed to batch transactions.
+    """
+    result = planner.Planner()
+    adapters = []
+    for spec in specs:
+        if spec.adapter not in adapters:
+            adapters.append(spec.adapter)
+            name = _master_name(spec.adapter)[0]
+            profile = overhead.get(spec.adapter) if isinstance(overhead, dict) else overhead
+            if profile is None:
+                profile = planner.TYPICAL_OVERHEAD.get(name)
+            result.add_adapter(spec.adapter, bitrate, profile, batching=name in _BATCHING_MASTERS)
+        result.add(spec.adapter, spec.name, DRIVERS[spec.driver].operation, spec.rate, spec.bitrate)
+    return result
+
+def attach_emulator(master, spec):
+    """Attach the emulator of a device spec's driver to a simulated master."""
+    if spec.driver not in registry.EMULATORS:
+        raise DaemonError("no emulator for driver %s on a simulated bus" % spec.driver)
+    master.add(spec.address, registry.EMULATORS.load(spec.driver)(name=spec.name))
+
+def measure_overheads(specs, iterations=200):
+    """Open the adapters of the device specs and return a dictionary of adapter -> bustools.planner.OverheadProfile measured by timing reads of its first device (see bustools.planner.measure_overhead())."""
+    overheads = {}
+    for spec in specs:
+        if spec.adapter in overheads:
+            continue
+        master = open_master(spec.adapter)
+        try:
+            if _master_name(spec.adapter)[0] == "simulated":
+                attach_emulator(master, spec)
+            # the operation's first read, e.g. a register read after
+            # writing a register pointer of 0
+            write_bytes, read_bytes = [t for t in DRIVERS[spec.driver].operation.transactions if t[1]][0]
+            try:
+                overheads[spec.adapter] = planner.measure_overhead(master, spec.address, array('B', [0] * write_bytes), read_bytes, iterations)
+            except Exception as e:
+                raise DaemonError("unable to measure %s with %s: %s" % (spec.adapter, spec.name, e))
+        finally:
+            master.close()
+    return overheads
+
+# --- acquisition ---
+
+class Daemon(object):
+    """Poll devices at their rates and write each reading to the output.
+
+    If shm_path is provided the latest readings are also published to shared memory (see bustools.shm), and if log_path is provided every reading is also recorded in a sample log (see bustools.samplelog), appended to the log at log_path if it has the same channels and written at least every log_flush_interval seconds (if not None), both as channels named DEVICE/QUANTITY.
+
+    If filtering is True, readings are only written to the output when they change (see bustools.filters): by more than deadband (absolute) or relative_deadband (relative) for measurements, on edges for logic levels, and at least every heartbeat seconds (if not None) in any case.  Shared memory and the sample log are not filtered.
+
+    Reads are run by a bustools.scheduler.Scheduler: each device is a job with a period of 1 / rate, devices on the same adapter are read earliest deadline first, and different adapters are polled in parallel.  A failed read (e.g. a NACK) is counted in the device's job stats and the device keeps being polled; the first failure of each device is reported to errors.  If retries is not 0 masters are wrapped in a bustools.adapters.retry.RetryMaster retrying transient bus errors that many times.
+    """
+
+    def __init__(self, specs, output, formatter=format_csv, shm_path=None, filtering=False, deadband=0.0, relative_deadband=0.0, heartbeat=None, log_path=None, retries=0, errors=sys.stderr, log_flush_interval=None):
+        self.specs = specs
+        self.output = output
+        self.formatter = formatter
+        self.shm_path = shm_path
+        self.log_path = log_path
+        self.log_flush_interval = log_flush_interval
+        self.log = None
+        self.filtering = filtering
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+        self.heartbeat = heartbeat
+        self.retries = retries
+        self.errors = errors
+        # filter of each quantity of each device, if filtering
+        self._filters = []
+        self.publisher = None
+        self.scheduler = None
+        # shared memory and sample log channel index of the first quantity of
+        # each device
+        self._first_channels = []
+        self.masters = {}
+        self.devices = []
+        # output is shared by the scheduler's per-adapter threads
+        self._lock = threading.Lock()
+
+    def open(self):
+        for spec in self.specs:
+            if spec.adapter not in self.masters:
+                master = open_master(spec.adapter)
+                self.masters[spec.adapter] = retry.RetryMaster(master, self.retries) if self.retries else master
+            if _master_name(spec.adapter)[0] == "simulated":
+                attach_emulator(self.masters[spec.adapter], spec)
+            self.devices.append((spec, open_device(self.masters[spec.adapter], spec)))
+        channels = []
+        for spec, device in self.devices:
+            self._first_channels.append(len(channels))
+            channels.extend("%s/%s" % (spec.name, quantity) for quantity in DRIVERS[spec.driver].quantities(device))
+        if self.shm_path is not None:
+            self.publisher = shm.Publisher(channels, self.shm_path)
+        if self.log_path is not None:
+            self.log = samplelog.Writer(self.log_path, channels, flush_interval=self.log_flush_interval, append=True)
+        if self.filtering:
+            self._filters = [self._device_filters(spec, device) for spec, device in self.devices]
+        self.scheduler = scheduler.Scheduler(stop_on_error=False, on_error=self._report_error)
+        for index, (spec, device) in enumerate(self.devices):
+            self.scheduler.add(spec.name, functools.partial(self._poll, index), 1.0 / spec.rate, master=self.masters[spec.adapter], transactions=DRIVERS[spec.driver].operation.transactions, bitrate=spec.bitrate)
+
+    def _device_filters(self, spec, device):
+        driver = DRIVERS[spec.driver]
+        filters_ = []
+        for quantity in driver.quantities(device):
+            if driver.digital:
+                filters_.append(filters.Edge(heartbeat=self.heartbeat))
+            else:
+                deadband = self.deadband if spec.deadband is None else spec.deadband
+                relative_deadband = self.relative_deadband if spec.relative_deadband is None else spec.relative_deadband
+                filters_.append(filters.Deadband(deadband, relative_deadband, self.heartbeat))
+        return filters_
+
+    def _report_error(self, job, error):
+        if job.stats.errors == 1:
+            print("warning: %s: read failed: %s (further failures are only counted)" % (job.name, error), file=self.errors)
+
+    def failures(self):
+        """Return the list of (device name, failed reads, last error) of the devices with failed reads."""
+        if self.scheduler is None:
+            return []
+        return [(job.name, job.stats.errors, job.stats.last_error) for job in self.scheduler.jobs if job.stats.errors]
+
+    def close(self):
+        self.output.flush()
+        self._filters = []
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        self._first_channels = []
+        for master in self.masters.values():
+            master.close()
+        self.masters = {}
+        self.devices = []
+
+    def stop(self):
+        self.scheduler.stop()
+
+    def _poll(self, index):
+        spec, device = self.devices[index]
+        timestamp = time.time()
+        readings = DRIVERS[spec.driver].read(device)
+        if self._filters:
+            lines = [self.formatter(timestamp, spec.name, quantity, value) for (quantity, value), filter in zip(readings, self._filters[index]) if filter.accept(timestamp, value)]
+        else:
+            lines = [self.formatter(timestamp, spec.name, quantity, value) for quantity, value in readings]
+        with self._lock:
+            for line in lines:
+                self.output.write(line)
+        channel = self._first_channels[index]
+        if self.publisher is not None:
+            for offset, (quantity, value) in enumerate(readings):
+                self.publisher.publish(channel + offset, value, timestamp)
+        if self.log is not None:
+            for offset, (quantity, value) in enumerate(readings):
+                self.log.append(channel + offset, timestamp, value)
+
+    def run(self, duration=None):
+        """Poll until stop() is called, or for duration seconds."""
+        self.scheduler.run(duration)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bustools", description="Poll I2C devices and stream their readings.")
+    parser.add_argument("-d", "--device", action="append", default=[], metavar="ADAPTER,DRIVER,ADDRESS,RATE[,NAME]", help="device to poll (may be repeated); drivers: %s" % ", ".join(sorted(DRIVERS)))
+    parser.add_argument("-c", "--config", metavar="FILE", help="JSON device list")
+    parser.add_argument("-f", "--format", choices=sorted(FORMATS), default="csv", help="output format (default: csv)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="append output to FILE instead of stdout")
+    parser.add_argument("--buffer-lines", type=int, default=1000, metavar="N", help="write output after N lines (default: 1000)")
+    parser.add_argument("--flush-interval", type=float, default=1.0, metavar="SECONDS", help="write output (and the --log sample log) at least this often (default: 1.0)")
+    parser.add_argument("--shm", metavar="PATH", nargs="?", const=shm.DEFAULT_PATH, help="also publish the latest readings to shared memory at PATH (default: %s)" % shm.DEFAULT_PATH)
+    parser.add_argument("--log", metavar="FILE", help="also record every reading in a binary sample log (see bustools.samplelog); an existing log of the same devices is appended to, one of other devices is an error")
+    parser.add_argument("--deadband", type=float, metavar="VALUE", help="only output measurements that changed by more than VALUE, and logic levels on edges")
+    parser.add_argument("--relative-deadband", type=float, metavar="FRACTION", help="only output measurements that changed by more than FRACTION of their last output value, and logic levels on edges")
+    parser.add_argument("--heartbeat", type=float, metavar="SECONDS", help="with a deadband, still output unchanged readings this often")
+    parser.add_argument("--duration", type=float, metavar="SECONDS", help="stop after this long (default: run until interrupted)")
+    parser.add_argument("--stats", action="store_true", help="print scheduling statistics to stderr on exit")
+    parser.add_argument("--retries", type=int, default=0, metavar="N", help="retry reads that fail with a transient bus error up to N times (see bustools.adapters.retry)")
+    parser.add_argument("--dry-run", action="store_true", help="print the predicted load of each adapter and exit (status 1 if any is overloaded)")
+    parser.add_argument("--bitrate", type=int, default=scheduler.DEFAULT_BITRATE, metavar="KHZ", help="adapter bit rate assumed by --dry-run (default: %d)" % scheduler.DEFAULT_BITRATE)
+    parser.add_argument("--overhead", type=float, metavar="SECONDS", help="host overhead per adapter call assumed by --dry-run (default: typical for the kind of adapter, see bustools.planner.TYPICAL_OVERHEAD)")
+    parser.add_argument("--measure", action="store_true", help="with --dry-run, open the adapters and measure their overhead instead (see bustools.planner.measure_overhead)")
+    args = parser.parse_args(argv)
+
+    try:
+        specs = [parse_device(text) for text in args.device]
+        if args.config:
+            specs.extend(load_config(args.config))
+    except (DaemonError, IOError, ValueError) as e:
+        parser.error(str(e))
+    if not specs:
+        parser.error("no devices given (use --device or --config)")
+
+    if args.measure and not args.dry_run:
+        parser.error("--measure needs --dry-run")
+    if args.dry_run:
+        if args.measure:
+            try:
+                overhead = measure_overheads(specs)
+            except (DaemonError, registry.RegistryError) as e:
+                print("error: %s" % e, file=sys.stderr)
+                return 1
+        elif args.overhead is not None:
+            overhead = planner.OverheadProfile(per_call=args.overhead)
+        else:
+            overhead = None
+        result = plan(specs, args.bitrate, overhead)
+        print(result.report())
+        return 0 if result.feasible else 1
+
+    filtering = args.deadband is not None or args.relative_deadband is not None or any(spec.deadband is not None or spec.relative_deadband is not None for spec in specs)
+    if args.heartbeat is not None and not filtering:
+        parser.error("--heartbeat needs a deadband")
+
+    stream = open(args.output, "a") if args.output else sys.stdout
+    daemon = Daemon(specs, BufferedWriter(stream, args.buffer_lines, args.flush_interval), FORMATS[args.format], args.shm, filtering, args.deadband or 0.0, args.relative_deadband or 0.0, args.heartbeat, args.log, args.retries, log_flush_interval=args.flush_interval)
+    try:
+        daemon.open()
+        for adapter, master in sorted(daemon.masters.items()):
+            utilization = daemon.scheduler.utilization(master)
+            if utilization > 1:
+                print("warning: %s is overloaded: reads need an estimated %.0f%% of its bus time" % (adapter, 100 * utilization), file=sys.stderr)
+        daemon.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    except (DaemonError, registry.RegistryError, scheduler.SchedulerError, samplelog.SampleLogError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    finally:
+        if args.stats and daemon.scheduler is not None:
+            print(daemon.scheduler.report(), file=sys.stderr)
+        else:
+            for name, count, error in daemon.failures():
+                print("warning: %s: %d failed reads, last: %s" % (name, count, error), file=sys.stderr)
+        daemon.close()
+        if args.output:
+            stream.close()
+    return 0
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import time
+from array import array
+
+# Maximum number of bytes in a single I2C transaction (Aardvark API limit),
+# used unless the master provides i2c_max_transfer
+_MAX_TRANSFER_BYTES = 65535
+
+# Self-timed write cycle (tWR) is 5ms maximum for 24xx parts, 10ms for some
+# older/low voltage variants.  ACK polling normally returns much sooner; this
+# is only the point at which the device is considered to have failed.
+_WRITE_CYCLE_TIMEOUT = 0.05
+
+class AT24XXError(Exception):
+    pass
+
+def _array(data):
+    """Return data (array, bytes, bytearray, or list of ints) as an array of bytes."""
+    if isinstance(data, array) and data.typecode == 'B':
+        return data
+    return array('B', data)
+
+class AT24XX(object):
+    """24xx family I2C serial EEPROM.
+
+    Reads use sequential reads, so the whole array is read in as few I2C transactions as the addressing scheme allows (one per 256 byte block for parts with a single word address byte, otherwise one per transaction size limit).
+
+    Writes are split into page-aligned page writes.  Completion of the internal write cycle is detected by ACK polling (the device NACKs its address until the cycle is done) rather than a fixed delay.  The poll is deferred until the next access to the device, so write() returns as soon as the last page has been sent; call wait_ready() to block until the data is committed.
+    """
+
+    def __init__(self, master, address, size, page_size, address_bytes, name=None):
+
+        # I2C master object
+        self.master = master
+
+        # I2C slave address
+        self.address = address
+
+        # total memory size in bytes
+        self.size = size
+
+        # page write buffer size in bytes
+        self.page_size = page_size
+
+        # number of word address bytes sent after the slave address
+        self._address_bytes = address_bytes
+
+        # memory addressable by a single slave address; address bits above
+        # this are carried in the low bits of the slave address
+        self._block_size = 1 << (8 * address_bytes)
+
+        # name (e.g. reference designator when assembled on a PCB)
+        self.name = name
+
+        # slave address that has a write cycle in progress, if any
+        self._busy_address = None
+
+    # --- addressing ---
+
+    def _validate_range(self, offset, length):
+        """Raise AT24XXError if the memory range is outside of the device."""
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise AT24XXError("invalid memory range: offset %d, length %d (size %d)" % (offset, length, self.size))
+
+    def _slave_address(self, offset):
+        """Return the slave address used to access the memory offset."""
+        return self.address | (offset // self._block_size)
+
+    def _word_address(self, offset):
+        """Return the word address bytes (MSB first) for the memory offset."""
+        word_address = offset % self._block_size
+        data = array('B')
+        for shift in range(8 * (self._address_bytes - 1), -1, -8):
+            data.append((word_address >> shift) & 0xFF)
+        return data
+
+    # --- write cycle handling ---
+
+    @property
+    def busy(self):
+        """True if a write cycle was started and has not been confirmed complete."""
+        return self._busy_address is not None
+
+    def wait_ready(self, timeout=_WRITE_CYCLE_TIMEOUT):
+        """Block until any outstanding write cycle is complete.
+
+        Raise AT24XXError if the device does not acknowledge within timeout seconds.
+        """
+        if self._busy_address is None:
+            return
+        deadline = time.time() + timeout
+        while not self.master.i2c_probe(self._busy_address):
+            if time.time() > deadline:
+                raise AT24XXError("write cycle did not complete within %.3fs" % timeout)
+        self._busy_address = None
+
+    # --- memory access ---
+
+    def read(self, offset=0, length=None):
+        """Return length bytes starting at offset as an array of bytes.
+
+        If length is not provided, read to the end of the memory.
+        """
+        if length is None:
+            length = self.size - offset
+        self._validate_range(offset, length)
+        self.wait_ready()
+        data = array('B')
+        end = offset + length
+        while offset < end:
+            block_end = (offset // self._block_size + 1) * self._block_size
+            num_bytes = min(end, block_end) - offset
+            num_bytes = min(num_bytes, getattr(self.master, 'i2c_max_transfer', _MAX_TRANSFER_BYTES))
+            data_in = self.master.i2c_write_read(self._slave_address(offset), self._word_address(offset), num_bytes)
+            data.extend(data_in[:num_bytes])
+            offset += num_bytes
+        return data
+
+    def write(self, offset, data):
+        """Write data (array, bytes, bytearray, or list of ints) starting at offset.
+
+        The data is split into page writes that never cross a page boundary.  The final write cycle is not waited on; see wait_ready().
+        """
+        data = _array(data)
+        self._validate_range(offset, len(data))
+        index = 0
+        while index < len(data):
+            page_end = (offset // self.page_size + 1) * self.page_size
+            num_bytes = min(len(data) - index, page_end - offset)
+            slave_address = self._slave_address(offset)
+            data_out = self._word_address(offset)
+            data_out.extend(data[index:index + num_bytes])
+            self.wait_ready()
+            self.master.i2c_write(slave_address, data_out)
+            self._busy_address = slave_address
+            offset += num_bytes
+            index += num_bytes
+
+class AT24C01(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=128, page_size=8, address_bytes=1, name=name)
+
+class AT24C02(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=256, page_size=8, address_bytes=1, name=name)
+
+class AT24C04(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=512, page_size=16, address_bytes=1, name=name)
+
+class AT24C08(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=1024, page_size=16, address_bytes=1, name=name)
+
+class AT24C16(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=2048, page_size=16, address_bytes=1, name=name)
+
+class AT24C32(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=4096, page_size=32, address_bytes=2, name=name)
+
+class AT24C64(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=8192, page_size=32, address_bytes=2, name=name)
+
+class AT24C128(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=16384, page_size=64, address_bytes=2, name=name)
+
+class AT24C256(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=32768, page_size=64, address_bytes=2, name=name)
+
+class AT24C512(AT24XX):
+
+    def __init__(self, master, address, name=None):
+        AT24XX.__init__(self, master=master, address=address, size=65536, page_size=128, address_bytes=2, name=name)
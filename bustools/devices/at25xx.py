@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+import time
+from array import array
+
+# instruction set
+_WREN = 0x06
+_WRDI = 0x04
+_RDSR = 0x05
+_WRSR = 0x01
+_READ = 0x03
+_WRITE = 0x02
+
+# status register bits
+_STATUS_WIP = 0x01
+_STATUS_WEL = 0x02
+
+# Maximum number of bytes in a single SPI transaction (Aardvark API limit)
+_MAX_TRANSFER_BYTES = 65535
+
+# Self-timed write cycle (tWC) is 5ms maximum for 25xx parts.  WIP polling
+# normally returns much sooner; this is only the point at which the device is
+# considered to have failed.
+_WRITE_CYCLE_TIMEOUT = 0.05
+
+class AT25XXError(Exception):
+    pass
+
+def _array(data):
+    """Return data (array, bytes, bytearray, or list of ints) as an array of bytes."""
+    if isinstance(data, array) and data.typecode == 'B':
+        return data
+    return array('B', data)
+
+class AT25XX(object):
+    """25xx family SPI serial EEPROM.
+
+    The master must provide spi_write(data_out), a full duplex transfer with slave select asserted for its duration, that returns the bytes clocked in.  The SPI master should be configured for mode 0 or mode 3, MSB first.
+
+    Reads are a single READ instruction per transaction size limit.  Writes are split into page-aligned WRITE instructions.  All page frames are encoded up front, and completion of each write cycle is detected by polling the WIP bit of the status register, so the only work done between pages is on the bus.  The poll for the last page is deferred until the next access to the device, so write() returns as soon as the last page has been sent; call wait_ready() to block until the data is committed.
+    """
+
+    def __init__(self, master, size, page_size, address_bytes, name=None):
+
+        # SPI master object
+        self.master = master
+
+        # total memory size in bytes
+        self.size = size
+
+        # page write buffer size in bytes
+        self.page_size = page_size
+
+        # number of address bytes sent after the instruction
+        self._address_bytes = address_bytes
+
+        # name (e.g. reference designator when assembled on a PCB)
+        self.name = name
+
+        # True if a write cycle was started and not confirmed complete
+        self._busy = False
+
+    # --- addressing ---
+
+    def _validate_range(self, offset, length):
+        """Raise AT25XXError if the memory range is outside of the device."""
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise AT25XXError("invalid memory range: offset %d, length %d (size %d)" % (offset, length, self.size))
+
+    def _header(self, instruction, offset):
+        """Return the instruction and address bytes for an access at offset.
+
+        Parts with a single address byte and more than 256 bytes (e.g. 25040) carry address bit A8 in bit 3 of the instruction.
+        """
+        address_bits = 8 * self._address_bytes
+        data = array('B', [instruction | (((offset >> address_bits) & 0x1) << 3)])
+        for shift in range(address_bits - 8, -1, -8):
+            data.append((offset >> shift) & 0xFF)
+        return data
+
+    # --- status register ---
+
+    def _write_enable(self):
+        self.master.spi_write(array('B', [_WREN]))
+
+    @property
+    def _status_register(self):
+        return self.master.spi_write(array('B', [_RDSR, 0]))[1]
+
+    @_status_register.setter
+    def _status_register(self, value):
+        self.wait_ready()
+        self._write_enable()
+        self.master.spi_write(array('B', [_WRSR, value & 0xFF]))
+        self._busy = True
+
+    # --- write cycle handling ---
+
+    @property
+    def busy(self):
+        """True if a write cycle was started and has not been confirmed complete."""
+        return self._busy
+
+    def wait_ready(self, timeout=_WRITE_CYCLE_TIMEOUT):
+        """Block until any outstanding write cycle is complete.
+
+        Raise AT25XXError if the WIP bit does not clear within timeout seconds.
+        """
+        if not self._busy:
+            return
+        deadline = time.time() + timeout
+        rdsr = array('B', [_RDSR, 0])
+        while self.master.spi_write(rdsr)[1] & _STATUS_WIP:
+            if time.time() > deadline:
+                raise AT25XXError("write cycle did not complete within %.3fs" % timeout)
+        self._busy = False
+
+    # --- memory access ---
+
+    def read(self, offset=0, length=None):
+        """Return length bytes starting at offset as an array of bytes.
+
+        If length is not provided, read to the end of the memory.
+        """
+        if length is None:
+            length = self.size - offset
+        self._validate_range(offset, length)
+        self.wait_ready()
+        data = array('B')
+        header_bytes = 1 + self._address_bytes
+        end = offset + length
+        while offset < end:
+            num_bytes = min(end - offset, _MAX_TRANSFER_BYTES - header_bytes)
+            data_out = self._header(_READ, offset)
+            data_out.extend(array('B', [0]) * num_bytes)
+            data.extend(self.master.spi_write(data_out)[header_bytes:])
+            offset += num_bytes
+        return data
+
+    def _page_frames(self, offset, data):
+        """Return the list of WRITE frames for data, split on page boundaries."""
+        frames = []
+        index = 0
+        while index < len(data):
+            page_end = (offset // self.page_size + 1) * self.page_size
+            num_bytes = min(len(data) - index, page_end - offset)
+            frame = self._header(_WRITE, offset)
+            frame.extend(data[index:index + num_bytes])
+            frames.append(frame)
+            offset += num_bytes
+            index += num_bytes
+        return frames
+
+    def write(self, offset, data):
+        """Write data (array, bytes, bytearray, or list of ints) starting at offset.
+
+        The data is split into page writes that never cross a page boundary.  The final write cycle is not waited on; see wait_ready().
+        """
+        data = _array(data)
+        self._validate_range(offset, len(data))
+        wren = array('B', [_WREN])
+        for frame in self._page_frames(offset, data):
+            self.wait_ready()
+            self.master.spi_write(wren)
+            self.master.spi_write(frame)
+            self._busy = True
+
+class AT25010(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=128, page_size=8, address_bytes=1, name=name)
+
+class AT25020(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=256, page_size=8, address_bytes=1, name=name)
+
+class AT25040(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=512, page_size=8, address_bytes=1, name=name)
+
+class AT25080(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=1024, page_size=32, address_bytes=2, name=name)
+
+class AT25160(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=2048, page_size=32, address_bytes=2, name=name)
+
+class AT25320(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=4096, page_size=32, address_bytes=2, name=name)
+
+class AT25640(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=8192, page_size=32, address_bytes=2, name=name)
+
+class AT25128(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=16384, page_size=64, address_bytes=2, name=name)
+
+class AT25256(AT25XX):
+
+    def __init__(self, master, name=None):
+        AT25XX.__init__(self, master=master, size=32768, page_size=64, address_bytes=2, name=name)
@@ -1,23 +1,48 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 import math
-from array import array
 
-_REGISTER_BYTE_WIDTH = 2
+import bustools.adapters as adapters
+import bustools.devices.registers as registers
+
 _CONFIGURATION_REGISTER = 0x00
 _SHUNT_VOLTAGE_REGISTER = 0x01
 _BUS_VOLTAGE_REGISTER = 0x02
 _POWER_REGISTER = 0x03
 _CURRENT_REGISTER = 0x04
 _CALIBRATION_REGISTER = 0x05
-_REGISTERS = [
-    _CONFIGURATION_REGISTER,
-    _SHUNT_VOLTAGE_REGISTER,
-    _BUS_VOLTAGE_REGISTER,
-    _POWER_REGISTER,
-    _CURRENT_REGISTER,
-    _CALIBRATION_REGISTER
-]
+_REGISTER_MAP = registers.RegisterMap([
+    registers.Register('configuration', _CONFIGURATION_REGISTER, 2, volatile=False, fields=[
+        registers.Field('RST', 15),
+        registers.Field('BRNG', 13),
+        registers.Field('PG', 11, 2, bits=['PG1', 'PG0']),
+        registers.Field('BADC', 7, 4),
+        registers.Field('SADC', 3, 4),
+        registers.Field('MODE', 0, 3)
+    ]),
+    registers.Register('shunt_voltage', _SHUNT_VOLTAGE_REGISTER, 2, signed=True),
+    registers.Register('bus_voltage', _BUS_VOLTAGE_REGISTER, 2, fields=[
+        registers.Field('BD', 3, 13),
+        registers.Field('CNVR', 1),
+        registers.Field('OVF', 0)
+    ]),
+    registers.Register('power', _POWER_REGISTER, 2),
+    registers.Register('current', _CURRENT_REGISTER, 2, signed=True),
+    registers.Register('calibration', _CALIBRATION_REGISTER, 2, volatile=False, fields=[
+        registers.Field('FS', 1, 15)
+    ])
+])
+_REGISTERS = _REGISTER_MAP.addresses()
+
+_RST = _REGISTER_MAP[_CONFIGURATION_REGISTER].field('RST')
+_BADC = _REGISTER_MAP[_CONFIGURATION_REGISTER].field('BADC')
+_SADC = _REGISTER_MAP[_CONFIGURATION_REGISTER].field('SADC')
+_MODE = _REGISTER_MAP[_CONFIGURATION_REGISTER].field('MODE')
+_BD = _REGISTER_MAP[_BUS_VOLTAGE_REGISTER].field('BD')
+_CNVR = _REGISTER_MAP[_BUS_VOLTAGE_REGISTER].field('CNVR')
+_OVF = _REGISTER_MAP[_BUS_VOLTAGE_REGISTER].field('OVF')
 
 # Shunt voltage register LSB is constant for all PGA settings
 # At PGA = 8, 320mV / 2^15 = ~10uV
@@ -34,118 +59,130 @@ _SHUNT_VOLTAGE_REGISTER_LSB = 0.00001
 # _BUS_VOLTAGE_REGISTER_LSB = float(16) / float(4096)
 _BUS_VOLTAGE_REGISTER_LSB = 0.004
 
+# ADC resolution and averaging settings (BADC/SADC values): (setting, bits,
+# samples averaged, conversion time in seconds), by increasing conversion time
+_ADC_SETTINGS = [
+    (0x0, 9, 1, 84e-6),
+    (0x1, 10, 1, 148e-6),
+    (0x2, 11, 1, 276e-6),
+    (0x3, 12, 1, 532e-6),
+    (0x9, 12, 2, 1.06e-3),
+    (0xA, 12, 4, 2.13e-3),
+    (0xB, 12, 8, 4.26e-3),
+    (0xC, 12, 16, 8.51e-3),
+    (0xD, 12, 32, 17.02e-3),
+    (0xE, 12, 64, 34.05e-3),
+    (0xF, 12, 128, 68.10e-3)
+]
+
 # --- helper functions ---
 
+def _register(register):
+    """Return the Register description, raise INA219Error if the register is invalid"""
+    description = _REGISTER_MAP.get(register)
+    if description is None:
+        raise INA219Error("invalid register: %s" % register)
+    return description
+
 def _validate_register(register):
     """Raise INA219Error if the register is invalid"""
-    if not (register in _REGISTERS):
-        raise INA219Error("invalid register: %s" % register)
+    _register(register)
 
 def _raw_bus_voltage_ovf(bus_voltage_register):
     """The Math Overflow Flag (OVF) is set when the power or current calculations are out of range"""
-    return bus_voltage_register & 0x1
+    return _OVF.get(bus_voltage_register)
 
 def _raw_bus_voltage_cnvr(bus_voltage_register):
     """The CNVR bit is set after all conversions, averaging, and multiplications are complete"""
-    return (bus_voltage_register >> 1) & 0x1
+    return _CNVR.get(bus_voltage_register)
 
 def _raw_bus_voltage(bus_voltage_register):
     """Extract the raw bus voltage bits from the bus voltage register value"""
-    return (bus_voltage_register >> 3) & 0x0FFF
+    return _BD.get(bus_voltage_register)
 
 def print_shunt_voltage(shunt_voltage):
-    print "Shunt Voltage: {0}V".format(shunt_voltage)
+    print("Shunt Voltage: {0}V".format(shunt_voltage))
 
 def print_shunt_voltage_mV(shunt_voltage):
-    print "Shunt Voltage: {0}mV".format(shunt_voltage * 1000)
+    print("Shunt Voltage: {0}mV".format(shunt_voltage * 1000))
 
 def print_current(current):
-    print "Current: {0}A".format(current)
+    print("Current: {0}A".format(current))
 
 def print_current_mA(current):
-    print "Current: {0}mA".format(current * 1000)
+    print("Current: {0}mA".format(current * 1000))
 
 def print_bus_voltage(bus_voltage):
-    print "Bus Voltage: {0}V".format(bus_voltage)
+    print("Bus Voltage: {0}V".format(bus_voltage))
 
 def print_bus_voltage_mV(bus_voltage):
-    print "Bus Voltage: {0}mV".format(bus_voltage * 1000)
+    print("Bus Voltage: {0}mV".format(bus_voltage * 1000))
 
 def print_power(power):
-    print "Power: {0}W".format(power)
+    print("Power: {0}W".format(power))
 
 def print_power_mW(power):
-    print "Power: {0}mW".format(power * 1000)
+    print("Power: {0}mW".format(power * 1000))
 
 def _pretty_print_registers(address, configuration_register, shunt_voltage_register, bus_voltage_register, power_register, current_register, calibration_register):
-    print "----------------------------------------------------"
-    print "| INA219 0x{0:02X} Register | Hex    | Binary           |".format(address)
-    print "|--------------------------------------------------|"
-    print "| Configuration (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CONFIGURATION_REGISTER, configuration_register)
-    print "| Shunt Voltage (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_SHUNT_VOLTAGE_REGISTER, shunt_voltage_register)
-    print "| Bus Voltage   (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_BUS_VOLTAGE_REGISTER, bus_voltage_register)
-    print "| Power         (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_POWER_REGISTER, power_register)
-    print "| Current       (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CURRENT_REGISTER, current_register)
-    print "| Calibration   (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CALIBRATION_REGISTER, calibration_register)
-    print "----------------------------------------------------"
+    print("----------------------------------------------------")
+    print("| INA219 0x{0:02X} Register | Hex    | Binary           |".format(address))
+    print("|--------------------------------------------------|")
+    print("| Configuration (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CONFIGURATION_REGISTER, configuration_register))
+    print("| Shunt Voltage (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_SHUNT_VOLTAGE_REGISTER, shunt_voltage_register))
+    print("| Bus Voltage   (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_BUS_VOLTAGE_REGISTER, bus_voltage_register))
+    print("| Power         (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_POWER_REGISTER, power_register))
+    print("| Current       (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CURRENT_REGISTER, current_register))
+    print("| Calibration   (0x{0:02X}) | 0x{1:04X} | {1:016b} |".format(_CALIBRATION_REGISTER, calibration_register))
+    print("----------------------------------------------------")
 
 def _pretty_print_configuration(configuration_register):
-    rst = (configuration_register >> 15) & 0x1
-    d14 = (configuration_register >> 14) & 0x1
-    brng = (configuration_register >> 13) & 0x1
-    pg1 = (configuration_register >> 12) & 0x1
-    pg0 = (configuration_register >> 11) & 0x1
-    badc4 = (configuration_register >> 10) & 0x1
-    badc3 = (configuration_register >> 9) & 0x1
-    badc2 = (configuration_register >> 8) & 0x1
-    badc1 = (configuration_register >> 7) & 0x1
-    sadc4 = (configuration_register >> 6) & 0x1
-    sadc3 = (configuration_register >> 5) & 0x1
-    sadc2 = (configuration_register >> 4) & 0x1
-    sadc1 = (configuration_register >> 3) & 0x1
-    mode3 = (configuration_register >> 2) & 0x1
-    mode2 = (configuration_register >> 1) & 0x1
-    mode1 = configuration_register & 0x1
-    print "--------------------------"
-    print "| Configuration Register |"
-    print "|------------------------|"
-    print "| Bit | Bit Name | Value |"
-    print "|------------------------|"
-    print "| D15 | RST      | {0:^5} |".format(rst)
-    print "| D14 | -        | {0:^5} |".format(d14)
-    print "| D13 | BRNG     | {0:^5} |".format(brng)
-    print "| D12 | PG1      | {0:^5} |".format(pg1)
-    print "| D11 | PG0      | {0:^5} |".format(pg0)
-    print "| D10 | BADC4    | {0:^5} |".format(badc4)
-    print "| D9  | BADC3    | {0:^5} |".format(badc3)
-    print "| D8  | BADC2    | {0:^5} |".format(badc2)
-    print "| D7  | BADC1    | {0:^5} |".format(badc1)
-    print "| D6  | SADC4    | {0:^5} |".format(sadc4)
-    print "| D5  | SADC3    | {0:^5} |".format(sadc3)
-    print "| D4  | SADC2    | {0:^5} |".format(sadc2)
-    print "| D3  | SADC1    | {0:^5} |".format(sadc1)
-    print "| D2  | MODE3    | {0:^5} |".format(mode3)
-    print "| D1  | MODE2    | {0:^5} |".format(mode2)
-    print "| D0  | MODE1    | {0:^5} |".format(mode1)
-    print "--------------------------"
+    print("--------------------------")
+    print("| Configuration Register |")
+    print("|------------------------|")
+    print("| Bit | Bit Name | Value |")
+    print("|------------------------|")
+    for bit, bit_name in _REGISTER_MAP[_CONFIGURATION_REGISTER].bit_names():
+        print("| {0:<3} | {1:<8} | {2:^5} |".format("D%d" % bit, bit_name, (configuration_register >> bit) & 0x1))
+    print("--------------------------")
 
 def _pretty_print_bus_voltage(bus_voltage_register):
     ovf = _raw_bus_voltage_ovf(bus_voltage_register)
     cnvr = _raw_bus_voltage_cnvr(bus_voltage_register)
     raw_bus_voltage = _raw_bus_voltage(bus_voltage_register)
-    print "------------------------------"
-    print "| Bus Voltage Register       |"
-    print "|----------------------------|"
-    print "| Bit    | Bit Name | Hex    |"
-    print "|----------------------------|"
-    print "| D3-D15 | BD0-BD12 | 0x{0:04X} |".format(raw_bus_voltage)
-    print "| D1     | CNVR     | 0x{0:<4X} |".format(cnvr)
-    print "| D0     | OVF      | 0x{0:<4X} |".format(ovf)
-    print "------------------------------"
+    print("------------------------------")
+    print("| Bus Voltage Register       |")
+    print("|----------------------------|")
+    print("| Bit    | Bit Name | Hex    |")
+    print("|----------------------------|")
+    print("| D3-D15 | BD0-BD12 | 0x{0:04X} |".format(raw_bus_voltage))
+    print("| D1     | CNVR     | 0x{0:<4X} |".format(cnvr))
+    print("| D0     | OVF      | 0x{0:<4X} |".format(ovf))
+    print("------------------------------")
 
 class INA219Error(Exception):
     pass
 
+class AveragingPlan(object):
+    """ADC setting chosen by INA219.optimize_averaging().
+
+    setting is the BADC/SADC value, bits the ADC resolution and samples the number of conversions averaged in the device.  conversion_time is the time in seconds of a conversion cycle, period the poll period in seconds and noise the predicted RMS current noise in amps.  configuration is the configuration register value with the setting applied.
+    """
+
+    def __init__(self, setting, bits, samples, conversion_time, period, noise, configuration):
+        self.setting = setting
+        self.bits = bits
+        self.samples = samples
+        self.conversion_time = conversion_time
+        self.period = period
+        self.noise = noise
+        self.configuration = configuration
+
+    @property
+    def rate(self):
+        """Poll rate in Hz."""
+        return 1.0 / self.period
+
 class INA219(object):
 
     def __init__(self, master, address, configuration, shunt_resistance, max_expected_current, name=None):
@@ -168,38 +205,120 @@ class INA219(object):
         # max expected current through the shunt resistor in amps
         self.max_expected_current = max_expected_current
 
+        # last value written to or read from each non-volatile register
+        self._cache = {}
+
+        # current and power register LSBs of the calibration written by calibrate()
+        self._current_lsb = None
+        self._power_lsb = None
+
         # configure & calibrate the device
         self.configure()
         self.calibrate()
 
-    def configure(self):
-        self._configuration_register = self.configuration
-
-    def calibrate(self):
-        self._calibration_register = self._calculate_calibration()
-
-    def _calculate_calibration(self):
-        return math.trunc(0.04096 / float(self._current_register_lsb * self.shunt_resistance))
+    def configure(self, force=False):
+        """Write the configuration register, unless it is known to hold the configuration already (force rewrites it)."""
+        if force or self._cache.get(_CONFIGURATION_REGISTER) != _REGISTER_MAP[_CONFIGURATION_REGISTER].readback(self.configuration):
+            self._configuration_register = self.configuration
+
+    def calibrate(self, force=False):
+        """Write the calibration register for the shunt resistance and max expected current, unless it is known to hold that calibration already (force rewrites it)."""
+        current_lsb = self.max_expected_current / float(32767)
+        calibration = self._calculate_calibration(current_lsb)
+        if force or self._cache.get(_CALIBRATION_REGISTER) != _REGISTER_MAP[_CALIBRATION_REGISTER].readback(calibration):
+            self._calibration_register = calibration
+        self._current_lsb = current_lsb
+        self._power_lsb = 20 * current_lsb
+
+    def _calculate_calibration(self, current_lsb=None):
+        if current_lsb is None:
+            current_lsb = self.max_expected_current / float(32767)
+        return math.trunc(0.04096 / float(current_lsb * self.shunt_resistance))
+
+    def _current_noise(self, bits, samples, sample_noise):
+        """Return the predicted RMS current noise in amps of a reading averaged over samples conversions at bits resolution."""
+        # each bit less than 12 doubles the shunt voltage step
+        quantization = _SHUNT_VOLTAGE_REGISTER_LSB * (1 << (12 - bits)) / math.sqrt(12)
+        shunt_voltage_noise = math.sqrt(sample_noise ** 2 + quantization ** 2) / math.sqrt(samples)
+        return math.sqrt((shunt_voltage_noise / self.shunt_resistance) ** 2 + self._current_lsb ** 2 / 12)
+
+    def optimize_averaging(self, noise, bandwidth, sample_noise=_SHUNT_VOLTAGE_REGISTER_LSB, apply=True):
+        """Choose the ADC resolution and averaging for a current noise target and signal bandwidth, and return an AveragingPlan.
+
+        noise is the RMS current noise in amps to reach and bandwidth the bandwidth in Hz to preserve, so the device is polled every 1 / (2 * bandwidth) seconds.  The setting averaging the most conversions in the device whose conversion cycle (shunt voltage and, if the operating mode converts it, bus voltage) fits in the poll period is chosen, so each read returns a new value averaged over most of the period instead of the host averaging many reads.  sample_noise is the RMS noise in volts of a single 12-bit shunt voltage conversion; measure it on the board for accurate predictions.
+
+        The operating mode must be continuous shunt (and bus) voltage conversion: in bus voltage only modes the current never updates, and in triggered modes each poll would have to start a conversion.  Raise INA219Error otherwise, or if no setting reaches noise at bandwidth.  If apply is True, the setting is stored in configuration (for the bus voltage ADC as well, if it is converted) and written with configure().
+        """
+        if noise <= 0 or bandwidth <= 0:
+            raise INA219Error("invalid noise target or bandwidth: %s, %s" % (noise, bandwidth))
+        mode = _MODE.get(self.configuration)
+        # only continuous modes converting the shunt voltage produce a new
+        # current reading every cycle without the host starting conversions
+        if mode & 0x5 != 0x5:
+            raise INA219Error("configuration 0x%04X doesn't continuously convert the shunt voltage" % self.configuration)
+        conversions = 1 + ((mode & 0x2) >> 1)
+        period = 1.0 / (2 * bandwidth)
+        fitting = [setting for setting in _ADC_SETTINGS if conversions * setting[3] <= period]
+        if not fitting:
+            raise INA219Error("a %sHz bandwidth is beyond the fastest conversion cycle (%.0fus)" % (bandwidth, 1e6 * conversions * _ADC_SETTINGS[0][3]))
+        setting, bits, samples, conversion_time = fitting[-1]
+        predicted = self._current_noise(bits, samples, sample_noise)
+        if predicted > noise:
+            raise INA219Error("%sA RMS noise is not reachable at a %sHz bandwidth (best: %.3gA with %d samples)" % (noise, bandwidth, predicted, samples))
+        configuration = _SADC.set(self.configuration, setting)
+        if mode & 0x2:
+            configuration = _BADC.set(configuration, setting)
+        plan = AveragingPlan(setting, bits, samples, conversions * conversion_time, period, predicted, configuration)
+        if apply:
+            self.configuration = configuration
+            self.configure()
+        return plan
+
+    def verify(self):
+        """Read the non-volatile registers (configuration and calibration) from the device and update their cached values.
+
+        Return the list of names of the registers whose cached value didn't match the device, e.g. after a reset or a write by another master.
+        """
+        stale = []
+        for register in (_CONFIGURATION_REGISTER, _CALIBRATION_REGISTER):
+            cached = self._cache.get(register)
+            if cached is not None and self._read_register(register, verify=True) != cached:
+                stale.append(_REGISTER_MAP[register].name)
+        return stale
 
     # --- low level register access ---
 
     def _write_register(self, register, value=None):
-        _validate_register(register)
-        data = array('B', [0])
-        data[0] = register
-        if value:
-            value_msb = (value >> 8) & 0xFF
-            value_lsb = value & 0xFF
-            data.insert(1, value_msb)
-            data.insert(2, value_lsb)
-        self.master.i2c_write(self.address, data)
-
-    def _read_register(self, register):
-        _validate_register(register)
-        data_out = array('B', [0])
-        data_out[0] = register
-        data_in = self.master.i2c_write_read(self.address, data_out, _REGISTER_BYTE_WIDTH)
-        return (data_in[0] << 8) + data_in[1]
+        description = _register(register)
+        self.master.i2c_write(self.address, description.encode_command(value))
+        if value is not None and not description.volatile:
+            if register == _CONFIGURATION_REGISTER and _RST.get(value):
+                # the reset restores the defaults and self-clears
+                self._cache.clear()
+            else:
+                self._cache[register] = description.readback(value)
+
+    def _read_register(self, register, verify=False):
+        """Read a register; non-volatile registers are served from the cache unless verify is True."""
+        description = _register(register)
+        if not description.volatile and not verify and register in self._cache:
+            return self._cache[register]
+        value = description.decode(self.master.i2c_write_read(self.address, description.command, description.width))
+        if not description.volatile:
+            self._cache[register] = value
+        return value
+
+    def _read_registers(self, registers, verify=False):
+        """Read a list of registers in a single batch if the master supports it; non-volatile registers are served from the cache unless verify is True."""
+        descriptions = [_register(register) for register in registers]
+        values = [self._cache.get(register) if not description.volatile and not verify else None for register, description in zip(registers, descriptions)]
+        missing = [i for i, value in enumerate(values) if value is None]
+        transactions = [(self.address, descriptions[i].command, descriptions[i].width) for i in missing]
+        for i, data_in in zip(missing, adapters.i2c_transfer(self.master, transactions) if transactions else []):
+            values[i] = descriptions[i].decode(data_in)
+            if not descriptions[i].volatile:
+                self._cache[registers[i]] = values[i]
+        return values
 
     # --- register properties ---
 
@@ -247,11 +366,11 @@ class INA219(object):
 
     @property
     def _current_register_lsb(self):
-        return self.max_expected_current / float(32767)
+        return self._current_lsb
 
     @property
     def _power_register_lsb(self):
-        return 20 * self._current_register_lsb
+        return self._power_lsb
 
     # --- normalized results ---
 
@@ -276,13 +395,37 @@ class INA219(object):
         """Current in amps"""
         return self._current_register * self._current_register_lsb
 
+    def measurements(self):
+        """Shunt voltage in volts, bus voltage in volts, current in amps, power in watts, read in a single batch"""
+        shunt_voltage_register, bus_voltage_register, current_register, power_register = self._read_registers([_SHUNT_VOLTAGE_REGISTER, _BUS_VOLTAGE_REGISTER, _CURRENT_REGISTER, _POWER_REGISTER])
+        return (shunt_voltage_register * self._shunt_voltage_register_lsb,
+                _raw_bus_voltage(bus_voltage_register) * self._bus_voltage_register_lsb,
+                current_register * self._current_register_lsb,
+                power_register * self._power_register_lsb)
+
+    def reader(self, quantity):
+        """Return a function of no arguments that reads quantity ('shunt_voltage', 'bus_voltage', 'current' or 'power') in SI units, for hot polling loops.
+
+        The register is validated and its command, codec and scale factor are resolved once, so each call is a single master transaction and a multiply.  The scale is fixed when the reader is made; make a new reader after changing the calibration.
+        """
+        if quantity == 'shunt_voltage':
+            return _REGISTER_MAP[_SHUNT_VOLTAGE_REGISTER].reader(self.master, self.address, scale=self._shunt_voltage_register_lsb)
+        if quantity == 'bus_voltage':
+            return _REGISTER_MAP[_BUS_VOLTAGE_REGISTER].reader(self.master, self.address, scale=self._bus_voltage_register_lsb, shift=_BD.shift)
+        if quantity == 'current':
+            return _REGISTER_MAP[_CURRENT_REGISTER].reader(self.master, self.address, scale=self._current_register_lsb)
+        if quantity == 'power':
+            return _REGISTER_MAP[_POWER_REGISTER].reader(self.master, self.address, scale=self._power_register_lsb)
+        raise INA219Error("invalid quantity: %s" % quantity)
+
     # --- debugging helper methods ---
 
-    def _dump_registers(self):
-        _pretty_print_registers(self.address, self._configuration_register, self._shunt_voltage_register, self._bus_voltage_register, self._power_register, self._current_register, self._calibration_register)
+    def _dump_registers(self, verify=False):
+        # print the raw bit patterns of the signed registers
+        _pretty_print_registers(self.address, *[value & 0xFFFF for value in self._read_registers(_REGISTERS, verify)])
 
-    def _dump_configuration_register(self):
-        _pretty_print_configuration(self._configuration_register)
+    def _dump_configuration_register(self, verify=False):
+        _pretty_print_configuration(self._read_register(_CONFIGURATION_REGISTER, verify))
 
     def _dump_bus_voltage_register(self):
         _pretty_print_bus_voltage(self._bus_voltage_register)
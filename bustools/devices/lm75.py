@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 import platform
-from array import array
+
+import bustools.devices.registers as registers
 
 class LM75Error(Exception):
     pass
@@ -11,61 +14,58 @@ _CONFIGURATION_REGISTER = 0x01
 _HYSTERESIS_REGISTER = 0x02
 _OVERTEMPERATURE_SHUTDOWN_REGISTER = 0x03
 
-_REGISTER_TYPES = [
-    _TEMPERATURE_REGISTER,
-    _CONFIGURATION_REGISTER,
-    _HYSTERESIS_REGISTER,
-    _OVERTEMPERATURE_SHUTDOWN_REGISTER
-]
-
-_REGISTER_WIDTH = {
-    _TEMPERATURE_REGISTER: 2,
-    _CONFIGURATION_REGISTER: 1,
-    _HYSTERESIS_REGISTER: 2,
-    _OVERTEMPERATURE_SHUTDOWN_REGISTER: 2
-}
+_REGISTER_MAP = registers.RegisterMap([
+    registers.Register('temperature', _TEMPERATURE_REGISTER, 2, signed=True, fields=[
+        registers.Field('T', 5, 11)
+    ]),
+    registers.Register('configuration', _CONFIGURATION_REGISTER, 1, volatile=False, fields=[
+        registers.Field('OS_F_QUE', 3, 2),
+        registers.Field('OS_POL', 2),
+        registers.Field('OS_COMP_INT', 1),
+        registers.Field('SHUTDOWN', 0)
+    ]),
+    registers.Register('hysteresis', _HYSTERESIS_REGISTER, 2, signed=True, volatile=False, fields=[
+        registers.Field('THYST', 7, 9)
+    ]),
+    registers.Register('overtemperature_shutdown', _OVERTEMPERATURE_SHUTDOWN_REGISTER, 2, signed=True, volatile=False, fields=[
+        registers.Field('TOS', 7, 9)
+    ])
+])
+_REGISTER_TYPES = _REGISTER_MAP.addresses()
+
+_REGISTER_WIDTH = dict((register.address, register.width) for register in _REGISTER_MAP.registers)
 
 def _temperature(temperature_register, farenheight=False):
     """Return the temperature in Celsius given the raw temperature register value.
 
-    If farenheight is True, return the temperature in Farenheight.
+    The value may be signed or the raw 16 bit two's complement pattern.  If farenheight is True, return the temperature in Farenheight.
     """
-    temp = (0xFF & (temperature_register >> 8)) + ((0x7 & (temperature_register >> 5)) / 8.0)
+    if temperature_register >= 0x8000:
+        temperature_register -= 0x10000
+    temp = (temperature_register >> 5) / 8.0
     if farenheight:
         temp = (((9 * temp) / 5.0) + 32)
     return temp
 
+def _register(register_type):
+    """Return the Register description, raise LM75Error if the register is invalid."""
+    description = _REGISTER_MAP.get(register_type)
+    if description is None:
+        raise LM75Error("invalid register type: %s" % register_type)
+    return description
+
 def _validate_register_type(register_type):
     """Raise LM75Error if the register is invalid."""
-    if not (register_type in _REGISTER_TYPES):
-        raise LM75Error("invalid register type: %s" % register_type)
+    _register(register_type)
 
 def _read_register(master, address, register):
     """Read a register."""
-    _validate_register_type(register)
-    data_out = array('B', [0])
-    data_out[0] = register
-    data_in = master.i2c_write_read(address, data_out, _REGISTER_WIDTH[register])
-    value = 0
-    if _REGISTER_WIDTH[register] == 1:
-        value = data_in[0]
-    elif _REGISTER_WIDTH[register] == 2:
-        value = ((0xFF & data_in[0]) << 8) + (0xFF & data_in[1])
-    return value
+    description = _register(register)
+    return description.decode(master.i2c_write_read(address, description.command, description.width))
 
 def _write_register(master, address, register, value=None):
-    """Write a register."""
-    _validate_register_type(register)
-    data = array('B', [0])
-    data[0] = register
-    if _REGISTER_WIDTH[register] == 1:
-        data.insert(1, 0xFF & value)
-    elif _REGISTER_WIDTH[register] == 2:
-        data.insert(1, 0xFF & value)
-        data.insert(2, 0xFF & (value >> 8))
-    else:
-        raise LM75Error("invalid register width")
-    master.i2c_write(address, data)
+    """Write a register (MSB first), or only set the register pointer if value is None."""
+    master.i2c_write(address, _register(register).encode_command(value))
 
 class LM75(object):
 
@@ -83,13 +83,38 @@ class LM75(object):
         # name (e.g. reference designator when assembled on a PCB)
         self.name = name
 
+        # last value written to or read from each non-volatile register
+        self._cache = {}
+
+    def verify(self):
+        """Read the non-volatile registers (configuration, hysteresis and overtemperature shutdown) from the device and update their cached values.
+
+        Return the list of names of the registers whose cached value didn't match the device, e.g. after a power cycle or a write by another master.
+        """
+        stale = []
+        for register in (_CONFIGURATION_REGISTER, _HYSTERESIS_REGISTER, _OVERTEMPERATURE_SHUTDOWN_REGISTER):
+            cached = self._cache.get(register)
+            if cached is not None and self._read_register(register, verify=True) != cached:
+                stale.append(_REGISTER_MAP[register].name)
+        return stale
+
     # --- low level register access ---
 
-    def _read_register(self, register):
-        return _read_register(self.master, self.address, register)
+    def _read_register(self, register, verify=False):
+        """Read a register; non-volatile registers are served from the cache unless verify is True."""
+        description = _register(register)
+        if not description.volatile and not verify and register in self._cache:
+            return self._cache[register]
+        value = _read_register(self.master, self.address, register)
+        if not description.volatile:
+            self._cache[register] = value
+        return value
 
     def _write_register(self, register, value=None):
         _write_register(self.master, self.address, register, value)
+        description = _register(register)
+        if value is not None and not description.volatile:
+            self._cache[register] = description.readback(value)
 
     # --- register properties ---
 
@@ -124,10 +149,22 @@ class LM75(object):
     def temperature(self, farenheight=False):
         return _temperature(self._temperature_register, farenheight)
 
+    def reader(self, quantity='temperature', farenheight=False):
+        """Return a function of no arguments that reads the temperature in Celsius (or Farenheight), for hot polling loops.
+
+        The command, codec and scale factor are resolved once, so each call is a single master transaction and a multiply.
+        """
+        if quantity != 'temperature':
+            raise LM75Error("invalid quantity: %s" % quantity)
+        shift = _REGISTER_MAP[_TEMPERATURE_REGISTER].field('T').shift
+        if farenheight:
+            return _REGISTER_MAP[_TEMPERATURE_REGISTER].reader(self.master, self.address, scale=9 / 40.0, shift=shift, offset=32.0)
+        return _REGISTER_MAP[_TEMPERATURE_REGISTER].reader(self.master, self.address, scale=1 / 8.0, shift=shift)
+
     def print_temperature(self, farenheight=False):
         temp = self.temperature(farenheight=farenheight)
         deg = '' if platform.system() in ('Windows', 'Microsoft') else '°'
         if farenheight:
-            print "%.2f" % temp + deg + 'F'
+            print("%.2f" % temp + deg + 'F')
         else:
-            print "%.2f" % temp + deg + 'C'
+            print("%.2f" % temp + deg + 'C')
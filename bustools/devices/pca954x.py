@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+import bustools.adapters as adapters
+
+class PCA954xError(Exception):
+    pass
+
+class Channel(object):
+    """I2C master for the devices on one downstream channel of a PCA954x multiplexer.
+
+    A Channel provides the same interface as the upstream master, so it can be passed as the master of any device driver.  The channel is selected before each transaction only if it is not already selected.
+    """
+
+    def __init__(self, mux, number):
+        self._mux = mux
+        self.number = number
+
+    def __getattr__(self, name):
+        return getattr(self._mux.master, name)
+
+    @property
+    def i2c_bitrate(self):
+        """I2C bit rate in kHz of the upstream master, shared by all channels."""
+        return self._mux.master.i2c_bitrate
+
+    @i2c_bitrate.setter
+    def i2c_bitrate(self, value):
+        self._mux.master.i2c_bitrate = value
+
+    @property
+    def i2c_upstream(self):
+        """The upstream master of the multiplexer, whose bus the channel shares (see bustools.adapters.root_master())."""
+        return self._mux.master
+
+    def i2c_write(self, address, data):
+        """Write an array of bytes to an I2C slave device on this channel."""
+        self._mux._select(self.number)
+        self._mux.master.i2c_write(address, data)
+
+    def i2c_write_read(self, address, data_out, num_bytes):
+        """Atomic write+read an array of bytes to an I2C slave device on this channel."""
+        self._mux._select(self.number)
+        return self._mux.master.i2c_write_read(address, data_out, num_bytes)
+
+    def i2c_transfer(self, transactions):
+        """Issue a sequence of (address, data_out, num_bytes) transactions on this channel (see bustools.adapters).
+
+        If a channel select is needed it is issued as part of the same batch.
+        """
+        return self._mux.transfer([(self.number, address, data_out, num_bytes) for address, data_out, num_bytes in transactions])
+
+    def i2c_probe(self, address):
+        """Return True if an I2C slave on this channel acknowledges its address, otherwise False."""
+        self._mux._select(self.number)
+        return self._mux.master.i2c_probe(address)
+
+class PCA954X(object):
+    """PCA954x I2C multiplexer/switch.
+
+    channels is the list of Channel masters, one per downstream bus.  The channel currently selected in the control register is cached, so a select write is only issued when the channel changes.  If anything else may change the control register (e.g. the mux is reset, or another master on the upstream bus accesses it), call invalidate() so the next transaction selects its channel again.
+    """
+
+    def __init__(self, master, address, channels, name=None):
+
+        # I2C master object
+        self.master = master
+
+        # I2C slave address
+        self.address = address
+
+        # name (e.g. reference designator when assembled on a PCB)
+        self.name = name
+
+        # currently selected channel number, None if unknown
+        self._selected = None
+
+        # initialize channels
+        self.channels = []
+        for number in range(channels):
+            self.channels.append(Channel(mux=self, number=number))
+
+    # --- channel selection ---
+
+    def _validate_channel(self, number):
+        """Raise PCA954xError if the channel number is invalid."""
+        if not (0 <= number < len(self.channels)):
+            raise PCA954xError("invalid channel: %s" % number)
+
+    def _control_register(self, number):
+        """Return the control register value that selects only the given channel."""
+        return 1 << number
+
+    def _select_transaction(self, number):
+        return (self.address, array('B', [self._control_register(number)]), 0)
+
+    def _select(self, number):
+        """Select the channel, unless it is already selected."""
+        if self._selected == number:
+            return
+        self._validate_channel(number)
+        self._selected = None
+        self.master.i2c_write(self.address, array('B', [self._control_register(number)]))
+        self._selected = number
+
+    @property
+    def selected(self):
+        """Currently selected channel number, None if unknown."""
+        return self._selected
+
+    def invalidate(self):
+        """Forget the selected channel, so the next transaction selects its channel again."""
+        self._selected = None
+
+    def deselect(self):
+        """Disconnect all downstream channels."""
+        self._selected = None
+        self.master.i2c_write(self.address, array('B', [0]))
+
+    # --- batched transactions ---
+
+    def transfer(self, operations):
+        """Issue a list of (channel, address, data_out, num_bytes) operations and return the list of arrays of bytes read, in operation order.
+
+        Operations are grouped by channel, starting with the currently selected channel, so each channel is selected at most once.  The selects and the operations are issued as a single batch (see bustools.adapters.i2c_transfer).  Operations on the same channel keep their relative order.
+        """
+        for operation in operations:
+            self._validate_channel(operation[0])
+        current = self._selected
+
+        def group(index):
+            number = operations[index][0]
+            return (number != current, number, index)
+
+        order = sorted(range(len(operations)), key=group)
+        transactions = []
+        positions = []
+        selected = current
+        for index in order:
+            number, address, data_out, num_bytes = operations[index]
+            if number != selected:
+                transactions.append(self._select_transaction(number))
+                positions.append(None)
+                selected = number
+            transactions.append((address, data_out, num_bytes))
+            positions.append(index)
+        self._selected = None
+        results = adapters.i2c_transfer(self.master, transactions)
+        self._selected = selected
+        ordered = [None] * len(operations)
+        for position, result in zip(positions, results):
+            if position is not None:
+                ordered[position] = result
+        return ordered
+
+class PCA9543(PCA954X):
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=2, name=name)
+
+class PCA9545(PCA954X):
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=4, name=name)
+
+class PCA9546(PCA954X):
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=4, name=name)
+
+class PCA9548(PCA954X):
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=8, name=name)
+
+class PCA9542(PCA954X):
+    """Multiplexer variant: the control register holds an enable bit and a channel index rather than a channel bitmask."""
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=2, name=name)
+
+    def _control_register(self, number):
+        return 0x04 | number
+
+class PCA9544(PCA954X):
+    """Multiplexer variant: the control register holds an enable bit and a channel index rather than a channel bitmask."""
+
+    def __init__(self, master, address, name=None):
+        PCA954X.__init__(self, master=master, address=address, channels=4, name=name)
+
+    def _control_register(self, number):
+        return 0x04 | number
@@ -1,18 +1,24 @@
 # -*- coding: utf-8 -*-
 
+import contextlib
 from array import array
 
+import bustools.adapters as adapters
+import bustools.devices.registers as registers
+
 _INPUT_REGISTER = 0x00
 _OUTPUT_REGISTER = 0x01
 _POLARITY_REGISTER = 0x02
 _CONFIGURATION_REGISTER = 0x03
-_REGISTER_TYPES = [
-    _INPUT_REGISTER,
-    _OUTPUT_REGISTER,
-    _POLARITY_REGISTER,
-    _CONFIGURATION_REGISTER
-]
-_REGISTER_BYTE_WIDTH = 1
+# register types; the command for a register is computed from the register
+# type, the port number and the register offset of the expander (see _command)
+_REGISTER_MAP = registers.RegisterMap([
+    registers.Register('input', _INPUT_REGISTER, 1),
+    registers.Register('output', _OUTPUT_REGISTER, 1),
+    registers.Register('polarity', _POLARITY_REGISTER, 1),
+    registers.Register('configuration', _CONFIGURATION_REGISTER, 1)
+])
+_REGISTER_TYPES = _REGISTER_MAP.addresses()
 
 LOW = 0
 HIGH = 1
@@ -35,6 +41,15 @@ POLARITIES = [
     INVERTED
 ]
 
+RISING = 1
+FALLING = 2
+BOTH = RISING | FALLING
+EDGES = [
+    RISING,
+    FALLING,
+    BOTH
+]
+
 class PCA95xxError(Exception):
     pass
 
@@ -43,6 +58,11 @@ def _validate_logic_level(logic_level):
     if not (logic_level in LOGIC_LEVELS):
         raise PCA95xxError("invalid logic level: %s" % logic_level)
 
+def _validate_edge(edge):
+    """Raise PCA95xxError if the edge is invalid."""
+    if not (edge in EDGES):
+        raise PCA95xxError("invalid edge: %s" % edge)
+
 def logic_level_string(logic_level):
     _validate_logic_level(logic_level)
     return 'high' if logic_level == HIGH else 'low'
@@ -69,27 +89,32 @@ def _command(register_offset, port_number, register_type):
     """Return the command register value corresponding to the register type for a given port number and register offset."""
     return (register_offset * register_type) + port_number
 
+def _register(register_type):
+    """Return the Register description, raise PCA95xxError if the register is invalid."""
+    description = _REGISTER_MAP.get(register_type)
+    if description is None:
+        raise PCA95xxError("invalid register type: %s" % register_type)
+    return description
+
 def _validate_register_type(register_type):
     """Raise PCA95xxError if the register is invalid."""
-    if not (register_type in _REGISTER_TYPES):
-        raise PCA95xxError("invalid register type: %s" % register_type)
+    _register(register_type)
 
 def _read_register(master, address, register_offset, port_number, register_type):
     """Read a register corresponding to the register type for a given port number and register offset."""
-    _validate_register_type(register_type)
-    data_out = array('B', [0])
-    data_out[0] = _command(register_offset, port_number, register_type)
-    data_in = master.i2c_write_read(address, data_out, 1)
-    return data_in[0]
+    description = _register(register_type)
+    data_out = array('B', [_command(register_offset, port_number, register_type)])
+    return description.decode(master.i2c_write_read(address, data_out, description.width))
+
+def _read_registers(master, address, register_offset, port_numbers, register_type):
+    """Read the registers corresponding to the register type for a list of port numbers in a single batch if the master supports it."""
+    description = _register(register_type)
+    transactions = [(address, array('B', [_command(register_offset, port_number, register_type)]), description.width) for port_number in port_numbers]
+    return [description.decode(data_in) for data_in in adapters.i2c_transfer(master, transactions)]
 
 def _write_register(master, address, register_offset, port_number, register_type, value=None):
     """Write a register corresponding to the register type for a given port number and register offset."""
-    _validate_register_type(register_type)
-    data = array('B', [0])
-    data[0] = _command(register_offset, port_number, register_type)
-    if value:
-        data.insert(1, value)
-    master.i2c_write(address, data)
+    master.i2c_write(address, _register(register_type).encode_command(value, command=_command(register_offset, port_number, register_type)))
 
 def test_bit(int_type, offset):
     """Return HIGH if the bit at 'offset' is one, otherwise return LOW."""
@@ -118,6 +143,9 @@ class GPIO(object):
         self.number = number
         self._name = name
 
+        # (callback, edge) pairs called when an input change is detected
+        self._event_callbacks = []
+
     @property
     def name(self):
         if self._name:
@@ -179,22 +207,85 @@ class GPIO(object):
     def toggle(self):
         self._port._output_register = toggle_bit(self._port._output_register, self.number)
 
+    def reader(self):
+        """Return a function of no arguments that reads the input level of the pin, for hot polling loops (see Port.reader())."""
+        read = self._port.reader()
+        number = self.number
+        def read_level():
+            return (read() >> number) & 1
+        return read_level
+
+    # --- input change events ---
+
+    def add_event_callback(self, callback, edge=BOTH):
+        """Call callback(pin, level) when an input change on the given edge(s) is detected.
+
+        Changes are detected when the expander input registers are refreshed, i.e. by PCA95XX.poll() when an interrupt line is attached, or on any input read otherwise.
+        """
+        _validate_edge(edge)
+        self._event_callbacks.append((callback, edge))
+
+    def remove_event_callback(self, callback):
+        self._event_callbacks = [(c, e) for c, e in self._event_callbacks if c != callback]
+
+    def _dispatch_event(self, level):
+        edge = RISING if level == HIGH else FALLING
+        for callback, callback_edge in self._event_callbacks:
+            if callback_edge & edge:
+                callback(self, level)
+
 class Port(object):
 
     def __init__(self, expander, width, number):
         self._expander = expander
         self.number = number
 
+        # last value read from the input register, None if unknown
+        self._input_cache = None
+
         # initialize pins
         self.pins = []
         for pin_number in range(width):
             self.pins.append(GPIO(self, pin_number))
 
+    def reader(self):
+        """Return a function of no arguments that reads the input register of the port, for hot polling loops.
+
+        The command and codec are resolved once, so each call is a single master transaction.  Reads bypass the interrupt line, the input cache and event callbacks (see GPIO.add_event_callback()).
+        """
+        expander = self._expander
+        return _register(_INPUT_REGISTER).reader(expander.master, expander.address, command=_command(expander._register_offset, self.number, _INPUT_REGISTER))
+
     # --- register properties ---
 
     @property
     def _input_register(self):
-        return self._expander._read_register(self.number, _INPUT_REGISTER)
+        # with an interrupt line attached, the device only needs to be read
+        # when INT signals that an input differs from the last value read
+        interrupt = self._expander.interrupt
+        if interrupt is None:
+            self._update_input()
+        elif interrupt.asserted:
+            # INT is shared by all ports, so all of them must be read to clear it
+            self._expander._update_inputs()
+        elif self._input_cache is None:
+            self._update_input()
+        return self._input_cache
+
+    def _update_input(self, value=None):
+        """Read the input register (unless value is provided) and dispatch events for changed pins.  Return the list of changed pins."""
+        if value is None:
+            value = self._expander._read_register(self.number, _INPUT_REGISTER)
+        previous = self._input_cache
+        self._input_cache = value
+        if previous is None:
+            return []
+        changed = []
+        for pin in self.pins:
+            if test_bit(previous ^ value, pin.number):
+                changed.append(pin)
+                pin._dispatch_event(HIGH if test_bit(value, pin.number) else LOW)
+        return changed
 
     @property
     def _output_register(self):
@@ -238,6 +329,19 @@ class PCA95XX(object):
         # name (e.g. reference designator when assembled on a PCB)
         self.name = name
 
+        # interrupt line wired to the INT output, e.g.
+        # bustools.adapters.aardvark.GPIOInterrupt; when set, input registers
+        # are only read when INT is asserted
+        self.interrupt = None
+
+        # register image while in a deferred() block, None otherwise:
+        # (port number, register type) -> value
+        self._image = None
+        # values read from the device while in a deferred() block
+        self._image_read = None
+        # registers written while in a deferred() block
+        self._image_dirty = None
+
         # initialize ports
         self.ports = []
         for number in range(ports):
@@ -246,10 +350,266 @@ class PCA95XX(object):
     # --- low level register access ---
 
     def _read_register(self, port_number, register_type):
+        if self._image is not None and register_type != _INPUT_REGISTER:
+            key = (port_number, register_type)
+            if key not in self._image:
+                self._image[key] = self._image_read[key] = _read_register(self.master, self.address, self._register_offset, port_number, register_type)
+            return self._image[key]
         return _read_register(self.master, self.address, self._register_offset, port_number, register_type)
 
+    def _read_registers(self, port_numbers, register_type):
+        return _read_registers(self.master, self.address, self._register_offset, port_numbers, register_type)
+
     def _write_register(self, port_number, register_type, value=None):
+        if self._image is not None and register_type != _INPUT_REGISTER and value is not None:
+            self._image[(port_number, register_type)] = value
+            self._image_dirty.add((port_number, register_type))
+            return
         _write_register(self.master, self.address, self._register_offset, port_number, register_type, value)
+        self._written(port_number, register_type)
+
+    def _written(self, port_number, register_type):
+        """Note that register_type of a port was written to the device."""
+        if register_type in (_POLARITY_REGISTER, _CONFIGURATION_REGISTER):
+            # these change the input register without asserting INT
+            self.ports[port_number]._input_cache = None
+
+    # --- deferred writes ---
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Context manager that coalesces register writes.
+
+        Inside the block, output, polarity and configuration register changes (e.g. GPIO.output, GPIO.direction, GPIO.polarity, Port and PinGroup writes) only update a local image of the registers; each register is read from the device at most once, the first time it is needed.  When the block exits normally, each register whose value changed is written once, in a single batch (see bustools.adapters.i2c_transfer), output and polarity registers before configuration registers so pins switched to outputs drive their new level straight away.  If the block raises, the changes are discarded and the device is left untouched.
+
+        Input registers are always read from the device; the input cache of a port whose polarity or configuration changes is dropped once the writes are done, not when the change is made, so inputs read in the block are not served afterwards.  Nested blocks are merged into the outermost one.
+        """
+        if self._image is not None:
+            yield self
+            return
+        self._image = {}
+        self._image_read = {}
+        self._image_dirty = set()
+        try:
+            yield self
+            image, read, dirty = self._image, self._image_read, self._image_dirty
+        finally:
+            self._image = self._image_read = self._image_dirty = None
+        transactions = []
+        written = []
+        for port_number, register_type in sorted(dirty, key=lambda key: (key[1], key[0])):
+            value = image[(port_number, register_type)]
+            if read.get((port_number, register_type)) != value:
+                transactions.append((self.address, _register(register_type).encode_command(value, command=_command(self._register_offset, port_number, register_type)), 0))
+                written.append((port_number, register_type))
+        if transactions:
+            adapters.i2c_transfer(self.master, transactions)
+        # inputs read in the block reflect the registers before the writes
+        for port_number, register_type in written:
+            self._written(port_number, register_type)
+
+    # --- inputs ---
+
+    def inputs(self):
+        """Read the input registers of all ports in a single batch if the master supports it (see bustools.adapters.i2c_transfer), and return the list of their values in port order.
+
+        Event callbacks of the pins that changed since the last read are dispatched, as for GPIO.input.
+        """
+        self._update_inputs()
+        return [port._input_cache for port in self.ports]
+
+    # --- input change events ---
+
+    def _update_inputs(self):
+        """Read all input registers, which also clears INT, and return the list of changed pins."""
+        values = self._read_registers([port.number for port in self.ports], _INPUT_REGISTER)
+        changed = []
+        for port, value in zip(self.ports, values):
+            changed.extend(port._update_input(value))
+        return changed
+
+    def poll(self, timeout=None):
+        """Wait for the interrupt line, then read the inputs and dispatch events to the pin callbacks.
+
+        Return the list of pins that changed, which is empty if timeout (seconds) expired first.  If timeout is None, block until an interrupt occurs.  Intended to be called in a loop in place of polling GPIO.input.
+        """
+        if self.interrupt is None:
+            raise PCA95xxError("no interrupt line attached to %s" % self.name)
+        if not self.interrupt.wait(timeout):
+            return []
+        return self._update_inputs()
+
+class PinGroup(object):
+    """Set of GPIO pins on any ports of any number of expanders, e.g. a named group of signals.
+
+    Pins are stored as one bitmask per (expander, port number), so reading or writing the group costs one register transaction per port it covers rather than one per pin.  The transactions for all ports on the same master are issued as a single batch (see bustools.adapters.i2c_transfer): an input read is one batch per master, an output write is at most two (the output registers of ports the group only partly covers are read first, to preserve their other pins).
+
+    Pin order (for input() and output()) is by expander and port in the order they were first added, then by pin number.
+    """
+
+    def __init__(self, pins=(), name=None):
+        self.name = name
+
+        # (expander, port number) -> bitmask of pins in the group
+        self._masks = {}
+
+        # (expander, port number) keys in the order they were added
+        self._keys = []
+
+        for pin in pins:
+            self.add(pin)
+
+    @staticmethod
+    def _key(pin):
+        return (pin._port._expander, pin._port.number)
+
+    def add(self, pin):
+        key = self._key(pin)
+        if key not in self._masks:
+            self._masks[key] = 0
+            self._keys.append(key)
+        self._masks[key] |= 1 << pin.number
+
+    def remove(self, pin):
+        key = self._key(pin)
+        mask = self._masks.get(key, 0) & ~(1 << pin.number)
+        if mask:
+            self._masks[key] = mask
+        elif key in self._masks:
+            del self._masks[key]
+            self._keys.remove(key)
+
+    def __contains__(self, pin):
+        return bool(self._masks.get(self._key(pin), 0) & (1 << pin.number))
+
+    def __len__(self):
+        return sum(bin(mask).count('1') for mask in self._masks.values())
+
+    def __iter__(self):
+        return iter(self.pins)
+
+    @property
+    def pins(self):
+        """List of the GPIO pins in the group, in group order."""
+        pins = []
+        for expander, port_number in self._keys:
+            mask = self._masks[(expander, port_number)]
+            pins.extend(pin for pin in expander.ports[port_number].pins if mask & (1 << pin.number))
+        return pins
+
+    # --- batched register access ---
+
+    def _by_master(self, keys):
+        """Group (expander, port number) keys by master: return a list of (master, keys) pairs."""
+        groups = []
+        for key in keys:
+            master = key[0].master
+            for group_master, group_keys in groups:
+                if group_master is master:
+                    group_keys.append(key)
+                    break
+            else:
+                groups.append((master, [key]))
+        return groups
+
+    def _read(self, keys, register_type):
+        """Read register_type of each (expander, port number) key; return a dictionary of key -> value."""
+        description = _register(register_type)
+        values = {}
+        # expanders in a deferred() block serve registers from their image
+        if register_type != _INPUT_REGISTER:
+            for expander, port_number in keys:
+                if expander._image is not None:
+                    values[(expander, port_number)] = expander._read_register(port_number, register_type)
+            keys = [key for key in keys if key not in values]
+        for master, group_keys in self._by_master(keys):
+            transactions = [(expander.address, array('B', [_command(expander._register_offset, port_number, register_type)]), description.width) for expander, port_number in group_keys]
+            for key, data_in in zip(group_keys, adapters.i2c_transfer(master, transactions)):
+                values[key] = description.decode(data_in)
+        return values
+
+    def _write(self, values, register_type):
+        """Write register_type of each (expander, port number) key in the dictionary of key -> value."""
+        description = _register(register_type)
+        keys = []
+        for key in self._keys:
+            if key not in values:
+                continue
+            expander, port_number = key
+            if expander._image is not None:
+                expander._write_register(port_number, register_type, values[key])
+            else:
+                keys.append(key)
+        for master, group_keys in self._by_master(keys):
+            transactions = [(expander.address, description.encode_command(values[(expander, port_number)], command=_command(expander._register_offset, port_number, register_type)), 0) for expander, port_number in group_keys]
+            adapters.i2c_transfer(master, transactions)
+            for expander, port_number in group_keys:
+                expander._written(port_number, register_type)
+
+    def _modify(self, register_type, bits, toggle=False):
+        """Set the group's pins in register_type to bits (dictionary of key -> bit values within the key's mask), or invert them if toggle is True.
+
+        Other pins keep their value: registers are read first only for ports the group doesn't fully cover, or to toggle.
+        """
+        partial = [key for key in self._keys if toggle or self._masks[key] != (1 << len(key[0].ports[key[1]].pins)) - 1]
+        current = self._read(partial, register_type)
+        values = {}
+        for key in self._keys:
+            mask = self._masks[key]
+            if toggle:
+                values[key] = current[key] ^ mask
+            else:
+                values[key] = (current.get(key, 0) & ~mask) | (bits[key] & mask)
+        self._write(values, register_type)
+
+    def _bits(self, levels):
+        """Return a dictionary of key -> register bits for a level per pin (in group order), or a single level for all pins."""
+        if levels in LOGIC_LEVELS:
+            return dict((key, self._masks[key] if levels == HIGH else 0) for key in self._keys)
+        pins = self.pins
+        if len(levels) != len(pins):
+            raise PCA95xxError("expected %d levels for the pins of %s, got %d" % (len(pins), self.name, len(levels)))
+        bits = dict((key, 0) for key in self._keys)
+        for pin, level in zip(pins, levels):
+            _validate_logic_level(level)
+            if level == HIGH:
+                bits[self._key(pin)] |= 1 << pin.number
+        return bits
+
+    # --- pin access ---
+
+    def input(self):
+        """Return the input level of each pin, in group order.
+
+        Ports of expanders without an interrupt line are read in one batch per master; the others use the interrupt-driven input cache (see Port).  Input change events are dispatched as for single pin reads.
+        """
+        values = {}
+        unread = [key for key in self._keys if key[0].interrupt is None]
+        for key, value in self._read(unread, _INPUT_REGISTER).items():
+            key[0].ports[key[1]]._update_input(value)
+            values[key] = value
+        for key in self._keys:
+            if key not in values:
+                values[key] = key[0].ports[key[1]]._input_register
+        return [HIGH if test_bit(values[self._key(pin)], pin.number) else LOW for pin in self.pins]
+
+    def output(self, levels):
+        """Drive the pins to levels: a single level for all pins or a sequence with a level per pin, in group order."""
+        self._modify(_OUTPUT_REGISTER, self._bits(levels))
+
+    def toggle(self):
+        """Invert the output level of every pin."""
+        self._modify(_OUTPUT_REGISTER, None, toggle=True)
+
+    def set_direction(self, direction):
+        """Configure every pin as an INPUT or OUTPUT."""
+        _validate_direction(direction)
+        self._modify(_CONFIGURATION_REGISTER, self._bits(direction))
+
+    def set_polarity(self, polarity):
+        """Set the input polarity inversion of every pin to DEFAULT or INVERTED."""
+        _validate_polarity(polarity)
+        self._modify(_POLARITY_REGISTER, self._bits(polarity))
 
 class PCA9536(PCA95XX):
 
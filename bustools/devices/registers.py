@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""Declarative register descriptions
+
+A Register describes the address, width, byte order, signedness and bit
+fields of a device register.  The struct codec for the register is
+compiled once, when the description is created, so encoding and decoding
+a value is a single precompiled pack or unpack call.
+"""
+
+import struct
+from array import array
+
+_FORMATS = {
+    (1, False): 'B',
+    (1, True): 'b',
+    (2, False): 'H',
+    (2, True): 'h',
+    (4, False): 'I',
+    (4, True): 'i'
+}
+
+# array.frombytes() was array.fromstring() in Python 2
+_frombytes = getattr(array, 'frombytes', None) or array.fromstring
+
+_BYTE_ORDERS = {
+    'big': '>',
+    'little': '<'
+}
+
+class RegisterError(Exception):
+    pass
+
+class Field(object):
+    """Bit field of width bits starting at bit shift.
+
+    bits optionally names the individual bits, MSB first; by default a single bit field is named after the field and the bits of a wider field are named name1 (LSB) to nameN (MSB).
+    """
+
+    def __init__(self, name, shift, width=1, bits=None):
+        self.name = name
+        self.shift = shift
+        self.width = width
+        self.mask = ((1 << width) - 1) << shift
+        if bits is None:
+            bits = [name] if width == 1 else ["%s%d" % (name, i) for i in range(width, 0, -1)]
+        if len(bits) != width:
+            raise RegisterError("field %s has %d bits but %d bit names" % (name, width, len(bits)))
+        self.bits = list(bits)
+
+    def get(self, value):
+        """Return the field value extracted from a register value."""
+        return (value & self.mask) >> self.shift
+
+    def set(self, value, field_value):
+        """Return the register value with the field set to field_value."""
+        if field_value < 0 or field_value >= (1 << self.width):
+            raise RegisterError("invalid value for field %s: %s" % (self.name, field_value))
+        return (value & ~self.mask) | (field_value << self.shift)
+
+class Register(object):
+    """Device register of width bytes at address.
+
+    volatile is False for registers that only change when written (e.g. configuration and thresholds), whose value drivers may cache, and True for registers the device updates (e.g. measurements and status).
+    """
+
+    def __init__(self, name, address, width, fields=(), signed=False, byteorder='big', volatile=True):
+        if (width, signed) not in _FORMATS:
+            raise RegisterError("unsupported register width: %s" % width)
+        if byteorder not in _BYTE_ORDERS:
+            raise RegisterError("invalid byte order: %s" % byteorder)
+        self.name = name
+        self.address = address
+        self.width = width
+        self.signed = signed
+        self.volatile = volatile
+        self.fields = list(fields)
+        self._fields = dict((field.name, field) for field in self.fields)
+        # bits covered by a field, see readback()
+        self._mask = 0
+        for field in self.fields:
+            self._mask |= field.mask
+        self._struct = struct.Struct(_BYTE_ORDERS[byteorder] + _FORMATS[(width, signed)])
+
+        # command written to select the register, e.g. before a read
+        self.command = array('B', [address])
+
+    def field(self, name):
+        """Return the named Field."""
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise RegisterError("register %s has no field %s" % (self.name, name))
+
+    def encode(self, value):
+        """Return the bytes of a register value."""
+        if self.signed and value >= (1 << (8 * self.width - 1)):
+            # accept the two's complement bit pattern as well
+            value -= 1 << (8 * self.width)
+        return self._struct.pack(value)
+
+    def encode_command(self, value=None, command=None):
+        """Return the command, followed by the bytes of value if provided, as an array of bytes to write.
+
+        command overrides the register address as the command byte, for devices where the command also encodes e.g. a port number.
+        """
+        data = array('B', self.command) if command is None else array('B', [command])
+        if value is not None:
+            _frombytes(data, self.encode(value))
+        return data
+
+    def reader(self, master, address, scale=None, shift=0, offset=0.0, command=None):
+        """Return a function of no arguments that reads the register of the device at address on master, for hot polling loops.
+
+        The command bytes, codec and master method are looked up once, so each call is one write+read and one unpack.  The function returns the register value, or (value >> shift) * scale + offset if scale is provided.  command overrides the register address as in encode_command().  The master must return an array of bytes, as all bustools.adapters masters do.
+        """
+        write_read = master.i2c_write_read
+        unpack_from = self._struct.unpack_from
+        data_out = self.encode_command(command=command)
+        width = self.width
+        if scale is None:
+            def read():
+                return unpack_from(write_read(address, data_out, width))[0]
+        elif not shift and not offset:
+            def read():
+                return unpack_from(write_read(address, data_out, width))[0] * scale
+        else:
+            def read():
+                return (unpack_from(write_read(address, data_out, width))[0] >> shift) * scale + offset
+        return read
+
+    def decode(self, data):
+        """Return the register value of the bytes in data (an array of bytes, or any sequence of byte values)."""
+        try:
+            return self._struct.unpack_from(data)[0]
+        except TypeError:
+            # not a buffer, e.g. a list
+            return self._struct.unpack_from(bytearray(data))[0]
+
+    def readback(self, value):
+        """Return the value the register reads back after value is written: bits not covered by a field (e.g. unused or read-only bits) read as 0."""
+        if not self.fields:
+            return value
+        return self.decode(self.encode(value & self._mask))
+
+    def bit_names(self):
+        """Return a list of (bit, name) pairs, MSB first; bits not covered by a field are named '-'."""
+        names = {}
+        for field in self.fields:
+            for i, bit_name in enumerate(field.bits):
+                names[field.shift + field.width - 1 - i] = bit_name
+        return [(bit, names.get(bit, '-')) for bit in range(8 * self.width - 1, -1, -1)]
+
+class RegisterMap(dict):
+    """Registers of a device, as a dictionary of Register descriptions by address.
+
+    registers is the list of descriptions in their original order.
+    """
+
+    def __init__(self, registers):
+        dict.__init__(self, ((register.address, register) for register in registers))
+        self.registers = list(registers)
+
+    def addresses(self):
+        return [register.address for register in self.registers]
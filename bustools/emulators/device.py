@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+class EmulatorError(Exception):
+    pass
+
+class RegisterDevice(object):
+    """Register based I2C slave device model.
+
+    The master selects a register by writing its address (the register pointer), optionally followed by a value, MSB first.  Reads return the value of the register selected by the pointer, MSB first.  This is the protocol used by e.g. the INA219 and LM75.
+
+    Subclasses provide the value of volatile registers by overriding read_register() and can react to writes by overriding write_register().
+    """
+
+    def __init__(self, widths, values=None, pointer=0, name=None):
+
+        # register address -> width in bytes
+        self._widths = dict(widths)
+
+        # register address -> stored value
+        self._values = dict((register, 0) for register in self._widths)
+        if values:
+            for register, value in values.items():
+                self.write_register(register, value)
+
+        # currently selected register
+        self.pointer = pointer
+
+        # name (e.g. reference designator of the emulated device)
+        self.name = name
+
+    def _validate_register(self, register):
+        """Raise EmulatorError if the register is invalid."""
+        if not (register in self._widths):
+            raise EmulatorError("invalid register: %s" % register)
+
+    def read_register(self, register):
+        """Return the value of the register."""
+        self._validate_register(register)
+        return self._values[register]
+
+    def write_register(self, register, value):
+        """Set the value of the register."""
+        self._validate_register(register)
+        self._values[register] = value & ((1 << (8 * self._widths[register])) - 1)
+
+    def write(self, data):
+        """Handle data written by the master: a register pointer optionally followed by a value."""
+        if len(data) == 0:
+            return
+        self._validate_register(data[0])
+        self.pointer = data[0]
+        width = self._widths[self.pointer]
+        if len(data) >= 1 + width:
+            value = 0
+            for byte in data[1:1 + width]:
+                value = (value << 8) | byte
+            self.write_register(self.pointer, value)
+
+    def response(self, register=None):
+        """Return the bytes sent to the master on a read, i.e. the value of the register selected by the pointer (or of register, if provided)."""
+        if register is None:
+            register = self.pointer
+        width = self._widths[register]
+        value = self.read_register(register)
+        data = array('B')
+        for shift in range(8 * (width - 1), -1, -8):
+            data.append((value >> shift) & 0xFF)
+        return data
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import bustools.devices.ina219 as ina219
+from bustools.emulators.device import RegisterDevice
+
+# configuration register value after power-on reset
+_POWER_ON_CONFIGURATION = 0x399F
+
+class INA219Emulator(RegisterDevice):
+    """INA219 model using the register layout of bustools.devices.ina219.
+
+    shunt_voltage and bus_voltage (in volts) are the simulated inputs; the shunt voltage, bus voltage, current and power registers are derived from them (and the calibration register) on every read, as the device does after each conversion.
+    """
+
+    def __init__(self, shunt_voltage=0.0, bus_voltage=0.0, name=None):
+        widths = dict((register.address, register.width) for register in ina219._REGISTER_MAP.registers)
+        RegisterDevice.__init__(self, widths=widths, values={ina219._CONFIGURATION_REGISTER: _POWER_ON_CONFIGURATION}, name=name)
+
+        # simulated shunt voltage in volts
+        self.shunt_voltage = shunt_voltage
+
+        # simulated bus voltage in volts
+        self.bus_voltage = bus_voltage
+
+    def _shunt_voltage_register(self):
+        return int(round(self.shunt_voltage / ina219._SHUNT_VOLTAGE_REGISTER_LSB))
+
+    def _raw_bus_voltage(self):
+        return int(round(self.bus_voltage / ina219._BUS_VOLTAGE_REGISTER_LSB)) & 0x1FFF
+
+    def _current_register(self):
+        return (self._shunt_voltage_register() * self._values[ina219._CALIBRATION_REGISTER]) // 4096
+
+    def _power_register(self):
+        return (abs(self._current_register()) * self._raw_bus_voltage()) // 5000
+
+    def read_register(self, register):
+        if register == ina219._SHUNT_VOLTAGE_REGISTER:
+            value = self._shunt_voltage_register()
+        elif register == ina219._BUS_VOLTAGE_REGISTER:
+            # conversion ready (CNVR) is always set
+            value = (self._raw_bus_voltage() << 3) | 0x2
+        elif register == ina219._CURRENT_REGISTER:
+            value = self._current_register()
+        elif register == ina219._POWER_REGISTER:
+            value = self._power_register()
+        else:
+            return RegisterDevice.read_register(self, register)
+        # two's complement
+        return value & 0xFFFF
+
+    def write_register(self, register, value):
+        if register == ina219._CONFIGURATION_REGISTER and value & 0x8000:
+            # RST bit resets all registers to their power-on values
+            for reset_register in self._values:
+                self._values[reset_register] = 0
+            value = _POWER_ON_CONFIGURATION
+        # unused and read-only bits (e.g. calibration bit 0) read as 0
+        description = ina219._REGISTER_MAP.get(register)
+        if description is not None:
+            value = description.readback(value)
+        RegisterDevice.write_register(self, register, value)
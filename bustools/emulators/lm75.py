@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import bustools.devices.lm75 as lm75
+from bustools.emulators.device import RegisterDevice
+
+# Thyst and Tos power-on values (75C and 80C)
+_POWER_ON_HYSTERESIS = 0x4B00
+_POWER_ON_OVERTEMPERATURE_SHUTDOWN = 0x5000
+
+class LM75Emulator(RegisterDevice):
+    """LM75 model using the register layout of bustools.devices.lm75.
+
+    temperature (in Celsius) is the simulated input; the temperature register is derived from it on every read with 0.125C resolution.
+    """
+
+    def __init__(self, temperature=25.0, name=None):
+        values = {
+            lm75._HYSTERESIS_REGISTER: _POWER_ON_HYSTERESIS,
+            lm75._OVERTEMPERATURE_SHUTDOWN_REGISTER: _POWER_ON_OVERTEMPERATURE_SHUTDOWN
+        }
+        RegisterDevice.__init__(self, widths=dict((register.address, register.width) for register in lm75._REGISTER_MAP.registers), values=values, pointer=lm75._TEMPERATURE_REGISTER, name=name)
+
+        # simulated temperature in Celsius
+        self.temperature = temperature
+
+    def read_register(self, register):
+        if register == lm75._TEMPERATURE_REGISTER:
+            # 11 bit two's complement, left justified
+            return (int(round(self.temperature * 8)) << 5) & 0xFFFF
+        return RegisterDevice.read_register(self, register)
+
+    def write_register(self, register, value):
+        if register == lm75._TEMPERATURE_REGISTER:
+            # read-only
+            return
+        # unused bits read as 0
+        description = lm75._REGISTER_MAP.get(register)
+        if description is not None:
+            value = description.readback(value)
+        RegisterDevice.write_register(self, register, value)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import bustools.adapters.aardvark as aardvark
+from bustools.emulators.device import EmulatorError
+
+# Default interval between response buffer refreshes while the bus is idle
+_REFRESH_INTERVAL = 0.001
+
+class SlaveEmulator(object):
+    """Event driven loop that emulates a RegisterDevice using an Aardvark adapter in I2C slave mode.
+
+    The Aardvark answers master reads from its response buffer without host involvement, and only reports a transaction after it is done, so the buffer has to hold the right register before the master reads it:
+
+    - when the master writes the register pointer and reads later, in a separate transaction, the response for the new pointer is loaded as soon as the write is reported
+    - when the master writes the pointer and reads after a repeated start (a write+read, as bustools drivers and most hosts do), the read is answered before the write is reported.  The loop therefore learns the order in which the master reads registers (e.g. a polling loop reading shunt voltage, bus voltage, current and power in turn) and preloads the response of the register it predicts will be read next
+    - when no event arrives within refresh_interval seconds, the loaded response is recomputed and reloaded only if it changed, so readings are never more than refresh_interval old
+
+    The remaining limit is the Aardvark's: a write+read whose register doesn't follow the order learned so far (the first pass of a polling loop, or random access) returns the predicted register's value.  These reads are counted in stale_reads.  Writes the device rejects (e.g. an invalid register pointer) are ignored, as a real part would, and counted in errors.
+    """
+
+    def __init__(self, adapter, device, address, refresh_interval=_REFRESH_INTERVAL):
+        self.adapter = adapter
+        self.device = device
+        self.address = address
+        self.refresh_interval = refresh_interval
+        # reads answered with a register other than the one the master selected
+        self.stale_reads = 0
+        # writes rejected by the device
+        self.errors = 0
+        self._response = None
+        # register of the loaded response
+        self._loaded = None
+        # register read -> register read next, as last seen
+        self._next = {}
+        # register of the last read
+        self._last_read = None
+        self._running = False
+
+    def _load(self, register):
+        """Load the response for register into the slave response buffer if it changed."""
+        response = self.device.response(register)
+        if register != self._loaded or response != self._response:
+            self.adapter.i2c_slave_set_response(response)
+            self._response = response
+            self._loaded = register
+
+    def start(self):
+        """Enable slave mode with the current device response loaded."""
+        self._response = None
+        self._loaded = None
+        self._load(self.device.pointer)
+        self.adapter.i2c_slave_enable(self.address)
+
+    def stop(self):
+        """Stop the loop (safe to call from another thread or a device callback)."""
+        self._running = False
+
+    def step(self, timeout=None):
+        """Wait up to timeout seconds (default refresh_interval) for a slave event and handle it."""
+        if timeout is None:
+            timeout = self.refresh_interval
+        event = self.adapter.async_poll(int(timeout * 1000))
+        if event & aardvark.ASYNC_I2C_READ:
+            address, data = self.adapter.i2c_slave_read()
+            try:
+                self.device.write(data)
+            except EmulatorError:
+                self.errors += 1
+        if event & aardvark.ASYNC_I2C_WRITE:
+            self.adapter.i2c_slave_write_stats()
+            # the master read the register the pointer selects
+            register = self.device.pointer
+            if register != self._loaded:
+                self.stale_reads += 1
+            if self._last_read is not None:
+                self._next[self._last_read] = register
+            self._last_read = register
+            self._load(self._next.get(register, register))
+        elif event & aardvark.ASYNC_I2C_READ:
+            # a pointer write alone: the master reads it next
+            self._load(self.device.pointer)
+        else:
+            self._load(self._loaded)
+        return event
+
+    def run(self, duration=None):
+        """Emulate the device until stop() is called or duration seconds elapse, then disable slave mode."""
+        deadline = None if duration is None else time.time() + duration
+        self._running = True
+        self.start()
+        try:
+            while self._running:
+                self.step()
+                if deadline is not None and time.time() > deadline:
+                    break
+        finally:
+            self._running = False
+            self.adapter.i2c_slave_disable()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Change-only filters for streamed readings
+
+A filter decides, reading by reading, whether a reading is worth passing
+on to consumers: accept(timestamp, value) returns True to pass it.  Values
+that don't change (within a deadband) are suppressed, except for a
+heartbeat: the current value is passed anyway once heartbeat seconds have
+passed since the last value passed, so consumers can tell a steady signal
+from a dead one.
+"""
+
+import bustools.devices.pca95xx as pca95xx
+
+class FilterError(Exception):
+    pass
+
+class Deadband(object):
+    """Pass a reading only if it differs from the last reading passed by more than the deadband.
+
+    The deadband is the larger of absolute and relative times the magnitude of the last reading passed.  With both 0 (the default), every change is passed.
+    """
+
+    def __init__(self, absolute=0.0, relative=0.0, heartbeat=None):
+        if absolute < 0 or relative < 0:
+            raise FilterError("invalid deadband: absolute %s, relative %s" % (absolute, relative))
+        self.absolute = absolute
+        self.relative = relative
+        self.heartbeat = heartbeat
+        self._value = None
+        self._timestamp = None
+
+    def reset(self):
+        """Forget the last reading passed, so the next reading is passed."""
+        self._value = None
+        self._timestamp = None
+
+    def _changed(self, value):
+        return abs(value - self._value) > max(self.absolute, self.relative * abs(self._value))
+
+    def accept(self, timestamp, value):
+        """Return True if the reading should be passed on."""
+        if self._timestamp is None or self._changed(value) or (self.heartbeat is not None and timestamp - self._timestamp >= self.heartbeat):
+            self._value = value
+            self._timestamp = timestamp
+            return True
+        return False
+
+class Edge(Deadband):
+    """Pass a logic level (e.g. GPIO.input) only when it changes on the given edge(s) (see bustools.devices.pca95xx.RISING, FALLING and BOTH).
+
+    Also works on port values (bitmasks of pin levels, e.g. Port.input): edges are detected per pin, so a reading is passed if any pin changed on the given edge(s).  The first reading is always passed.
+    """
+
+    def __init__(self, edge=pca95xx.BOTH, heartbeat=None):
+        if edge not in pca95xx.EDGES:
+            raise FilterError("invalid edge: %s" % edge)
+        Deadband.__init__(self, heartbeat=heartbeat)
+        self.edge = edge
+
+    def _changed(self, value):
+        # pins that went high and pins that went low
+        rising = value & ~self._value
+        falling = self._value & ~value
+        if (self.edge & pca95xx.RISING and rising) or (self.edge & pca95xx.FALLING and falling):
+            return True
+        # track the levels without passing them, so the next edge is seen
+        self._value = value
+        return False
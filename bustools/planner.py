@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""Bus capacity planning
+
+Predicts, without touching any hardware, whether a polling configuration
+fits on its adapters: for each adapter, the wire time (see
+bustools.scheduler.bus_time()), the host call overhead (e.g. the USB round
+trip of every Aardvark API call) and the resulting utilization.  Per-call
+overhead is adapter and host specific: TYPICAL_OVERHEAD holds rough values
+per kind of master; measure it on the target host with measure_overhead().
+
+    planner = Planner()
+    planner.add_adapter("2237-889465", bitrate=400, overhead=OverheadProfile(per_call=0.0008))
+    planner.add("2237-889465", "rail 1", OPERATIONS["ina219.measurements"], rate=100)
+    print(planner.report())
+"""
+
+from __future__ import print_function
+
+import time
+
+import bustools.scheduler as scheduler
+
+# utilization above which a configuration is reported as marginal: reads
+# are not preemptible, so jitter grows well before a bus is saturated
+DEFAULT_LIMIT = 0.8
+
+class PlannerError(Exception):
+    pass
+
+class Operation(object):
+    """A driver operation: the (write_bytes, read_bytes) transactions it issues.
+
+    If batched is True the driver issues the transactions with a single i2c_transfer() call on masters that support it (see bustools.adapters); otherwise each transaction is a separate call.
+    """
+
+    def __init__(self, name, transactions, batched=False):
+        self.name = name
+        self.transactions = list(transactions)
+        self.batched = batched
+
+    def calls(self, batching):
+        """Return the number of master calls per operation on an adapter that does (batching is True) or doesn't batch."""
+        return 1 if self.batched and batching else len(self.transactions)
+
+# ports per PCA95xx part
+_PCA95XX_PORTS = {
+    "pca9536": 1,
+    "pca9554": 1,
+    "pca9557": 1,
+    "pca9535": 2,
+    "pca9555": 2,
+    "pca9505": 5
+}
+
+# register reads write the register pointer, then read the register after a
+# repeated start
+OPERATIONS = {
+    "lm75.temperature": Operation("lm75.temperature", [(1, 2)]),
+    "ina219.shunt_voltage": Operation("ina219.shunt_voltage", [(1, 2)]),
+    "ina219.bus_voltage": Operation("ina219.bus_voltage", [(1, 2)]),
+    "ina219.current": Operation("ina219.current", [(1, 2)]),
+    "ina219.power": Operation("ina219.power", [(1, 2)]),
+    "ina219.measurements": Operation("ina219.measurements", [(1, 2)] * 4, batched=True),
+    "at24xx.read_byte": Operation("at24xx.read_byte", [(1, 1)])
+}
+for _part, _ports in _PCA95XX_PORTS.items():
+    OPERATIONS["%s.inputs" % _part] = Operation("%s.inputs" % _part, [(1, 1)] * _ports, batched=True)
+    OPERATIONS["%s.output" % _part] = Operation("%s.output" % _part, [(2, 0)])
+del _part, _ports
+
+class OverheadProfile(object):
+    """Host overhead of master calls in seconds: per_call for every call, plus per_transaction for every transaction in a call."""
+
+    def __init__(self, per_call=0.0, per_transaction=0.0):
+        self.per_call = per_call
+        self.per_transaction = per_transaction
+
+    def time(self, calls, transactions):
+        return calls * self.per_call + transactions * self.per_transaction
+
+# typical host overhead of each kind of master (bustools.registry.MASTERS
+# name), assumed until it is measured on the target host
+TYPICAL_OVERHEAD = {
+    # every Aardvark API call is a USB full speed round trip
+    "aardvark": OverheadProfile(per_call=0.0008),
+    # an ioctl per call, and an interrupt per message in the kernel driver
+    "i2cdev": OverheadProfile(per_call=0.00005, per_transaction=0.00002),
+    # a Unix domain socket round trip, on top of the server's master
+    "remote": OverheadProfile(per_call=0.00005, per_transaction=0.00002),
+    "simulated": OverheadProfile()
+}
+
+def measure_overhead(master, address, data_out, num_bytes, iterations=200, bitrate=None):
+    """Measure the per-call overhead of master and return an OverheadProfile.
+
+    Times iterations calls of i2c_write_read(address, data_out, num_bytes) (e.g. a register read of a device on the bus) and subtracts the wire time at bitrate kHz (by default the master's i2c_bitrate).  If the master batches (i2c_transfer), batches of 8 of the same transaction are also timed to separate the per-transaction overhead.
+    """
+    if bitrate is None:
+        bitrate = getattr(master, 'i2c_bitrate', None) or scheduler.DEFAULT_BITRATE
+    wire = scheduler.bus_time(bitrate, [(len(data_out), num_bytes)])
+    start = time.time()
+    for i in range(iterations):
+        master.i2c_write_read(address, data_out, num_bytes)
+    single = max(0.0, (time.time() - start) / iterations - wire)
+    if not hasattr(master, 'i2c_transfer'):
+        return OverheadProfile(per_call=single)
+    batch = [(address, data_out, num_bytes)] * 8
+    start = time.time()
+    for i in range(iterations):
+        master.i2c_transfer(batch)
+    batched = max(0.0, (time.time() - start) / iterations - 8 * wire)
+    per_transaction = max(0.0, (batched - single) / 7)
+    return OverheadProfile(per_call=max(0.0, single - per_transaction), per_transaction=per_transaction)
+
+class _Adapter(object):
+
+    def __init__(self, name, bitrate, overhead, batching):
+        self.name = name
+        self.bitrate = bitrate
+        self.overhead = overhead
+        self.batching = batching
+        # (device name, Operation, rate, bitrate) loads
+        self.loads = []
+
+class LoadPlan(object):
+    """Predicted cost of one polled operation."""
+
+    def __init__(self, device, operation, rate, wire_time, overhead_time):
+        self.device = device
+        self.operation = operation
+        self.rate = rate
+        # seconds per operation
+        self.wire_time = wire_time
+        self.overhead_time = overhead_time
+
+    @property
+    def time(self):
+        return self.wire_time + self.overhead_time
+
+    @property
+    def utilization(self):
+        return self.rate * self.time
+
+    @property
+    def feasible(self):
+        """False if a single operation takes longer than its period."""
+        return self.time <= 1.0 / self.rate
+
+class AdapterPlan(object):
+    """Predicted load of an adapter: its LoadPlan list and totals per second of operation."""
+
+    def __init__(self, name, bitrate, loads, limit):
+        self.name = name
+        self.bitrate = bitrate
+        self.loads = loads
+        self.limit = limit
+        self.wire_time = sum(load.rate * load.wire_time for load in loads)
+        self.overhead_time = sum(load.rate * load.overhead_time for load in loads)
+
+    @property
+    def utilization(self):
+        return self.wire_time + self.overhead_time
+
+    @property
+    def feasible(self):
+        return self.utilization <= 1 and all(load.feasible for load in self.loads)
+
+    @property
+    def marginal(self):
+        return self.feasible and self.utilization > self.limit
+
+    def problems(self):
+        """Return a list of messages describing why the configuration can't (or may not) meet its rates."""
+        problems = []
+        for load in self.loads:
+            if not load.feasible:
+                problems.append("%s %s takes %.3fms, longer than its %.3fms period" % (load.device, load.operation.name, 1e3 * load.time, 1e3 / load.rate))
+        if self.utilization > 1:
+            problems.append("%s needs %.0f%% of its time (wire %.0f%%, overhead %.0f%%)" % (self.name, 100 * self.utilization, 100 * self.wire_time, 100 * self.overhead_time))
+        elif self.utilization > self.limit:
+            problems.append("%s is at %.0f%%, above the %.0f%% limit; expect jitter" % (self.name, 100 * self.utilization, 100 * self.limit))
+        return problems
+
+class Planner(object):
+    """Dry-run cost model of polling configurations, one or more adapters each polling devices at given rates."""
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self._adapters = []
+
+    def _adapter(self, name):
+        for adapter in self._adapters:
+            if adapter.name == name:
+                return adapter
+        raise PlannerError("unknown adapter: %s" % name)
+
+    def add_adapter(self, name, bitrate=scheduler.DEFAULT_BITRATE, overhead=None, batching=False):
+        """Add an adapter running at bitrate kHz with the given OverheadProfile.  batching is True if the master batches transactions (e.g. Linux i2c-dev, not Aardvark)."""
+        self._adapters.append(_Adapter(name, bitrate, overhead or OverheadProfile(), batching))
+
+    def add(self, adapter, device, operation, rate, bitrate=None):
+        """Poll operation (an Operation or a name in OPERATIONS) on device at rate Hz on adapter, at bitrate kHz if it differs from the adapter's."""
+        if not isinstance(operation, Operation):
+            try:
+                operation = OPERATIONS[operation]
+            except KeyError:
+                raise PlannerError("unknown operation: %s" % operation)
+        if rate <= 0:
+            raise PlannerError("invalid rate: %s" % rate)
+        self._adapter(adapter).loads.append((device, operation, rate, bitrate))
+
+    def plan(self):
+        """Return an AdapterPlan for each adapter."""
+        plans = []
+        for adapter in self._adapters:
+            loads = []
+            for device, operation, rate, bitrate in adapter.loads:
+                wire = scheduler.bus_time(bitrate or adapter.bitrate, operation.transactions)
+                overhead = adapter.overhead.time(operation.calls(adapter.batching), len(operation.transactions))
+                loads.append(LoadPlan(device, operation, rate, wire, overhead))
+            plans.append(AdapterPlan(adapter.name, adapter.bitrate, loads, self.limit))
+        return plans
+
+    @property
+    def feasible(self):
+        return all(plan.feasible for plan in self.plan())
+
+    def report(self):
+        """Return a text report of the predicted load of each adapter and its problems."""
+        lines = []
+        for plan in self.plan():
+            status = "OK" if plan.feasible and not plan.marginal else ("MARGINAL" if plan.feasible else "OVERLOADED")
+            lines.append("%s @ %dkHz: %.1f%% (wire %.1f%%, overhead %.1f%%) %s" % (plan.name, plan.bitrate, 100 * plan.utilization, 100 * plan.wire_time, 100 * plan.overhead_time, status))
+            for load in plan.loads:
+                lines.append("  %-24s %-24s %8.1fHz %8.3fms %6.1f%%" % (load.device, load.operation.name, load.rate, 1e3 * load.time, 100 * load.utilization))
+            for problem in plan.problems():
+                lines.append("  ! %s" % problem)
+        return "\n".join(lines)
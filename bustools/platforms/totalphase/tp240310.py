@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import bustools.devices.at24xx as at24xx
+import bustools.devices.at25xx as at25xx
 import bustools.devices.pca95xx as pca95xx
 
 # LED states
@@ -16,7 +18,7 @@ class LEDError(Exception):
 def _validate_led_state(led_state):
     """Raise LEDError if the LED state is invalid."""
     if not (led_state in LED_STATES):
-        raise LEDError("invalid LED state: %s" % logic_level)
+        raise LEDError("invalid LED state: %s" % led_state)
 
 def led_state_string(led_state):
     _validate_led_state(led_state)
@@ -43,6 +45,9 @@ class LED(object):
 
 
 
+class TP240310Error(Exception):
+    pass
+
 class TP240310(object):
     """Total Phase I2C/SPI Activity Board"""
 
@@ -98,10 +103,18 @@ class TP240310(object):
             self.d6 = LED(self.p6, "D6")
             self.d7 = LED(self.p7, "D7")
 
+            # I2C serial EEPROM
+            self.i2c_eeprom = at24xx.AT24C02(master=self.i2c_master, address=0x50, name="I2C EEPROM")
+
+        if self.spi_master:
+
+            # SPI serial EEPROM
+            self.spi_eeprom = at25xx.AT25080(master=self.spi_master, name="SPI EEPROM")
+
     def _validate_i2c_master(self):
         if not self.i2c_master:
             raise TP240310Error("No I2C master defined")
 
     def _validate_spi_master(self):
         if not self.spi_master:
-            raise AardvarkError("No SPI master defined")
+            raise TP240310Error("No SPI master defined")
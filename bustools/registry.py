@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""Registry of masters and device drivers
+
+Masters (I2C adapters), device drivers and device emulators are looked up
+by name and imported only on first use, so e.g. a tool that only uses a
+simulated bus never loads the Aardvark native library:
+
+    SimulatedMaster = MASTERS.load("simulated")
+    INA219 = DRIVERS.load("ina219")
+
+Built-in entries are "module:attribute" references.  Other packages add
+entries with setuptools entry points in the bustools.masters,
+bustools.drivers and bustools.emulators groups, e.g. in their setup.py:
+
+    entry_points = {
+        'bustools.drivers': ['tmp102 = mypackage.tmp102:TMP102']
+    }
+
+Entry points are only scanned when a name that isn't built in is looked
+up, or when all names are listed.
+"""
+
+import importlib
+
+class RegistryError(Exception):
+    pass
+
+def _entry_points(group):
+    """Return the installed entry points of group; each has a name and a load() method."""
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Python < 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return list(pkg_resources.iter_entry_points(group))
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=group))
+    # Python < 3.10
+    return list(entry_points.get(group, []))
+
+def _import(reference):
+    """Import and return the object of a "module:attribute" reference."""
+    module_name, _, attribute = reference.partition(':')
+    value = importlib.import_module(module_name)
+    for name in attribute.split('.') if attribute else []:
+        value = getattr(value, name)
+    return value
+
+class Registry(object):
+    """Named entries of one kind (e.g. masters), loaded on first use.
+
+    entries is a dictionary of name -> "module:attribute" reference (or the object itself).  group is the entry point group scanned for entries of other packages; built-in entries take precedence over entry points with the same name.
+    """
+
+    def __init__(self, kind, group, entries=None):
+        self.kind = kind
+        self.group = group
+        # name -> reference, entry point or loaded object
+        self._entries = dict(entries or {})
+        self._loaded = {}
+        self._discovered = False
+
+    def _discover(self):
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in _entry_points(self.group):
+            self._entries.setdefault(entry_point.name, entry_point)
+
+    def register(self, name, reference):
+        """Add or replace the entry name: a "module:attribute" reference or the object itself."""
+        self._entries[name] = reference
+        self._loaded.pop(name, None)
+
+    def names(self):
+        """Return the sorted list of names, including entry points."""
+        self._discover()
+        return sorted(self._entries)
+
+    def __contains__(self, name):
+        if name not in self._entries:
+            self._discover()
+        return name in self._entries
+
+    def load(self, name):
+        """Return the object registered as name, importing it on first use.
+
+        Raise RegistryError if name is unknown or can't be imported (e.g. the Aardvark master without aardvark_py installed).
+        """
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        if name not in self:
+            raise RegistryError("unknown %s: %s" % (self.kind, name))
+        reference = self._entries[name]
+        try:
+            if isinstance(reference, str):
+                value = _import(reference)
+            elif hasattr(reference, 'load'):
+                value = reference.load()
+            else:
+                value = reference
+        except (ImportError, AttributeError) as e:
+            raise RegistryError("unable to load %s %s: %s" % (self.kind, name, e))
+        self._loaded[name] = value
+        return value
+
+MASTERS = Registry("master", "bustools.masters", {
+    "aardvark": "bustools.adapters.aardvark:Aardvark",
+    "i2cdev": "bustools.adapters.i2cdev:I2CDev",
+    "remote": "bustools.adapters.remote:RemoteMaster",
+    "simulated": "bustools.adapters.simulated:SimulatedMaster"
+})
+
+DRIVERS = Registry("driver", "bustools.drivers", {
+    "ina219": "bustools.devices.ina219:INA219",
+    "lm75": "bustools.devices.lm75:LM75"
+})
+for _module, _classes in (
+        ("at24xx", ("AT24C01", "AT24C02", "AT24C04", "AT24C08", "AT24C16", "AT24C32", "AT24C64", "AT24C128", "AT24C256", "AT24C512")),
+        ("at25xx", ("AT25010", "AT25020", "AT25040", "AT25080", "AT25160", "AT25320", "AT25640", "AT25128", "AT25256")),
+        ("pca954x", ("PCA9542", "PCA9543", "PCA9544", "PCA9545", "PCA9546", "PCA9548")),
+        ("pca95xx", ("PCA9536", "PCA9554", "PCA9557", "PCA9535", "PCA9555", "PCA9505"))):
+    for _class in _classes:
+        DRIVERS.register(_class.lower(), "bustools.devices.%s:%s" % (_module, _class))
+del _module, _classes, _class
+
+EMULATORS = Registry("emulator", "bustools.emulators", {
+    "ina219": "bustools.emulators.ina219:INA219Emulator",
+    "lm75": "bustools.emulators.lm75:LM75Emulator"
+})
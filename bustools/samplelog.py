@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""Columnar binary sample log
+
+A compact on-disk log of (timestamp, value) samples of a fixed list of
+channels, e.g. the quantities of the devices polled by the daemon.
+Samples are buffered per channel and written in blocks; each block holds
+the samples of one channel as two columns, all the timestamps then all the
+values, as little endian doubles.  A Reader memory maps the file and
+returns the samples of a time range as views of the mapped blocks, without
+copying or parsing.
+
+Layout (little endian):
+
+    header   magic 'BTSL', version (uint32), channel count (uint32), padding
+    names    channel count x 48 byte channel names (NUL padded UTF-8)
+    blocks   channel index (uint32), sample count (uint32),
+             first timestamp (double), last timestamp (double),
+             count x timestamp (double), count x value (double)
+
+A block is only complete once all its bytes are written; a Reader ignores
+a truncated last block (e.g. after a crash), and a Writer appending to the
+log removes it.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+_MAGIC = b'BTSL'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sII4x')
+_NAME_BYTES = 48
+_BLOCK = struct.Struct('<IIdd')
+_DOUBLE_BYTES = 8
+
+DEFAULT_BLOCK_SIZE = 4096
+
+# array.tobytes()/frombytes() were tostring()/fromstring() in Python 2
+_tobytes = getattr(array, 'tobytes', None) or array.tostring
+_frombytes = getattr(array, 'frombytes', None) or array.fromstring
+
+# samples can be viewed in place only if memoryview.cast() exists (Python 3)
+# and doubles are stored in host byte order
+_ZERO_COPY = hasattr(memoryview, 'cast') and sys.byteorder == 'little'
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class SampleLogError(Exception):
+    pass
+
+class Writer(object):
+    """Write samples of the named channels to a new log file at path.
+
+    If append is True and path holds a log of the same channels, the new samples are added to it (after removing a truncated last block, if any); otherwise the file is created or truncated.  Raise SampleLogError when appending to a file that isn't a log of the same channels.
+
+    Samples of each channel are buffered and written as a block once block_size samples are pending, so the file is written in large sequential writes.  If flush_interval is not None, all pending samples are also written by the first append() flush_interval seconds after the last flush, so slow channels reach the file (and survive a crash) within about that time.  Call flush() to write all pending samples, e.g. before another process reads the file.  append() may be called from several threads.
+    """
+
+    def __init__(self, path, channels, block_size=DEFAULT_BLOCK_SIZE, flush_interval=None, append=False):
+        self.path = path
+        self.channels = list(channels)
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self._indexes = {}
+        names = []
+        for index, name in enumerate(self.channels):
+            encoded = name.encode('utf-8')
+            if len(encoded) > _NAME_BYTES:
+                raise SampleLogError("channel name longer than %d bytes: %s" % (_NAME_BYTES, name))
+            if name in self._indexes:
+                raise SampleLogError("duplicate channel name: %s" % name)
+            self._indexes[name] = index
+            names.append(encoded.ljust(_NAME_BYTES, b'\0'))
+
+        # pending (timestamps, values) of each channel
+        self._pending = [(array('d'), array('d')) for name in self.channels]
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+
+        if append and os.path.exists(path) and os.path.getsize(path):
+            reader = Reader(path)
+            try:
+                if reader.channels != self.channels:
+                    raise SampleLogError("%s is a log of other channels: %s" % (path, ", ".join(reader.channels)))
+                end = reader._end
+            finally:
+                reader.close()
+            self._file = open(path, 'r+b')
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(_HEADER.pack(_MAGIC, _VERSION, len(self.channels)))
+            self._file.write(b''.join(names))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def index(self, name):
+        """Return the index of a channel name, for use with append()."""
+        try:
+            return self._indexes[name]
+        except KeyError:
+            raise SampleLogError("unknown channel: %s" % name)
+
+    def append(self, index, timestamp, value):
+        """Add a sample of the channel at index.  Timestamps of a channel must not decrease."""
+        with self._lock:
+            timestamps, values = self._pending[index]
+            timestamps.append(timestamp)
+            values.append(value)
+            if len(timestamps) >= self.block_size:
+                self._write_block(index)
+            if self.flush_interval is not None and time.time() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _write_block(self, index):
+        timestamps, values = self._pending[index]
+        if not timestamps:
+            return
+        first, last = timestamps[0], timestamps[-1]
+        if sys.byteorder != 'little':
+            timestamps.byteswap()
+            values.byteswap()
+        self._file.write(_BLOCK.pack(index, len(timestamps), first, last) + _tobytes(timestamps) + _tobytes(values))
+        self._pending[index] = (array('d'), array('d'))
+
+    def flush(self):
+        """Write the pending samples of all channels."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for index in range(len(self.channels)):
+            self._write_block(index)
+        self._file.flush()
+        self._last_flush = time.time()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+class Reader(object):
+    """Memory mapped view of a sample log.
+
+    The file is indexed when opened; reopen it to see blocks written since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise SampleLogError("%s is not a sample log" % path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._map.close()
+            raise SampleLogError("%s is not a version %d sample log" % (path, _VERSION))
+        self.channels = []
+        offset = _HEADER.size
+        for index in range(count):
+            self.channels.append(self._map[offset:offset + _NAME_BYTES].rstrip(b'\0').decode('utf-8'))
+            offset += _NAME_BYTES
+        self._indexes = dict((name, index) for index, name in enumerate(self.channels))
+
+        # channel index -> list of (data offset, sample count, first timestamp, last timestamp)
+        self._blocks = dict((index, []) for index in range(count))
+        while offset + _BLOCK.size <= size:
+            index, samples, first, last = _BLOCK.unpack_from(self._map, offset)
+            data = offset + _BLOCK.size
+            end = data + 2 * samples * _DOUBLE_BYTES
+            if end > size or index >= count:
+                break
+            self._blocks[index].append((data, samples, first, last))
+            offset = end
+        # end of the last complete block
+        self._end = offset
+
+        # a view of the whole map, for zero-copy slices
+        self._view = memoryview(self._map) if _ZERO_COPY else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is None:
+            return
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            # columns returned by blocks() are still referenced; the mapping
+            # is released with the last of them
+            pass
+        self._map = None
+
+    def _index(self, channel):
+        try:
+            return self._indexes[channel]
+        except KeyError:
+            raise SampleLogError("unknown channel: %s" % channel)
+
+    def _doubles(self, offset, count):
+        """Return count doubles at offset: a memoryview of the map if possible, otherwise an array copy."""
+        if self._view is not None:
+            return self._view[offset:offset + count * _DOUBLE_BYTES].cast('d')
+        doubles = array('d')
+        _frombytes(doubles, self._map[offset:offset + count * _DOUBLE_BYTES])
+        if sys.byteorder != 'little':
+            doubles.byteswap()
+        return doubles
+
+    def count(self, channel):
+        """Return the number of samples of a channel."""
+        return sum(block[1] for block in self._blocks[self._index(channel)])
+
+    def blocks(self, channel, start=None, end=None):
+        """Yield (timestamps, values) column pairs of the samples of a channel with start <= timestamp < end (either bound may be None).
+
+        Each pair covers one block.  On Python 3 the columns are memoryviews of doubles over the mapped file (no copy); they are only valid until the Reader is closed.
+        """
+        for data, samples, first, last in self._blocks[self._index(channel)]:
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            timestamps = self._doubles(data, samples)
+            low = 0 if start is None or first >= start else bisect.bisect_left(timestamps, start)
+            high = samples if end is None or last < end else bisect.bisect_left(timestamps, end)
+            if low < high:
+                yield timestamps[low:high], self._doubles(data + samples * _DOUBLE_BYTES, samples)[low:high]
+
+    def read(self, channel, start=None, end=None):
+        """Return the (timestamps, values) columns of a channel with start <= timestamp < end as two arrays of doubles."""
+        timestamps = array('d')
+        values = array('d')
+        for block_timestamps, block_values in self.blocks(channel, start, end):
+            timestamps.extend(block_timestamps)
+            values.extend(block_values)
+        return timestamps, values
+
+    def arrays(self, channel, start=None, end=None):
+        """Return the (timestamps, values) columns of a channel with start <= timestamp < end as NumPy arrays.
+
+        If the range lies within a single block, the arrays are read-only views of the mapped file.  Raise SampleLogError if NumPy is not installed.
+        """
+        if numpy is None:
+            raise SampleLogError("NumPy is required for arrays()")
+        columns = [(numpy.frombuffer(timestamps, dtype='<f8'), numpy.frombuffer(values, dtype='<f8')) for timestamps, values in self.blocks(channel, start, end)]
+        if not columns:
+            return numpy.empty(0, dtype='<f8'), numpy.empty(0, dtype='<f8')
+        if len(columns) == 1:
+            return columns[0]
+        return numpy.concatenate([c[0] for c in columns]), numpy.concatenate([c[1] for c in columns])
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""Deadline-aware periodic job scheduler
+
+Jobs are functions (typically device reads) released every period seconds
+and due deadline seconds after each release.  Jobs on the same bus run in
+one thread, earliest deadline first; jobs on different buses run in
+parallel threads.  Masters wrapping another master (e.g. a RetryMaster, or
+the channels of a PCA954x multiplexer) are on the bus of the master they
+wrap (see bustools.adapters.root_master()).
+
+The bus cost of a job is estimated from the transactions it issues and its
+bit rate (see bus_time()), so the load on each bus can be
+checked before running (see Scheduler.utilization()).  While running, each
+job records its missed deadlines, execution time and a histogram of its
+release jitter: how late each run started after its release time.
+"""
+
+from __future__ import print_function
+
+import bisect
+import heapq
+import threading
+import time
+
+import bustools.adapters as adapters
+
+# time.perf_counter() is only available in Python 3
+_clock = getattr(time, 'perf_counter', time.time)
+
+# bit rate assumed for masters without i2c_bitrate (e.g. Linux i2c-dev), in kHz
+DEFAULT_BITRATE = 100
+
+# upper edges of the jitter histogram buckets in seconds; the last bucket
+# counts everything above the last edge
+JITTER_BUCKETS = (10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3)
+
+class SchedulerError(Exception):
+    pass
+
+def bus_time(bitrate, transactions, overhead=0.0):
+    """Return the estimated bus time in seconds of a list of (write_bytes, read_bytes) transactions at bitrate kHz.
+
+    Each byte, including the slave address, is 9 bits (8 data bits and an ACK).  A transaction is a start, the address and the written bytes, then, if read_bytes is not 0, a repeated start, the address and the read bytes, then a stop.  overhead is added per transaction for host and adapter latency (e.g. a USB round trip).
+    """
+    bits = 0
+    for write_bytes, read_bytes in transactions:
+        bits += 2 + 9 * (1 + write_bytes)
+        if read_bytes:
+            bits += 1 + 9 * (1 + read_bytes)
+    return bits / (bitrate * 1000.0) + overhead * len(transactions)
+
+def _format_seconds(value):
+    if value < 1e-3:
+        return "%.0fus" % (value * 1e6)
+    if value < 1:
+        return "%.1fms" % (value * 1e3)
+    return "%.2fs" % value
+
+class JobStats(object):
+    """Run statistics of a Job."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # runs completed
+        self.count = 0
+        # runs that finished after their deadline
+        self.missed = 0
+        # releases skipped because the job fell more than a period behind
+        self.skipped = 0
+        # runs that raised an exception
+        self.errors = 0
+        self.last_error = None
+        # release jitter (start - release time)
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self.histogram = [0] * (len(JITTER_BUCKETS) + 1)
+        # execution time (finish - start)
+        self.execution_total = 0.0
+        self.execution_max = 0.0
+
+    def _record(self, jitter, execution, missed):
+        self.count += 1
+        if missed:
+            self.missed += 1
+        self.jitter_total += jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+        self.histogram[bisect.bisect_left(JITTER_BUCKETS, jitter)] += 1
+        self.execution_total += execution
+        if execution > self.execution_max:
+            self.execution_max = execution
+
+    @property
+    def jitter_mean(self):
+        return self.jitter_total / self.count if self.count else 0.0
+
+    @property
+    def execution_mean(self):
+        return self.execution_total / self.count if self.count else 0.0
+
+    def histogram_buckets(self):
+        """Return a list of (upper edge in seconds, count) pairs; the last edge is None (unbounded)."""
+        return list(zip(JITTER_BUCKETS + (None,), self.histogram))
+
+class Job(object):
+    """Periodic job; see Scheduler.add()."""
+
+    def __init__(self, name, function, period, deadline, master, transactions, offset, bitrate):
+        if period <= 0:
+            raise SchedulerError("invalid period for job %s: %s" % (name, period))
+        if deadline <= 0:
+            raise SchedulerError("invalid deadline for job %s: %s" % (name, deadline))
+        self.name = name
+        self.function = function
+        self.period = period
+        self.deadline = deadline
+        self.master = master
+        self.transactions = list(transactions)
+        self.offset = offset
+        # I2C bit rate in kHz the job runs at, None for the master's rate
+        self.bitrate = bitrate
+        # estimated bus time per run in seconds, see Scheduler.estimate_costs()
+        self.cost = 0.0
+        self.stats = JobStats()
+        # next release time, while running
+        self._release = None
+
+class Scheduler(object):
+    """Run periodic jobs earliest deadline first, one thread per bus.
+
+    Scheduling is non-preemptive: a job that is running when a job with an earlier deadline is released finishes first.  Releases are at fixed rate (release n is at offset + n * period from the start of run()), so sampling does not drift; a job that falls more than a period behind skips the releases it missed rather than running back to back to catch up.
+
+    transaction_overhead is the per-transaction host latency in seconds added to bus cost estimates.  Waits longer than spin seconds sleep; the rest is busy-waited, trading CPU for release jitter well below the operating system's sleep resolution.
+
+    If stop_on_error is True an exception raised by a job stops all jobs and is raised again by run(); otherwise it is counted in the job's stats, on_error (if provided) is called with the job and the exception, and the job keeps its schedule.
+    """
+
+    def __init__(self, transaction_overhead=0.0, spin=0.0002, stop_on_error=True, on_error=None):
+        self.transaction_overhead = transaction_overhead
+        self.spin = spin
+        self.stop_on_error = stop_on_error
+        self.on_error = on_error
+        self.jobs = []
+        self._running = False
+        self._error = None
+
+    # --- jobs ---
+
+    def add(self, name, function, period, deadline=None, master=None, transactions=(), offset=0.0, bitrate=None):
+        """Register function to be called every period seconds and return its Job.
+
+        deadline is relative to each release and defaults to the period.  master is the master the job uses; jobs without one share a thread.  transactions is the list of (write_bytes, read_bytes) transactions of one run, for the bus cost estimate.  offset delays the first release.
+
+        bitrate is the I2C bit rate in kHz to run the job at (e.g. the rate found for its device by bustools.tuning.tune()); the master's i2c_bitrate is switched before the job runs if needed.  Jobs without a bitrate run at the rate the master had when run() was called.  Raise SchedulerError if bitrate is given for a master whose bit rate can't be set (e.g. Linux i2c-dev, where it is fixed by the kernel driver).
+        """
+        if bitrate and not hasattr(master, 'i2c_bitrate'):
+            raise SchedulerError("job %s sets a bit rate, but its master's bit rate can't be switched" % name)
+        job = Job(name, function, period, period if deadline is None else deadline, master, transactions, offset, bitrate)
+        job.cost = self._cost(job, self._bitrate(master))
+        self.jobs.append(job)
+        return job
+
+    def remove(self, job):
+        self.jobs.remove(job)
+
+    def masters(self):
+        """Return the list of distinct buses of the jobs, as the root master of each (see bustools.adapters.root_master()), in job order."""
+        masters = []
+        for job in self.jobs:
+            master = adapters.root_master(job.master)
+            if not any(master is other for other in masters):
+                masters.append(master)
+        return masters
+
+    def _jobs(self, master):
+        """Return the jobs on the bus of master."""
+        master = adapters.root_master(master)
+        return [job for job in self.jobs if adapters.root_master(job.master) is master]
+
+    # --- bus cost ---
+
+    def _bitrate(self, master):
+        return getattr(master, 'i2c_bitrate', None) or DEFAULT_BITRATE
+
+    def _cost(self, job, bitrate):
+        return bus_time(job.bitrate or bitrate, job.transactions, self.transaction_overhead)
+
+    def estimate_costs(self):
+        """Update the bus cost estimate of every job from its bit rate or the current bit rate of its master (e.g. after changing either)."""
+        for master in self.masters():
+            bitrate = self._bitrate(master)
+            for job in self._jobs(master):
+                job.cost = self._cost(job, bitrate)
+
+    def utilization(self, master=None):
+        """Return the estimated fraction of the bus time of master used by the jobs on its bus (sum of cost / period), including jobs on masters wrapping it or wrapped by it.
+
+        With deadlines equal to periods, the jobs can meet their deadlines only if this is below 1.
+        """
+        return sum(job.cost / job.period for job in self._jobs(master))
+
+    # --- running ---
+
+    def stop(self):
+        """Stop run() after the jobs currently running finish."""
+        self._running = False
+
+    def run(self, duration=None):
+        """Run the jobs until stop() is called, or for duration seconds."""
+        start = _clock()
+        end = None if duration is None else start + duration
+        self._error = None
+        self._running = True
+        groups = [self._jobs(master) for master in self.masters()]
+        if len(groups) == 1:
+            self._run_group(groups[0], start, end)
+        else:
+            threads = [threading.Thread(target=self._run_group, args=(jobs, start, end)) for jobs in groups]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            try:
+                for thread in threads:
+                    # join with a timeout so KeyboardInterrupt is delivered
+                    while thread.is_alive():
+                        thread.join(0.1)
+            finally:
+                self._running = False
+        self._running = False
+        if self._error is not None:
+            raise self._error
+
+    def _wait(self, until):
+        while True:
+            remaining = until - _clock()
+            if remaining <= 0:
+                return
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+
+    def _run_group(self, jobs, start, end):
+        # (release time, job index, job) of jobs waiting for their release
+        pending = []
+        # (absolute deadline, job index, job) of released jobs
+        ready = []
+        for index, job in enumerate(jobs):
+            job._release = start + job.offset
+            if end is None or job._release < end:
+                pending.append((job._release, index, job))
+        heapq.heapify(pending)
+        # the bit rate is only switched if some job sets its own bit rate
+        if not any(job.bitrate for job in jobs):
+            self._run_jobs(pending, ready, end, None, None)
+            return
+        master = adapters.root_master(jobs[0].master)
+        base_bitrate = master.i2c_bitrate
+        try:
+            self._run_jobs(pending, ready, end, master, base_bitrate)
+        finally:
+            if master.i2c_bitrate != base_bitrate:
+                master.i2c_bitrate = base_bitrate
+
+    def _run_jobs(self, pending, ready, end, master, base_bitrate):
+        """Run released jobs until none are left or stop() is called; if master is not None, switch it to each job's bit rate."""
+        current_bitrate = base_bitrate
+        while self._running and (pending or ready):
+            now = _clock()
+            while pending and pending[0][0] <= now:
+                release, index, job = heapq.heappop(pending)
+                heapq.heappush(ready, (release + job.deadline, index, job))
+            if not ready:
+                self._wait(pending[0][0])
+                continue
+            deadline, index, job = heapq.heappop(ready)
+            if master is not None:
+                bitrate = job.bitrate or base_bitrate
+                if bitrate != current_bitrate:
+                    master.i2c_bitrate = bitrate
+                    current_bitrate = bitrate
+            started = _clock()
+            try:
+                job.function()
+            except Exception as error:
+                job.stats.errors += 1
+                job.stats.last_error = error
+                if self.stop_on_error:
+                    self._error = error
+                    self._running = False
+                    return
+                if self.on_error is not None:
+                    self.on_error(job, error)
+            finished = _clock()
+            job.stats._record(started - job._release, finished - started, finished > deadline)
+            release = job._release + job.period
+            if release + job.period < finished:
+                skipped = int((finished - release) / job.period)
+                job.stats.skipped += skipped
+                release += skipped * job.period
+            job._release = release
+            if end is None or release < end:
+                heapq.heappush(pending, (release, index, job))
+
+    # --- reporting ---
+
+    def report(self):
+        """Return a text table of the statistics of each job, with its jitter histogram."""
+        lines = ["%-24s %8s %8s %6s %6s %6s %8s %8s %8s %8s %6s" % ("job", "period", "cost", "runs", "missed", "skip", "jit avg", "jit max", "exec avg", "exec max", "errors")]
+        for job in self.jobs:
+            stats = job.stats
+            lines.append("%-24s %8s %8s %6d %6d %6d %8s %8s %8s %8s %6d" % (job.name, _format_seconds(job.period), _format_seconds(job.cost), stats.count, stats.missed, stats.skipped, _format_seconds(stats.jitter_mean), _format_seconds(stats.jitter_max), _format_seconds(stats.execution_mean), _format_seconds(stats.execution_max), stats.errors))
+        for job in self.jobs:
+            if not job.stats.count:
+                continue
+            lines.append("")
+            lines.append("%s jitter:" % job.name)
+            for edge, count in job.stats.histogram_buckets():
+                if count:
+                    label = "<= %s" % _format_seconds(edge) if edge is not None else "> %s" % _format_seconds(JITTER_BUCKETS[-1])
+                    lines.append("  %10s %8d %s" % (label, count, "#" * int(round(40.0 * count / job.stats.count))))
+        return "\n".join(lines)
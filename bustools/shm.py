@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""Shared memory publication of the latest readings
+
+A Publisher owns a fixed-layout memory mapped file (normally under
+/dev/shm) holding one slot per channel, e.g. one per device quantity.  Any
+number of local processes can open it with a Reader and take snapshots of
+the latest values without touching the bus or taking a lock.
+
+Layout (little endian):
+
+    header   magic 'BTSM', version (uint32), channel count (uint32), padding
+    slots    channel count x 72 byte slots:
+               sequence (uint32), padding,
+               timestamp (double, seconds since the epoch),
+               value (double),
+               channel name (48 bytes, NUL padded UTF-8)
+
+Each slot is a seqlock: the publisher makes the sequence odd, writes the
+timestamp and value, then makes it even again.  A reader retries if it saw
+an odd sequence or the sequence changed while it was copying the sample, so
+it never returns a torn timestamp/value pair.  A reader gives up after a
+timeout rather than wait forever for a publisher that died mid-update.  Half the sequence is the
+number of times the channel has been published; 0 means never.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+_MAGIC = b'BTSM'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sII4x')
+_SLOT = struct.Struct('<I4xdd48s')
+_SEQUENCE = struct.Struct('<I')
+_SAMPLE = struct.Struct('<dd')
+
+# offsets within a slot
+_SAMPLE_OFFSET = 8
+_NAME_OFFSET = 24
+_NAME_BYTES = 48
+
+_SEQUENCE_MASK = 0xFFFFFFFF
+
+# read attempts busy-waited before a reader starts yielding the CPU between
+# attempts
+_SPIN_ATTEMPTS = 100
+
+DEFAULT_PATH = '/dev/shm/bustools'
+
+class SharedMemoryError(Exception):
+    pass
+
+def _slot_offset(index):
+    return _HEADER.size + index * _SLOT.size
+
+class Publisher(object):
+    """Publish the latest value of each of a fixed list of channel names.
+
+    The segment is built in a temporary file and renamed over path, so readers never see a partly initialized segment.  Readers that still have a previous segment open can detect it with Reader.stale.
+    """
+
+    def __init__(self, channels, path=DEFAULT_PATH):
+        self.path = path
+        self.channels = list(channels)
+        self._indexes = {}
+        for index, name in enumerate(self.channels):
+            if len(name.encode('utf-8')) > _NAME_BYTES:
+                raise SharedMemoryError("channel name longer than %d bytes: %s" % (_NAME_BYTES, name))
+            if name in self._indexes:
+                raise SharedMemoryError("duplicate channel name: %s" % name)
+            self._indexes[name] = index
+
+        # sequence number of each slot, kept here to avoid reading it back
+        self._sequences = [0] * len(self.channels)
+
+        size = _slot_offset(len(self.channels))
+        temporary_path = "%s.%d.tmp" % (path, os.getpid())
+        fd = os.open(temporary_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        for index, name in enumerate(self.channels):
+            _SLOT.pack_into(self._map, _slot_offset(index), 0, 0.0, 0.0, name.encode('utf-8'))
+        _HEADER.pack_into(self._map, 0, _MAGIC, _VERSION, len(self.channels))
+        os.rename(temporary_path, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def index(self, name):
+        """Return the slot index of a channel name, for use with publish()."""
+        try:
+            return self._indexes[name]
+        except KeyError:
+            raise SharedMemoryError("unknown channel: %s" % name)
+
+    def publish(self, index, value, timestamp=None):
+        """Publish the value of the channel at index, timestamped now unless timestamp is provided."""
+        if timestamp is None:
+            timestamp = time.time()
+        offset = _slot_offset(index)
+        sequence = self._sequences[index]
+        _SEQUENCE.pack_into(self._map, offset, (sequence + 1) & _SEQUENCE_MASK)
+        _SAMPLE.pack_into(self._map, offset + _SAMPLE_OFFSET, timestamp, value)
+        sequence = (sequence + 2) & _SEQUENCE_MASK
+        _SEQUENCE.pack_into(self._map, offset, sequence)
+        self._sequences[index] = sequence
+
+    def close(self, unlink=False):
+        """Unmap the segment.  The last values stay readable unless unlink is True."""
+        if self._map is None:
+            return
+        self._map.close()
+        self._map = None
+        if unlink:
+            os.unlink(self.path)
+
+class Reader(object):
+    """Read-only view of a segment created by a Publisher.
+
+    A read that keeps finding a publish in progress for timeout seconds (e.g. the publisher was killed mid-update) raises SharedMemoryError.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, timeout=0.1):
+        self.path = path
+        self.timeout = timeout
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self._inode = os.fstat(fd).st_ino
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._map.close()
+            raise SharedMemoryError("%s is not a version %d bustools segment" % (path, _VERSION))
+        if len(self._map) < _slot_offset(count):
+            self._map.close()
+            raise SharedMemoryError("%s is truncated" % path)
+        self.channels = []
+        self._offsets = {}
+        for index in range(count):
+            offset = _slot_offset(index)
+            name = self._map[offset + _NAME_OFFSET:offset + _NAME_OFFSET + _NAME_BYTES].rstrip(b'\0').decode('utf-8')
+            self.channels.append(name)
+            self._offsets[name] = offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @property
+    def stale(self):
+        """True if the publisher has since replaced the segment at path (reopen to follow it)."""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return True
+
+    def read(self, name):
+        """Return (count, timestamp, value) of the latest value of a channel, where count is the number of times it was published (0: never)."""
+        try:
+            offset = self._offsets[name]
+        except KeyError:
+            raise SharedMemoryError("unknown channel: %s" % name)
+        sequence_unpack = _SEQUENCE.unpack_from
+        sample_unpack = _SAMPLE.unpack_from
+        attempts = 0
+        deadline = None
+        while True:
+            before = sequence_unpack(self._map, offset)[0]
+            if not before & 1:
+                timestamp, value = sample_unpack(self._map, offset + _SAMPLE_OFFSET)
+                if sequence_unpack(self._map, offset)[0] == before:
+                    return before >> 1, timestamp, value
+            # publish in progress: spin briefly, then yield to the publisher
+            attempts += 1
+            if attempts < _SPIN_ATTEMPTS:
+                continue
+            if deadline is None:
+                deadline = time.time() + self.timeout
+            elif time.time() > deadline:
+                if self.stale:
+                    raise SharedMemoryError("%s was replaced by a new publisher while reading %s (reopen it)" % (self.path, name))
+                raise SharedMemoryError("channel %s has been updating for over %ss: the publisher probably died mid-update" % (name, self.timeout))
+            time.sleep(0)
+
+    def snapshot(self):
+        """Return a dictionary of channel name -> (count, timestamp, value) for all channels."""
+        return dict((name, self.read(name)) for name in self.channels)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""EEPROM record store
+
+A small key/value store kept in a serial EEPROM (e.g. the AT24C02 of the
+TP240310 activity board, see bustools.devices.at24xx and at25xx), for
+board data such as calibration constants:
+
+    store = RecordStore(board.i2c_eeprom)
+    ina = INA219(master, 0x40, 0x399F, store.get("U2.shunt_resistance", 0.1), 3.2)
+    store["U2.shunt_resistance"] = 0.0998
+    store.commit()
+
+The whole image is read once, with sequential reads, when the store is
+opened; gets and sets only touch RAM.  commit() serializes the records and
+writes only the EEPROM pages whose bytes changed, one page write each, so
+updating a value rewrites a page or two rather than every record.
+
+Layout (little endian), from the start of the store's region:
+
+    header   magic 'BTKV', version (uint8), padding, data length (uint16),
+             CRC-32 of the data (uint32)
+    data     records: key length (uint8), key (UTF-8), value type (uint8),
+             value length (uint8), value
+
+Value types are bool, int (64 bit signed), float (double), text (UTF-8) and
+bytes.  A region without a valid header (e.g. erased, all 0xFF) is an
+empty store.
+"""
+
+import struct
+import zlib
+from array import array
+
+_MAGIC = b'BTKV'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sBxHI')
+_RECORD = struct.Struct('<BB')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+# value types
+_BOOL = 0
+_INTEGER = 1
+_FLOAT_TYPE = 2
+_TEXT = 3
+_BYTES = 4
+
+# largest key or value in bytes
+_MAX_LENGTH = 255
+
+_text_type = type(u'')
+
+# array.tobytes() was array.tostring() in Python 2
+_tobytes = getattr(array, 'tobytes', None) or array.tostring
+
+class StorageError(Exception):
+    pass
+
+def _encode_value(value):
+    """Return the (value type, bytes) of a value."""
+    if isinstance(value, bool):
+        return _BOOL, b'\x01' if value else b'\x00'
+    if isinstance(value, float):
+        return _FLOAT_TYPE, _FLOAT.pack(value)
+    if isinstance(value, _text_type):
+        return _TEXT, value.encode('utf-8')
+    if isinstance(value, (bytes, bytearray)):
+        return _BYTES, bytes(value)
+    if isinstance(value, array):
+        return _BYTES, _tobytes(value)
+    try:
+        return _INTEGER, _INT.pack(value)
+    except struct.error:
+        raise StorageError("unsupported value: %r" % (value,))
+
+def _decode_value(value_type, data):
+    if value_type == _BOOL:
+        return data != b'\x00'
+    if value_type == _INTEGER:
+        return _INT.unpack(data)[0]
+    if value_type == _FLOAT_TYPE:
+        return _FLOAT.unpack(data)[0]
+    if value_type == _TEXT:
+        return data.decode('utf-8')
+    if value_type == _BYTES:
+        return data
+    raise StorageError("invalid value type: %d" % value_type)
+
+class RecordStore(object):
+    """Key/value records in the size bytes of eeprom starting at offset (by default, all of it).
+
+    eeprom provides size, page_size, read(offset, length) and write(offset, data) (see AT24XX and AT25XX).  Keys are text; records keep their insertion order.
+
+    Raise StorageError if the region holds a store that fails its CRC check (e.g. after a commit interrupted by a power loss), unless discard_corrupt is True: the store is then opened empty and the next commit() overwrites it.
+    """
+
+    def __init__(self, eeprom, offset=0, size=None, discard_corrupt=False):
+        self.eeprom = eeprom
+        self.offset = offset
+        self.size = eeprom.size - offset if size is None else size
+        self.discard_corrupt = discard_corrupt
+        if self.size < _HEADER.size or offset < 0 or offset + self.size > eeprom.size:
+            raise StorageError("invalid store region: offset %d, size %d" % (offset, self.size))
+        # bytes of the region as last read or written
+        self._image = None
+        # key -> (value type, value bytes), in record order
+        self._records = {}
+        self._keys = []
+        self.reload()
+
+    # --- image ---
+
+    def reload(self):
+        """Read the region from the EEPROM and parse it, discarding uncommitted changes."""
+        self._image = bytearray(_tobytes(self.eeprom.read(self.offset, self.size)))
+        self._parse()
+
+    def rollback(self):
+        """Discard uncommitted changes."""
+        self._parse()
+
+    def _parse(self):
+        self._records = {}
+        self._keys = []
+        try:
+            records = self._parse_records()
+        except StorageError:
+            if not self.discard_corrupt:
+                raise
+            return
+        for key, value_type, value in records:
+            self._records[key] = (value_type, value)
+            self._keys.append(key)
+
+    def _parse_records(self):
+        """Return the list of (key, value type, value bytes) records of the image."""
+        magic, version, length, crc = _HEADER.unpack_from(bytes(self._image[:_HEADER.size]))
+        if magic != _MAGIC:
+            return []
+        if version != _VERSION:
+            raise StorageError("unsupported record store version: %d" % version)
+        data = self._image[_HEADER.size:_HEADER.size + length]
+        if len(data) != length or zlib.crc32(bytes(data)) & 0xFFFFFFFF != crc:
+            raise StorageError("record store CRC mismatch")
+        records = []
+        index = 0
+        try:
+            while index < length:
+                key_length = data[index]
+                key = bytes(data[index + 1:index + 1 + key_length]).decode('utf-8')
+                index += 1 + key_length
+                value_type, value_length = _RECORD.unpack_from(bytes(data[index:index + _RECORD.size]))
+                index += _RECORD.size
+                value = bytes(data[index:index + value_length])
+                if len(value) != value_length:
+                    raise StorageError("truncated record: %s" % key)
+                index += value_length
+                records.append((key, value_type, value))
+        except (struct.error, IndexError, UnicodeDecodeError):
+            raise StorageError("corrupt record store")
+        return records
+
+    def _serialize(self):
+        """Return the region image holding the current records."""
+        records = []
+        for key in self._keys:
+            value_type, value = self._records[key]
+            encoded_key = key.encode('utf-8')
+            records.append(struct.pack('<B', len(encoded_key)) + encoded_key + _RECORD.pack(value_type, len(value)) + value)
+        data = b''.join(records)
+        if _HEADER.size + len(data) > self.size:
+            raise StorageError("records need %d bytes, the store holds %d" % (_HEADER.size + len(data), self.size))
+        image = bytearray(self._image)
+        image[:_HEADER.size + len(data)] = _HEADER.pack(_MAGIC, _VERSION, len(data), zlib.crc32(data) & 0xFFFFFFFF) + data
+        return image
+
+    def dirty_pages(self):
+        """Return the list of (offset, length) EEPROM ranges, one per page, that commit() would write."""
+        return self._dirty_ranges(self._serialize())
+
+    def _dirty_ranges(self, image):
+        page_size = self.eeprom.page_size
+        ranges = []
+        index = 0
+        while index < self.size:
+            # page boundaries are absolute EEPROM offsets
+            page_end = min(self.size, ((self.offset + index) // page_size + 1) * page_size - self.offset)
+            changed = [i for i in range(index, page_end) if image[i] != self._image[i]]
+            if changed:
+                ranges.append((self.offset + changed[0], changed[-1] - changed[0] + 1))
+            index = page_end
+        return ranges
+
+    @property
+    def dirty(self):
+        """True if there are changes to commit."""
+        return bool(self.dirty_pages())
+
+    def commit(self):
+        """Write the changed bytes, one page write per changed page, and return the number of page writes.
+
+        The page holding the header is written last, so the CRC only validates the new records once they are all written.  The last write cycle is not waited on (see AT24XX.wait_ready()).
+        """
+        image = self._serialize()
+        ranges = self._dirty_ranges(image)
+        header_end = self.offset + _HEADER.size
+        ranges.sort(key=lambda r: r[0] < header_end)
+        for offset, length in ranges:
+            start = offset - self.offset
+            self.eeprom.write(offset, array('B', bytes(image[start:start + length])))
+            # keep the image in step with the EEPROM in case a later write fails
+            self._image[start:start + length] = image[start:start + length]
+        return len(ranges)
+
+    # --- records ---
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def __getitem__(self, key):
+        try:
+            value_type, value = self._records[key]
+        except KeyError:
+            raise KeyError(key)
+        return _decode_value(value_type, value)
+
+    def get(self, key, default=None):
+        if key not in self._records:
+            return default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        encoded_key = _text_type(key).encode('utf-8')
+        if not encoded_key or len(encoded_key) > _MAX_LENGTH:
+            raise StorageError("invalid key: %r" % (key,))
+        value_type, data = _encode_value(value)
+        if len(data) > _MAX_LENGTH:
+            raise StorageError("value of %s is longer than %d bytes" % (key, _MAX_LENGTH))
+        key = encoded_key.decode('utf-8')
+        if key not in self._records:
+            self._keys.append(key)
+        self._records[key] = (value_type, data)
+
+    def __delitem__(self, key):
+        if key not in self._records:
+            raise KeyError(key)
+        del self._records[key]
+        self._keys.remove(key)
+
+    def clear(self):
+        """Remove all records; commit() then writes an empty store."""
+        self._records = {}
+        self._keys = []
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""I2C bit rate tuning
+
+tune() raises the bit rate of a master step by step and, at each step,
+stress-tests the bus with readback-verified transactions: a register of a
+device on the bus is written and read back, and any mismatch or bus error
+counts as a failure.  The highest rate at which every check passed is the
+highest reliable rate, for the bus as a whole and for each device.
+
+Targets (registers to check) are made with the *_targets() functions.
+Registers that can change device behaviour in ways that matter (e.g.
+configuration and alarm thresholds) are only rewritten with their current
+value, which still exercises a full write and read at the tested rate;
+registers that only scale or invert readings are also written with test
+patterns.  Every register is restored to its original value, at the
+original bit rate, when tuning ends.
+"""
+
+import bustools.devices.ina219 as ina219
+import bustools.devices.lm75 as lm75
+import bustools.devices.pca95xx as pca95xx
+
+# Aardvark I2C master bit rates in kHz (see Aardvark.i2c_bitrate)
+DEFAULT_BITRATES = (100, 200, 300, 400, 500, 600, 700, 800)
+
+class TuningError(Exception):
+    pass
+
+class RegisterTarget(object):
+    """Register checked by writing values and reading them back.
+
+    register is the Register description (see bustools.devices.registers), command overrides its address as the command byte.  Only the bits in mask are compared.  patterns is the list of values written on each check; if None, the register is rewritten with its original value.
+    """
+
+    def __init__(self, master, address, register, mask, patterns=None, command=None, name=None):
+        self.master = master
+        self.address = address
+        self.register = register
+        self.mask = mask
+        self.patterns = patterns
+        self.name = name or "0x%02X %s" % (address, register.name)
+        self._command = register.command if command is None else register.encode_command(command=command)
+        self._command_value = command
+        self._original = None
+
+    def _read(self):
+        return self.register.decode(self.master.i2c_write_read(self.address, self._command, self.register.width))
+
+    def _write(self, value):
+        self.master.i2c_write(self.address, self.register.encode_command(value, command=self._command_value))
+
+    def save(self):
+        self._original = self._read()
+
+    def restore(self):
+        if self._original is not None:
+            self._write(self._original)
+
+    def check(self):
+        """Write and read back each pattern; return True if every value read back matches."""
+        for value in (self.patterns if self.patterns is not None else [self._original]):
+            self._write(value)
+            if (self._read() ^ value) & self.mask:
+                return False
+        return True
+
+def _device_name(device):
+    return device.name or "%s@0x%02X" % (type(device).__name__, device.address)
+
+def ina219_targets(device):
+    """Return the checks for an INA219: the calibration register, with test patterns (bit 0 is read-only)."""
+    return [RegisterTarget(device.master, device.address, ina219._REGISTER_MAP[ina219._CALIBRATION_REGISTER], 0xFFFE, patterns=[0x5554, 0xAAAA, 0xFFFE, 0x0000], name=_device_name(device))]
+
+def lm75_targets(device):
+    """Return the checks for an LM75: the hysteresis and overtemperature shutdown registers, rewritten with their values."""
+    return [RegisterTarget(device.master, device.address, lm75._REGISTER_MAP[register], 0xFF80, name=_device_name(device)) for register in (lm75._HYSTERESIS_REGISTER, lm75._OVERTEMPERATURE_SHUTDOWN_REGISTER)]
+
+def pca95xx_targets(device):
+    """Return the checks for a PCA95xx expander: for each port, the polarity inversion register with test patterns and the configuration register rewritten with its value."""
+    targets = []
+    for port in device.ports:
+        mask = (1 << len(port.pins)) - 1
+        for register_type, patterns in ((pca95xx._POLARITY_REGISTER, [0x55 & mask, 0xAA & mask, mask, 0x00]), (pca95xx._CONFIGURATION_REGISTER, None)):
+            command = pca95xx._command(device._register_offset, port.number, register_type)
+            targets.append(RegisterTarget(device.master, device.address, pca95xx._REGISTER_MAP[register_type], mask, patterns=patterns, command=command, name=_device_name(device)))
+    return targets
+
+class TuningResult(object):
+    """Outcome of tune().
+
+    results maps each target name to a list of (bit rate, checks, failures) per rate tested.  best maps each target name to the highest rate up to which all its checks passed, None if they failed at the lowest rate.  bitrate is the highest reliable rate for the bus: the lowest of the best rates.
+    """
+
+    def __init__(self, original_bitrate):
+        self.original_bitrate = original_bitrate
+        self.results = {}
+        self.best = {}
+
+    def _record(self, name, bitrate, checks, failures):
+        self.results.setdefault(name, []).append((bitrate, checks, failures))
+        self.best.setdefault(name, None)
+        if not failures and all(not result[2] for result in self.results[name]):
+            self.best[name] = bitrate
+
+    @property
+    def bitrate(self):
+        if not self.best or None in self.best.values():
+            return None
+        return min(self.best.values())
+
+def tune(master, targets, bitrates=DEFAULT_BITRATES, iterations=50, apply=True):
+    """Find the highest bit rate at which master reliably accesses the targets and return a TuningResult.
+
+    Each rate in bitrates is tested in increasing order with iterations checks of every target.  A target is no longer tested once it failed at a rate, and tuning stops when no target is left.  If apply is True the master is left at the highest reliable rate for all targets, otherwise at its original rate.
+    """
+    if not targets:
+        raise TuningError("no targets to check")
+    original = master.i2c_bitrate
+    result = TuningResult(original)
+    # targets sharing a name (e.g. the registers of one device) are one device
+    names = []
+    for target in targets:
+        if target.name not in names:
+            names.append(target.name)
+    for target in targets:
+        target.save()
+    remaining = list(names)
+    try:
+        for bitrate in sorted(bitrates):
+            master.i2c_bitrate = bitrate
+            actual = master.i2c_bitrate
+            for name in list(remaining):
+                checks = failures = 0
+                for i in range(iterations):
+                    for target in targets:
+                        if target.name != name:
+                            continue
+                        checks += 1
+                        try:
+                            passed = target.check()
+                        except Exception as error:
+                            passed = False
+                            if getattr(error, 'bus_locked', False) and hasattr(master, 'i2c_free_bus'):
+                                master.i2c_free_bus()
+                        if not passed:
+                            failures += 1
+                result._record(name, actual, checks, failures)
+                if failures:
+                    remaining.remove(name)
+            if not remaining:
+                break
+    finally:
+        master.i2c_bitrate = original
+        for target in targets:
+            target.restore()
+    if apply and result.bitrate is not None:
+        master.i2c_bitrate = result.bitrate
+    return result
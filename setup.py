@@ -45,14 +45,18 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 2',
         'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Topic :: Software Development :: Embedded Systems',
     ],
 
     extras_require = {
-        'aardvark': ['aardvark_py']
+        'aardvark': ['aardvark_py'],
+        'numpy': ['numpy']
     },
 
-    packages = find_packages(),
+    packages = find_packages(exclude=['tests']),
+
+    test_suite = 'tests',
 
     include_package_data = True,
 )
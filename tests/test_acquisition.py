@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from bustools.acquisition import Acquisition, Channel
+from bustools.adapters.retry import RetryMaster
+from bustools.adapters.simulated import SimulatedMaster
+from bustools.devices.pca954x import PCA9548
+
+class ConcurrencyProbe(object):
+    """Channel reads that record how many of them run at the same time."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.005)
+        with self._lock:
+            self.running -= 1
+        return 0.0
+
+class AcquisitionBusTest(unittest.TestCase):
+
+    def acquire(self, masters):
+        probe = ConcurrencyProbe()
+        acquisition = Acquisition([Channel("c%d" % index, master, probe.read) for index, master in enumerate(masters)])
+        with acquisition:
+            for frame in acquisition.frames(count=5):
+                self.assertEqual(len(frame.samples), len(masters))
+        return probe.peak
+
+    def test_mux_channels_are_read_in_turn(self):
+        mux = PCA9548(SimulatedMaster(), 0x70)
+        self.assertEqual(self.acquire([mux.channels[0], mux.channels[1]]), 1)
+
+    def test_wrapped_master_is_read_in_turn(self):
+        bus = SimulatedMaster()
+        self.assertEqual(self.acquire([bus, RetryMaster(bus)]), 1)
+
+    def test_separate_buses_are_read_concurrently(self):
+        self.assertEqual(self.acquire([SimulatedMaster(), SimulatedMaster()]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from array import array
+
+from bustools.adapters.i2cdev import I2CDev, I2CDevError, I2C_M_RD, I2C_RDWR_IOCTL_MAX_MSGS, SimulatedIO
+from bustools.emulators.device import RegisterDevice
+
+class I2CDevTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = RegisterDevice({0: 2, 1: 2}, values={0: 0x1234, 1: 0xABCD})
+        self.io = SimulatedIO({0x40: self.device})
+        self.bus = I2CDev(1, io=self.io)
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_write_read_is_one_combined_ioctl(self):
+        data = self.bus.i2c_write_read(0x40, array('B', [1]), 2)
+        self.assertEqual(data, array('B', [0xAB, 0xCD]))
+        self.assertEqual(self.io.ioctls, [[(0x40, 0, b'\x01'), (0x40, I2C_M_RD, b'\xab\xcd')]])
+
+    def test_write(self):
+        self.bus.i2c_write(0x40, array('B', [0, 0x56, 0x78]))
+        self.assertEqual(self.io.ioctls, [[(0x40, 0, b'\x00\x56\x78')]])
+        self.assertEqual(self.device.read_register(0), 0x5678)
+
+    def test_transfer_packs_messages(self):
+        results = self.bus.i2c_transfer([(0x40, [0], 2), (0x40, [1], 2), (0x40, [0, 0x00, 0x01], 0)])
+        self.assertEqual(results, [array('B', [0x12, 0x34]), array('B', [0xAB, 0xCD]), array('B')])
+        self.assertEqual(self.io.ioctls, [[
+            (0x40, 0, b'\x00'), (0x40, I2C_M_RD, b'\x12\x34'),
+            (0x40, 0, b'\x01'), (0x40, I2C_M_RD, b'\xab\xcd'),
+            (0x40, 0, b'\x00\x00\x01')
+        ]])
+
+    def test_transfer_splits_without_splitting_write_reads(self):
+        count = I2C_RDWR_IOCTL_MAX_MSGS // 2 + 1
+        results = self.bus.i2c_transfer([(0x40, [1], 2)] * count)
+        self.assertEqual(results, [array('B', [0xAB, 0xCD])] * count)
+        self.assertEqual([len(messages) for messages in self.io.ioctls], [I2C_RDWR_IOCTL_MAX_MSGS, 2])
+        for messages in self.io.ioctls:
+            self.assertEqual([flags for address, flags, data in messages], [0, I2C_M_RD] * (len(messages) // 2))
+
+    def test_nack(self):
+        with self.assertRaises(I2CDevError) as context:
+            self.bus.i2c_write(0x41, array('B', [0]))
+        self.assertTrue(context.exception.nack)
+        self.assertFalse(self.bus.i2c_probe(0x41))
+        self.assertTrue(self.bus.i2c_probe(0x40))
+
+if __name__ == '__main__':
+    unittest.main()
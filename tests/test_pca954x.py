@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bustools.adapters.simulated import SimulatedMaster
+from bustools.devices.pca954x import PCA9548
+
+class Upstream(object):
+    """Master without a bit rate, e.g. Linux i2c-dev."""
+
+class ChannelTest(unittest.TestCase):
+
+    def test_bitrate_is_set_on_the_upstream_master(self):
+        bus = SimulatedMaster(bitrate=100)
+        mux = PCA9548(bus, 0x70)
+        mux.channels[3].i2c_bitrate = 400
+        self.assertEqual(bus.i2c_bitrate, 400)
+        self.assertEqual(mux.channels[0].i2c_bitrate, 400)
+        self.assertNotIn('i2c_bitrate', vars(mux.channels[3]))
+
+    def test_no_bitrate_without_upstream_bitrate(self):
+        mux = PCA9548(Upstream(), 0x70)
+        self.assertFalse(hasattr(mux.channels[0], 'i2c_bitrate'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from array import array
+
+from bustools.adapters.i2cdev import I2CDev, SimulatedIO
+from bustools.devices.pca95xx import HIGH, INVERTED, LOW, PCA9554, PCA9555
+from bustools.emulators.device import RegisterDevice
+
+class InputsTest(unittest.TestCase):
+
+    def test_inputs_are_read_in_one_batch(self):
+        io = SimulatedIO({0x20: RegisterDevice(dict((register, 1) for register in range(8)), values={0: 0x12, 1: 0x34})})
+        expander = PCA9555(I2CDev(1, io=io), 0x20)
+        del io.ioctls[:]
+        self.assertEqual(expander.inputs(), [0x12, 0x34])
+        self.assertEqual(len(io.ioctls), 1)
+        self.assertEqual(len(io.ioctls[0]), 4)
+
+if __name__ == '__main__':
+    unittest.main()
+
+class Interrupt(object):
+    """Interrupt line that stays deasserted."""
+
+    asserted = False
+
+class DeferredTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = RegisterDevice(dict((register, 1) for register in range(4)), values={0: 0x01})
+        self.io = SimulatedIO({0x20: self.device})
+        self.expander = PCA9554(I2CDev(1, io=self.io), 0x20)
+        self.expander.interrupt = Interrupt()
+        self.pin = self.expander.ports[0].pins[0]
+
+    def test_polarity_change_drops_inputs_read_in_block(self):
+        self.assertEqual(self.pin.input, HIGH)
+        with self.expander.deferred():
+            self.pin.polarity = INVERTED
+            # read under the old polarity: the write is still pending
+            self.assertEqual(self.pin.input, HIGH)
+            # the device inverts the input once the polarity is written
+            self.device.write(array('B', [0, 0x00]))
+        self.assertEqual(self.pin.input, LOW)
+
+    def test_discarded_block_keeps_cache(self):
+        self.assertEqual(self.pin.input, HIGH)
+        try:
+            with self.expander.deferred():
+                self.pin.polarity = INVERTED
+                raise ValueError
+        except ValueError:
+            pass
+        del self.io.ioctls[:]
+        self.assertEqual(self.pin.input, HIGH)
+        self.assertEqual(self.io.ioctls, [])
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bustools.samplelog import Reader, SampleLogError, Writer
+
+class AppendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, samples, append=True, channels=("a", "b")):
+        with Writer(self.path, channels, append=append) as writer:
+            for timestamp in samples:
+                writer.append(0, timestamp, timestamp * 2)
+
+    def read(self):
+        with Reader(self.path) as reader:
+            return list(reader.read("a")[0])
+
+    def test_append(self):
+        self.write([1.0, 2.0])
+        self.write([3.0])
+        self.assertEqual(self.read(), [1.0, 2.0, 3.0])
+
+    def test_truncate(self):
+        self.write([1.0, 2.0])
+        self.write([3.0], append=False)
+        self.assertEqual(self.read(), [3.0])
+
+    def test_append_drops_truncated_block(self):
+        self.write([1.0])
+        self.write([2.0, 3.0])
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.write([4.0])
+        self.assertEqual(self.read(), [1.0, 4.0])
+
+    def test_append_to_other_channels(self):
+        self.write([1.0])
+        self.assertRaises(SampleLogError, self.write, [2.0], channels=("a",))
+        self.assertEqual(self.read(), [1.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from bustools.adapters.retry import RetryMaster
+from bustools.adapters.simulated import SimulatedMaster
+from bustools.devices.pca954x import PCA9548
+from bustools.scheduler import Scheduler
+
+class ConcurrencyProbe(object):
+    """Job functions that record how many of them run at the same time."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def job(self):
+        with self._lock:
+            self.running += 1
+            self.runs += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.005)
+        with self._lock:
+            self.running -= 1
+
+class SchedulerBusTest(unittest.TestCase):
+
+    def run_jobs(self, masters):
+        probe = ConcurrencyProbe()
+        scheduler = Scheduler()
+        for index, master in enumerate(masters):
+            scheduler.add("job%d" % index, probe.job, 0.01, master=master)
+        scheduler.run(0.1)
+        return scheduler, probe
+
+    def test_mux_channels_share_a_thread(self):
+        bus = SimulatedMaster()
+        mux = PCA9548(bus, 0x70)
+        scheduler, probe = self.run_jobs([mux.channels[0], mux.channels[1]])
+        self.assertEqual(scheduler.masters(), [bus])
+        self.assertGreater(probe.runs, 2)
+        self.assertEqual(probe.peak, 1)
+
+    def test_wrapped_master_shares_a_thread(self):
+        bus = SimulatedMaster()
+        scheduler, probe = self.run_jobs([RetryMaster(bus), bus])
+        self.assertEqual(scheduler.masters(), [bus])
+        self.assertEqual(probe.peak, 1)
+
+    def test_separate_buses_run_in_parallel(self):
+        scheduler, probe = self.run_jobs([SimulatedMaster(), SimulatedMaster()])
+        self.assertEqual(len(scheduler.masters()), 2)
+        self.assertEqual(probe.peak, 2)
+
+    def test_utilization_is_per_bus(self):
+        bus = SimulatedMaster()
+        mux = PCA9548(bus, 0x70)
+        scheduler = Scheduler()
+        scheduler.add("a", lambda: None, 0.01, master=mux.channels[0], transactions=[(1, 2)])
+        scheduler.add("b", lambda: None, 0.01, master=mux.channels[1], transactions=[(1, 2)])
+        expected = sum(job.cost / job.period for job in scheduler.jobs)
+        self.assertAlmostEqual(scheduler.utilization(bus), expected)
+        self.assertAlmostEqual(scheduler.utilization(mux.channels[0]), expected)
+
+if __name__ == '__main__':
+    unittest.main()